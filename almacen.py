@@ -0,0 +1,183 @@
+"""
+Almacén columnar de velas.
+
+Cada serie se guarda en un directorio 'data/{cambio}/' con un fichero binario por columna
+('{columna}.bin', little-endian) y un 'meta.json' con el tipo de cada columna y el número de
+filas. La columna 'date' se guarda como int64 (nanosegundos UTC) y ordenada, de modo que los
+rangos de fechas se resuelven con búsqueda binaria y solo se mapean las columnas pedidas.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentacion import log
+
+
+def ruta_almacen(cambio, carpeta='data'):
+    return os.path.join(carpeta, cambio)
+
+
+def existe_almacen(cambio, carpeta='data'):
+    return os.path.exists(os.path.join(ruta_almacen(cambio, carpeta), 'meta.json'))
+
+
+def leer_meta(ruta):
+    with open(os.path.join(ruta, 'meta.json')) as f:
+        return json.load(f)
+
+
+def escribir_meta(ruta, meta):
+    with open(os.path.join(ruta, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def columnas_a_arrays(df):
+    arrays = {}
+    for col in df.columns:
+        if col == 'date':
+            fechas = pd.to_datetime(df['date'])
+            if fechas.dt.tz is not None:
+                fechas = fechas.dt.tz_convert('UTC').dt.tz_localize(None)
+            arrays[col] = fechas.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        elif pd.api.types.is_bool_dtype(df[col]) or pd.api.types.is_numeric_dtype(df[col]):
+            arrays[col] = df[col].to_numpy()
+        else:
+            # Columnas de texto (ej: resultados de add_trade_outcome) como unicode de ancho fijo
+            arrays[col] = df[col].to_numpy().astype(str)
+    return arrays
+
+
+def guardar_almacen(df, cambio, carpeta='data'):
+    """
+    Guarda un DataFrame de velas en el almacén columnar, sustituyendo el que hubiera.
+
+    Args:
+        df (pd.DataFrame): Datos con columna 'date'.
+        cambio (str): Nombre de la serie (ej: 'BTCUSDT').
+        carpeta (str): Carpeta base del almacén.
+
+    Returns:
+        str: Ruta del directorio del almacén.
+    """
+    ruta = ruta_almacen(cambio, carpeta)
+    os.makedirs(ruta, exist_ok=True)
+
+    df = df.sort_values('date') if 'date' in df.columns else df
+    arrays = columnas_a_arrays(df)
+
+    meta = {'filas': len(df), 'columnas': {}}
+    for col, valores in arrays.items():
+        valores = np.ascontiguousarray(valores, dtype=valores.dtype.newbyteorder('<'))
+        valores.tofile(os.path.join(ruta, f'{col}.bin'))
+        meta['columnas'][col] = valores.dtype.str
+    escribir_meta(ruta, meta)
+
+    log(f"✅ Almacén guardado en {ruta} ({len(df)} filas, {len(arrays)} columnas)")
+    return ruta
+
+
+def anexar_almacen(df, cambio, carpeta='data'):
+    """
+    Añade filas al final del almacén sin reescribir lo ya guardado.
+
+    Las filas deben ser posteriores a las existentes y tener las mismas columnas.
+    Si el almacén no existe, se crea.
+    """
+    ruta = ruta_almacen(cambio, carpeta)
+    if not existe_almacen(cambio, carpeta):
+        return guardar_almacen(df, cambio, carpeta)
+
+    meta = leer_meta(ruta)
+    if set(df.columns) != set(meta['columnas']):
+        raise ValueError(f"Las columnas no coinciden con el almacén {ruta}: {sorted(meta['columnas'])}")
+
+    arrays = columnas_a_arrays(df)
+    for col, dtype in meta['columnas'].items():
+        if arrays[col].dtype.kind == 'U' and arrays[col].dtype.itemsize > np.dtype(dtype).itemsize:
+            # Textos más largos que los guardados: se ensancha la columna para no recortarlos
+            dtype = arrays[col].dtype.newbyteorder('<').str
+            guardados = abrir_columna(ruta, col, meta['columnas'][col], meta['filas'])
+            np.ascontiguousarray(guardados, dtype=dtype).tofile(os.path.join(ruta, f'{col}.bin'))
+            del guardados
+            meta['columnas'][col] = dtype
+        valores = np.ascontiguousarray(arrays[col], dtype=np.dtype(dtype))
+        with open(os.path.join(ruta, f'{col}.bin'), 'ab') as f:
+            f.write(valores.tobytes())
+    meta['filas'] += len(df)
+    escribir_meta(ruta, meta)
+
+    return ruta
+
+
+def recortar_almacen(cambio, filas, carpeta='data'):
+    """Elimina las últimas 'filas' filas del almacén (ej: una vela incompleta que se va a rehacer)."""
+    ruta = ruta_almacen(cambio, carpeta)
+    meta = leer_meta(ruta)
+    filas = min(filas, meta['filas'])
+    meta['filas'] -= filas
+    for col, dtype in meta['columnas'].items():
+        with open(os.path.join(ruta, f'{col}.bin'), 'r+b') as f:
+            f.truncate(meta['filas'] * np.dtype(dtype).itemsize)
+    escribir_meta(ruta, meta)
+
+
+def abrir_columna(ruta, col, dtype, filas):
+    if filas == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(os.path.join(ruta, f'{col}.bin'), dtype=dtype, mode='r', shape=(filas,))
+
+
+def cargar_almacen(cambio, columnas=None, desde=None, hasta=None, carpeta='data', como_arrays=False):
+    """
+    Carga columnas y rango de fechas del almacén mapeando los ficheros en memoria.
+
+    Args:
+        cambio (str): Nombre de la serie.
+        columnas (list): Columnas a cargar (por defecto todas). 'date' se carga siempre.
+        desde, hasta: Fechas límite [desde, hasta) aplicadas por búsqueda binaria sobre 'date'.
+        carpeta (str): Carpeta base del almacén.
+        como_arrays (bool): Si True, devuelve un dict de arrays de solo lectura sin copiar.
+
+    Returns:
+        pd.DataFrame (o dict de np.ndarray si como_arrays=True).
+    """
+    ruta = ruta_almacen(cambio, carpeta)
+    meta = leer_meta(ruta)
+    tipos = meta['columnas']
+
+    if columnas is None:
+        columnas = list(tipos)
+    faltan = [col for col in columnas if col not in tipos]
+    if faltan:
+        raise ValueError(f"Columnas no disponibles en {ruta}: {faltan}")
+    if 'date' in tipos and 'date' not in columnas:
+        columnas = ['date'] + list(columnas)
+
+    inicio, fin = 0, meta['filas']
+    if 'date' in tipos and (desde is not None or hasta is not None):
+        fechas = abrir_columna(ruta, 'date', tipos['date'], meta['filas'])
+        if desde is not None:
+            inicio = int(np.searchsorted(fechas, pd.Timestamp(desde).value, side='left'))
+        if hasta is not None:
+            fin = int(np.searchsorted(fechas, pd.Timestamp(hasta).value, side='left'))
+        fin = max(fin, inicio)
+
+    arrays = {col: abrir_columna(ruta, col, tipos[col], meta['filas'])[inicio:fin] for col in columnas}
+
+    if como_arrays:
+        return arrays
+
+    df = pd.DataFrame({col: valores for col, valores in arrays.items() if col != 'date'})
+    if 'date' in arrays:
+        df.insert(0, 'date', arrays['date'].view('datetime64[ns]'))
+    return df[columnas]
+
+
+def convertir_csv_almacen(cambio, carpeta='data'):
+    """Convierte 'data/{cambio}.csv' al almacén columnar."""
+    df = pd.read_csv(os.path.join(carpeta, f'{cambio}.csv'))
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d %H:%M:%S+00:00')
+    return guardar_almacen(df, cambio, carpeta)
@@ -1,122 +1,363 @@
-def backtesting(df_pred, capital_inicial=100, take_profit=3, stop_loss=1):
+import numpy as np
+import pandas as pd
 
+from almacen import cargar_almacen, columnas_a_arrays, existe_almacen
+from instrumentacion import log
+from metricas import metricas_backtest
+
+
+def primera_salida(highs, lows, inicio, value_take_profit, value_stop_loss, bloque=64):
+    """
+    Devuelve el índice de la primera vela desde 'inicio' que toca el stop loss o el take profit.
+
+    Busca en bloques de tamaño creciente (1x, 2x, 4x...) para no recorrer más velas de las
+    necesarias en operaciones cortas ni hacer muchas llamadas en operaciones largas.
+
+    Returns:
+        int: Índice de la vela de salida, o -1 si no se toca ninguna barrera.
+    """
+    n = len(highs)
+    while inicio < n:
+        fin = min(inicio + bloque, n)
+        toca = (lows[inicio:fin] <= value_stop_loss) | (highs[inicio:fin] >= value_take_profit)
+        if toca.any():
+            return inicio + int(toca.argmax())
+        inicio = fin
+        bloque *= 2
+    return -1
+
+
+# Velas de 1 minuto abiertas con mmap por cada proceso, por (carpeta, cambio)
+VELAS_1M = {}
+
+RESOLUCIONES_INTRABAR = ('sl', 'tp', '1m')
+
+
+def crear_ejecucion(comision_maker_bps=0.0, comision_taker_bps=0.0, deslizamiento_bps=0.0,
+                    salida_en_barrera=False, intrabar='sl', cambio_1m='btcusd_1m', carpeta='data',
+                    duracion_vela=None):
+    """
+    Modelo de ejecución del backtesting.
+
+    La entrada (a mercado), el stop loss y el cierre final pagan comisión taker y deslizamiento;
+    el take profit es una orden límite y paga comisión maker sin deslizamiento. Los valores por
+    defecto reproducen la ejecución ideal: sin costes, salida al high/low de la vela y, si una
+    vela toca las dos barreras, se asume el stop loss.
+
+    Args:
+        comision_maker_bps (float): Comisión de las órdenes límite (take profit), en puntos básicos.
+        comision_taker_bps (float): Comisión de las órdenes a mercado, en puntos básicos.
+        deslizamiento_bps (float): Deslizamiento en contra en las órdenes a mercado, en puntos básicos.
+        salida_en_barrera (bool): Si True, las salidas se llenan al precio de la barrera (o al
+                                  'open' de la vela si abre más allá) en vez de al high/low.
+        intrabar (str): Vela que toca las dos barreras: 'sl' (stop loss primero), 'tp' (take
+                        profit primero) o '1m' (se mira en las velas de 1 minuto qué se tocó antes).
+        cambio_1m (str): Almacén con las velas de 1 minuto (ver cleanscripts/cleanBTC.py).
+        carpeta (str): Carpeta base del almacén.
+        duracion_vela: Duración de cada vela (ej. '10min'); por defecto se deduce de las fechas.
+
+    Returns:
+        dict: Modelo de ejecución para backtesting, simular_operaciones y resolver_operacion.
+    """
+    if intrabar not in RESOLUCIONES_INTRABAR:
+        raise ValueError(f"Resolución intrabar '{intrabar}' no válida. Usa una de {RESOLUCIONES_INTRABAR}.")
+
+    return {
+        'comision_maker': comision_maker_bps / 10000,
+        'comision_taker': comision_taker_bps / 10000,
+        'deslizamiento': deslizamiento_bps / 10000,
+        'salida_en_barrera': salida_en_barrera,
+        'intrabar': intrabar,
+        'cambio_1m': cambio_1m,
+        'carpeta': carpeta,
+        'duracion_vela': None if duracion_vela is None else pd.Timedelta(duracion_vela).value,
+    }
+
+
+EJECUCION_IDEAL = crear_ejecucion()
+
+
+def velas_1m(ejecucion):
+    """Columnas date/high/low del almacén de 1 minuto, mapeadas una sola vez por proceso."""
+    clave = (ejecucion['carpeta'], ejecucion['cambio_1m'])
+    if clave not in VELAS_1M:
+        if not existe_almacen(ejecucion['cambio_1m'], ejecucion['carpeta']):
+            raise ValueError(f"No existe el almacén de 1 minuto '{ejecucion['cambio_1m']}'; "
+                             f"créalo con cleanscripts/cleanBTC.py")
+        VELAS_1M[clave] = cargar_almacen(ejecucion['cambio_1m'], columnas=['high', 'low'],
+                                         carpeta=ejecucion['carpeta'], como_arrays=True)
+    return VELAS_1M[clave]
+
+
+def stop_loss_primero(ejecucion, fecha_vela, value_take_profit, value_stop_loss):
+    """
+    Decide si en una vela que toca las dos barreras se tocó antes el stop loss.
+
+    Con intrabar='1m' se buscan por búsqueda binaria los minutos de la vela y se toma el primero
+    que toca alguna barrera. Si faltan minutos o el minuto también toca las dos, se asume el stop loss.
+    """
+    if ejecucion['intrabar'] != '1m':
+        return ejecucion['intrabar'] == 'sl'
+
+    minutos = velas_1m(ejecucion)
+    inicio = np.searchsorted(minutos['date'], fecha_vela, side='left')
+    fin = np.searchsorted(minutos['date'], fecha_vela + ejecucion['duracion_vela'], side='left')
+    toca = (minutos['low'][inicio:fin] <= value_stop_loss) | (minutos['high'][inicio:fin] >= value_take_profit)
+    if not toca.any():
+        return True
+    return bool(minutos['low'][inicio + int(toca.argmax())] <= value_stop_loss)
+
+
+def resolver_operacion(opens, highs, lows, closes, indice, take_profit=3, stop_loss=1, ejecucion=None,
+                       fechas=None):
+    """
+    Resultado de la operación abierta por la señal de la vela 'indice' (ver simular_operaciones).
+
+    Args:
+        ejecucion (dict): Modelo de crear_ejecucion (por defecto, la ejecución ideal).
+        fechas (np.ndarray): Inicio de cada vela en int64 ns (solo necesario con intrabar='1m').
+
+    Returns:
+        tuple: (vela de salida, precio de entrada, precio de salida, exit_reason, gain)
+    """
+    ejecucion = ejecucion or EJECUCION_IDEAL
+    deslizamiento = ejecucion['deslizamiento']
+
+    n = len(opens)
+    entry_price = opens[indice + 1] * (1 + deslizamiento)
+    value_take_profit = entry_price * (1 + take_profit / 100)
+    value_stop_loss = entry_price * (1 - stop_loss / 100)
+
+    salida = primera_salida(highs, lows, indice + 1, value_take_profit, value_stop_loss)
+
+    if salida < 0:
+        # Si llegamos al final con posición abierta, la cerramos con el precio de cierre final
+        salida = n - 1
+        exit_price = closes[salida] * (1 - deslizamiento)
+        reason = 'End'
+        comision_salida = ejecucion['comision_taker']
+    else:
+        toca_sl = lows[salida] <= value_stop_loss
+        if toca_sl and highs[salida] >= value_take_profit:
+            toca_sl = stop_loss_primero(ejecucion, fechas[salida], value_take_profit, value_stop_loss)
+
+        if toca_sl:
+            exit_price = min(value_stop_loss, opens[salida]) if ejecucion['salida_en_barrera'] else lows[salida]
+            exit_price = exit_price * (1 - deslizamiento)
+            reason = 'SL'
+            comision_salida = ejecucion['comision_taker']
+        else:
+            exit_price = max(value_take_profit, opens[salida]) if ejecucion['salida_en_barrera'] else highs[salida]
+            reason = 'TP'
+            comision_salida = ejecucion['comision_maker']
+
+    # Rentabilidad neta de comisiones sobre lo pagado al entrar
+    coste_entrada = entry_price * (1 + ejecucion['comision_taker'])
+    gain = (exit_price * (1 - comision_salida) - coste_entrada) / coste_entrada
+
+    return salida, entry_price, exit_price, reason, gain
+
+
+def simular_operaciones(opens, highs, lows, closes, senales, take_profit=3, stop_loss=1, ejecucion=None,
+                        fechas=None):
+    """
+    Núcleo del backtesting sobre arrays: solo visita las señales y las salidas.
+
+    Una señal en la vela i abre posición al 'open' de la vela i+1 si no hay otra abierta; desde
+    la vela i+1 se comprueba primero el stop loss y luego el take profit. La vela en la que se
+    cierra una posición no puede abrir otra.
+
+    Args:
+        opens, highs, lows, closes (np.ndarray): Precios de cada vela.
+        senales (np.ndarray bool): Predicción del modelo para cada vela.
+        take_profit (float): Porcentaje de take profit.
+        stop_loss (float): Porcentaje de stop loss.
+        ejecucion (dict): Modelo de crear_ejecucion (por defecto, la ejecución ideal).
+        fechas (np.ndarray): Inicio de cada vela en int64 ns (solo necesario con intrabar='1m').
+
+    Returns:
+        dict: Registro de operaciones con arrays 'entry_idx' (vela de la señal), 'exit_idx',
+              'entry_price', 'exit_price', 'exit_reason' y 'gains'.
+    """
+    n = len(opens)
+    candidatas = np.flatnonzero(np.asarray(senales, dtype=bool)[:max(n - 1, 0)])
+
+    entry_idx, exit_idx, entry_prices, exit_prices, exit_reasons, gains = [], [], [], [], [], []
+
+    k = 0
+    while k < len(candidatas):
+        indice = candidatas[k]
+        salida, entry_price, exit_price, reason, gain = resolver_operacion(
+            opens, highs, lows, closes, indice, take_profit, stop_loss, ejecucion, fechas)
+
+        entry_idx.append(indice)
+        exit_idx.append(salida)
+        entry_prices.append(entry_price)
+        exit_prices.append(exit_price)
+        exit_reasons.append(reason)
+        gains.append(gain)
+
+        # La siguiente posición solo puede abrirse a partir de la vela posterior a la salida
+        k = np.searchsorted(candidatas, salida + 1)
+
+    return {
+        'entry_idx': np.array(entry_idx, dtype=np.int64),
+        'exit_idx': np.array(exit_idx, dtype=np.int64),
+        'entry_price': np.array(entry_prices, dtype=float),
+        'exit_price': np.array(exit_prices, dtype=float),
+        'exit_reason': np.array(exit_reasons, dtype=object),
+        'gains': np.array(gains, dtype=float),
+    }
+
+
+def preparar_ejecucion(ejecucion, fechas):
+    """Completa la duración de vela de un modelo de ejecución con la mediana entre fechas (int64 ns)."""
+    ejecucion = ejecucion or EJECUCION_IDEAL
+    if ejecucion['intrabar'] == '1m' and ejecucion['duracion_vela'] is None:
+        if len(fechas) < 2:
+            raise ValueError("No se puede deducir la duración de las velas; indica duracion_vela.")
+        ejecucion = dict(ejecucion, duracion_vela=int(np.median(np.diff(fechas))))
+    return ejecucion
+
+def backtesting(df_pred, capital_inicial=100, take_profit=3, stop_loss=1, return_ledger=False, ejecucion=None):
+    """
+    Simula la estrategia sobre las predicciones del modelo.
+
+    Args:
+        df_pred (pd.DataFrame): Predicciones con columnas 'date', 'open', 'high', 'low', 'close'
+                                y 'model_pred'.
+        capital_inicial (float): Capital con el que se empieza.
+        take_profit (float): Porcentaje de take profit.
+        stop_loss (float): Porcentaje de stop loss.
+        return_ledger (bool): Si True, devuelve también el registro de operaciones.
+        ejecucion (dict): Comisiones, deslizamiento y resolución intrabar (ver crear_ejecucion).
+
+    Returns:
+        pd.DataFrame con 'open_position', 'gains', 'entry_price', 'exit_price', 'exit_reason'
+        y 'disponible' por vela.
+        Si return_ledger=True, también un DataFrame con una fila por operación.
+    """
     df_completo = df_pred.copy()
 
     # Ordenamos por la columna date para asegurar secuencia temporal
     df_completo.sort_values('date', inplace=True)
     df_completo.reset_index(drop=True, inplace=True)  # Reset índice para evitar confusiones
 
-    # Inicializamos columnas para control de posición y resultados
-    df_completo['open_position'] = False
-    df_completo['gains'] = 0.0
-    df_completo['entry_price'] = None
-    df_completo['exit_price'] = None
-    df_completo['exit_reason'] = None
-
-    open_position = False
-    entry_price, value_take_profit, value_stop_loss = 0.0, 0.0, 0.0
-
-    # Iteramos por índice posicional para controlar fila y poder acceder a la siguiente
-    for indice in range(len(df_completo)):
-
-        # Si no hay posición abierta y modelo indica oportunidad
-        if not open_position and df_completo.loc[indice, 'model_pred']:
-            # Abrimos posición sólo si no estamos en la última fila
-            if indice + 1 < len(df_completo):
-                entry_price = df_completo.loc[indice + 1, "open"]
-                value_take_profit = entry_price * (1 + take_profit / 100)
-                value_stop_loss = entry_price * (1 - stop_loss / 100)
-
-                df_completo.loc[indice, 'open_position'] = True
-                df_completo.loc[indice, 'entry_price'] = entry_price
-                open_position = True
-
-        elif open_position:
-            # Evaluamos si stop loss o take profit han sido alcanzados
-            low_price = df_completo.loc[indice, 'low']
-            high_price = df_completo.loc[indice, 'high']
-
-            if low_price <= value_stop_loss:
-                # Stop loss alcanzado: calculamos pérdida
-                df_completo.loc[indice, 'gains'] = (low_price - entry_price) / entry_price
-                df_completo.loc[indice, 'exit_price'] = low_price
-                df_completo.loc[indice, 'exit_reason'] = 'SL'
-                df_completo.loc[indice, 'open_position'] = False
-
-                entry_price, value_take_profit, value_stop_loss = 0.0, 0.0, 0.0
-                open_position = False
-
-            elif high_price >= value_take_profit:
-                # Take profit alcanzado: calculamos ganancia
-                df_completo.loc[indice, 'gains'] = (high_price - entry_price) / entry_price
-                df_completo.loc[indice, 'exit_price'] = high_price
-                df_completo.loc[indice, 'exit_reason'] = 'TP'
-                df_completo.loc[indice, 'open_position'] = False
-
-                entry_price, value_take_profit, value_stop_loss = 0.0, 0.0, 0.0
-                open_position = False
-
-            else:
-                # No se cierra posición, se mantiene abierta
-                df_completo.loc[indice, 'open_position'] = True
-
-    # Si llegamos al final con posición abierta, la cerramos con el precio de cierre final
-    if open_position:
-        ultimo_indice = len(df_completo) - 1
-        close_price = df_completo.loc[ultimo_indice, 'close']
-        df_completo.loc[ultimo_indice, 'gains'] = (close_price - entry_price) / entry_price * 100
-        df_completo.loc[ultimo_indice, 'exit_price'] = close_price
-        df_completo.loc[ultimo_indice, 'exit_reason'] = 'End'
-        df_completo.loc[ultimo_indice, 'open_position'] = False
-
-    
-
-    # Calculo de capital para cada caso. 
-    df_completo['disponible'] = None
-
-    for indice in range(len(df_completo)):
-        if indice == 0:
-            df_completo.loc[indice, 'disponible'] = capital_inicial
-        else:
-            df_completo.loc[indice, 'disponible'] = (
-                1 + df_completo.loc[indice, 'gains']
-            ) * df_completo.loc[indice - 1, 'disponible']
+    n = len(df_completo)
+    fechas = columnas_a_arrays(df_completo[['date']])['date']
+    ejecucion = preparar_ejecucion(ejecucion, fechas)
+    ledger = simular_operaciones(
+        df_completo['open'].to_numpy(dtype=float),
+        df_completo['high'].to_numpy(dtype=float),
+        df_completo['low'].to_numpy(dtype=float),
+        df_completo['close'].to_numpy(dtype=float),
+        df_completo['model_pred'].to_numpy(dtype=bool),
+        take_profit=take_profit,
+        stop_loss=stop_loss,
+        ejecucion=ejecucion,
+        fechas=fechas,
+    )
+    entradas, salidas = ledger['entry_idx'], ledger['exit_idx']
+
+    # Posición abierta desde la vela de la señal hasta la anterior a la salida
+    marcas = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(marcas, entradas, 1)
+    np.add.at(marcas, salidas, -1)
+    df_completo['open_position'] = np.cumsum(marcas[:n]) > 0
+
+    gains = np.zeros(n)
+    gains[salidas] = ledger['gains']
+    df_completo['gains'] = gains
+
+    entry_price = np.full(n, np.nan)
+    entry_price[entradas] = ledger['entry_price']
+    df_completo['entry_price'] = entry_price
+
+    exit_price = np.full(n, np.nan)
+    exit_price[salidas] = ledger['exit_price']
+    df_completo['exit_price'] = exit_price
 
+    exit_reason = np.full(n, None, dtype=object)
+    exit_reason[salidas] = ledger['exit_reason']
+    df_completo['exit_reason'] = exit_reason
+
+    # Calculo de capital para cada caso: producto acumulado de (1 + gains) desde el capital inicial
+    factores = 1 + gains
+    if n:
+        factores[0] = capital_inicial
+    df_completo['disponible'] = np.cumprod(factores)
+
+    if return_ledger:
+        operaciones = pd.DataFrame(ledger)
+        operaciones['entry_date'] = df_completo['date'].to_numpy()[entradas]
+        operaciones['exit_date'] = df_completo['date'].to_numpy()[salidas]
+        return df_completo, operaciones
 
     return df_completo
 
-def back_testing_resume(df):
-    capital_inicial = df['disponible'].iloc[0]
-    capital_final = df['disponible'].iloc[-1]
+def back_testing_resume(df, operaciones=None, verbose=True):
+    """
+    Resumen del backtesting con las métricas de riesgo de metricas.py.
+
+    Args:
+        df (pd.DataFrame): Resultado de backtesting().
+        operaciones (pd.DataFrame): Ledger de backtesting(return_ledger=True) (opcional).
+        verbose (bool): Si True, imprime el resumen.
+
+    Returns:
+        dict: Métricas de metricas.metricas_backtest (ver metricas.guardar_metricas para JSON).
+    """
+    metricas = metricas_backtest(df, operaciones)
+    if not verbose:
+        return metricas
+
+    capital_inicial = metricas['capital_inicial']
+    capital_final = metricas['capital_final']
     diferencia = capital_final - capital_inicial
-    diferencia_pct = (diferencia / capital_inicial) * 100
 
-    print("----- Resumen Backtesting -----")
-    print(f"Capital inicial: {capital_inicial:.2f}")
-    print(f"Capital final: {capital_final:.2f}")
-    print(f"Diferencia: {diferencia:.2f}")
-    print(f"Diferencia porcentual: {diferencia_pct:.2f}%")
+    log("----- Resumen Backtesting -----")
+    log(f"Capital inicial: {capital_inicial:.2f}")
+    log(f"Capital final: {capital_final:.2f}")
+    log(f"Diferencia: {diferencia:.2f}")
+    log(f"Diferencia porcentual: {metricas['rentabilidad'] * 100:.2f}%")
 
-    print("----- Fechas -----")
+    log("----- Fechas -----")
     periodo_dias = (df['date'].max() - df['date'].min()).days or 1
-    print(f"Periodo: desde {df['date'].min().date()} hasta {df['date'].max().date()} ({periodo_dias} días, {periodo_dias // 30} meses, {periodo_dias // 365} años)")
+    log(f"Periodo: desde {df['date'].min().date()} hasta {df['date'].max().date()} ({periodo_dias} días, {periodo_dias // 30} meses, {periodo_dias // 365} años)")
     media_ganancia_diaria = df['gains'].sum() / periodo_dias * 100
     media_ganancia_anual = media_ganancia_diaria * 365
-    print(f"Media de ganancia diaria: {media_ganancia_diaria:.6f}%")
-    print(f"Media de ganancia anual: {media_ganancia_anual:.6f}%")
+    log(f"Media de ganancia diaria: {media_ganancia_diaria:.6f}%")
+    log(f"Media de ganancia anual: {media_ganancia_anual:.6f}%")
+
+    log("----- Riesgo -----")
+    log(f"Rentabilidad anual: {metricas['rentabilidad_anual'] * 100:.2f}%  "
+        f"(volatilidad anual {metricas['volatilidad_anual'] * 100:.2f}%)")
+    log(f"Máximo drawdown: {metricas['max_drawdown'] * 100:.2f}% "
+        f"({metricas.get('duracion_max_drawdown_dias', metricas['duracion_max_drawdown']):.1f} "
+        f"{'días' if 'duracion_max_drawdown_dias' in metricas else 'velas'} sin nuevo máximo)")
+    log(f"Sharpe: {metricas['sharpe']:.2f}  Sortino: {metricas['sortino']:.2f}  Calmar: {metricas['calmar']:.2f}")
+
+    log("----- Operaciones -----")
+    log(f"Win rate: {metricas['win_rate'] * 100:.2f}%  Profit factor: {metricas['profit_factor']:.2f}  "
+        f"Ganancia media: {metricas['ganancia_media'] * 100:.3f}%")
+    log(f"Duración media: {metricas.get('tiempo_medio_operacion_dias', metricas['tiempo_medio_operacion']):.2f} "
+        f"{'días' if 'tiempo_medio_operacion_dias' in metricas else 'velas'}  "
+        f"Exposición: {metricas['exposicion'] * 100:.2f}% del tiempo")
 
     # Conteo de cada tipo de exit_reason y total
-    counts = df['exit_reason'].value_counts(dropna=True)
-    total_operaciones = counts.sum()
-    print("Operaciones cerradas por tipo:")
-    for tipo, cantidad in counts.items():
-        print(f"  {tipo}: {cantidad}")
-    print(f"Total operaciones cerradas: {total_operaciones}")
+    log("Operaciones cerradas por tipo:")
+    for tipo in ('TP', 'SL', 'End'):
+        if metricas[tipo]:
+            log(f"  {tipo}: {metricas[tipo]}")
+    log(f"Total operaciones cerradas: {metricas['operaciones']}")
 
-    print("--------------------------------")
+    log("--------------------------------")
+    return metricas
 
 from visualizacion import * 
 
-def back_testing_graph(df):
-    # Solo grafica la evolución del capital disponible (ganancias acumuladas)
-    graficar(df, columnas=['disponible', 'open'], juntas=False, last_n=len(df))
\ No newline at end of file
+def back_testing_graph(df, operaciones=None, ruta=None):
+    # Solo grafica la evolución del capital disponible (ganancias acumuladas), reducida al ancho
+    # de la figura; con el ledger de backtesting(return_ledger=True) marca las operaciones
+    return graficar(df, columnas=['disponible', 'open'], juntas=False, last_n=None,
+                    operaciones=operaciones, ruta=ruta)
\ No newline at end of file
@@ -0,0 +1,140 @@
+import csv
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from almacen import columnas_a_arrays
+from backtesting import preparar_ejecucion, simular_operaciones
+from instrumentacion import log
+from metricas import barras_por_anio, metricas_backtesting
+
+# Arrays compartidos por cada proceso del pool (se cargan una vez en init_worker)
+DATOS_WORKER = {}
+
+COLUMNAS_RESULTADO = [
+    'combinacion', 'threshold', 'take_profit', 'stop_loss', 'capital_final', 'operaciones',
+    'TP', 'SL', 'End', 'max_drawdown', 'duracion_max_drawdown', 'sharpe', 'sortino', 'calmar',
+    'win_rate', 'profit_factor', 'tiempo_medio_operacion', 'exposicion',
+]
+
+
+def init_worker(datos):
+    DATOS_WORKER.update(datos)
+
+
+def evaluar_combinacion(datos, threshold, take_profit, stop_loss):
+    """
+    Ejecuta el backtesting de una combinación sin construir DataFrames.
+
+    Returns:
+        dict: Fila de resultados con capital final, operaciones por exit_reason y las métricas de
+              riesgo de metricas.metricas_backtesting.
+    """
+    n = len(datos['open'])
+    ledger = simular_operaciones(
+        datos['open'], datos['high'], datos['low'], datos['close'],
+        datos['pred_proba'] >= threshold,
+        take_profit=take_profit, stop_loss=stop_loss,
+        ejecucion=datos['ejecucion'], fechas=datos['date'],
+    )
+
+    gains = np.zeros(n)
+    gains[ledger['exit_idx']] = ledger['gains']
+    factores = 1 + gains
+    factores[0] = datos['capital_inicial']
+    disponible = np.cumprod(factores)
+
+    metricas = metricas_backtesting(disponible, ledger['entry_idx'], ledger['exit_idx'], ledger['gains'],
+                                    barras_por_anio=datos['barras_por_anio'], razones=ledger['exit_reason'])
+    return {'threshold': threshold, 'take_profit': take_profit, 'stop_loss': stop_loss,
+            **{col: metricas[col] for col in COLUMNAS_RESULTADO[4:]}}
+
+
+def evaluar_lote(combinaciones):
+    return [{'combinacion': indice, **evaluar_combinacion(DATOS_WORKER, *combinacion)}
+            for indice, combinacion in combinaciones]
+
+
+def barrido_backtesting(df_pred, thresholds, take_profits, stop_losses, capital_inicial=100,
+                        n_jobs=None, tam_lote=64, ruta_salida=None, ejecucion=None):
+    """
+    Evalúa una rejilla de threshold / take_profit / stop_loss reutilizando la columna 'pred_proba'.
+
+    Las combinaciones se generan de forma perezosa y se reparten en lotes entre un pool de
+    procesos; cada proceso recibe los arrays de precios una sola vez. Los resultados salen en
+    el orden de la rejilla (columna 'combinacion'), aunque los lotes terminen en otro orden.
+
+    Args:
+        df_pred (pd.DataFrame): Salida de predict_from_model con 'pred_proba' y precios.
+        thresholds (list[float]): Umbrales de probabilidad.
+        take_profits (list[float]): Porcentajes de take profit.
+        stop_losses (list[float]): Porcentajes de stop loss.
+        capital_inicial (float): Capital con el que empieza cada backtesting.
+        n_jobs (int): Número de procesos (por defecto, todos los núcleos).
+        tam_lote (int): Combinaciones por tarea enviada al pool.
+        ruta_salida (str): Si se indica, los resultados se escriben en CSV a medida que llegan
+                           y no se acumulan en memoria.
+        ejecucion (dict): Comisiones, deslizamiento y resolución intrabar (ver backtesting.crear_ejecucion).
+
+    Returns:
+        pd.DataFrame con una fila por combinación, o la ruta del CSV si se indicó ruta_salida.
+    """
+    if df_pred.empty:
+        raise ValueError("df_pred no tiene filas para el barrido.")
+
+    df = df_pred.sort_values('date').reset_index(drop=True)
+
+    fechas_ns = columnas_a_arrays(df[['date']])['date']
+    datos = {
+        'date': fechas_ns,
+        'ejecucion': preparar_ejecucion(ejecucion, fechas_ns),
+        'open': df['open'].to_numpy(dtype=float),
+        'high': df['high'].to_numpy(dtype=float),
+        'low': df['low'].to_numpy(dtype=float),
+        'close': df['close'].to_numpy(dtype=float),
+        'pred_proba': df['pred_proba'].to_numpy(dtype=float),
+        'capital_inicial': capital_inicial,
+        'barras_por_anio': barras_por_anio(df['date']),
+    }
+
+    rejilla = enumerate(itertools.product(thresholds, take_profits, stop_losses))
+    lotes = iter(lambda: list(itertools.islice(rejilla, tam_lote)), [])
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    resultados = []
+    fichero = open(ruta_salida, 'w', newline='') if ruta_salida else None
+    try:
+        if fichero:
+            escritor = csv.DictWriter(fichero, fieldnames=COLUMNAS_RESULTADO)
+            escritor.writeheader()
+
+        def recoger(futuro):
+            filas = futuro.result()
+            if fichero:
+                escritor.writerows(filas)
+            else:
+                resultados.extend(filas)
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=(datos,)) as pool:
+            # Mantenemos un número acotado de lotes en vuelo para no materializar la rejilla y se
+            # recogen en el orden en que se enviaron, así que las filas siguen el orden de la rejilla
+            pendientes = deque()
+            for lote in lotes:
+                pendientes.append(pool.submit(evaluar_lote, lote))
+                if len(pendientes) >= 2 * n_jobs:
+                    recoger(pendientes.popleft())
+            while pendientes:
+                recoger(pendientes.popleft())
+    finally:
+        if fichero:
+            fichero.close()
+
+    if ruta_salida:
+        log(f"✅ Barrido guardado en {ruta_salida}")
+        return ruta_salida
+
+    return pd.DataFrame(resultados, columns=COLUMNAS_RESULTADO)
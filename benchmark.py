@@ -0,0 +1,344 @@
+"""
+Benchmarks de la cadena sobre velas sintéticas, con comparación contra una línea base.
+
+Las velas se generan con un paseo aleatorio con semilla (generar_ohlcv), así que se puede medir
+sin conexión ni datos descargados y con los mismos datos en cada máquina. Cada caso mide una
+función pública de functions.py, train.py, inferencia.py o backtesting.py a varios tamaños; con
+los tiempos se estima el exponente de escalado (1 = lineal) y se comparan con la línea base
+guardada (una regresión es un caso más lento que la base en más del umbral).
+
+    python benchmark.py --tamanos 10000 100000 1000000               # medir e imprimir
+    python benchmark.py --guardar-base                               # fijar la línea base
+    python benchmark.py --comparar --umbral 0.2                      # sale con código 1 si hay regresiones
+
+Con 50 millones de velas solo los datos sintéticos ocupan unos 2.4 GB (float64); los casos de
+entrenamiento e inferencia tienen un máximo de velas propio (ver CASOS).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from backtesting import backtesting, simular_operaciones
+from functions import add_rsi, add_ema, add_ema_cross, add_trade_outcome, filtrar_fecha
+from inferencia import predict_from_model
+from instrumentacion import log, silenciar
+from train import clean_train, columnas_modelo, execute_random_forest, matriz_features
+
+TAMANOS = [10_000, 100_000, 1_000_000]
+RUTA_BASE = 'benchmark_base.json'
+UMBRAL_REGRESION = 0.2
+
+# Velas con las que se entrena el modelo que usan los casos de inferencia
+VELAS_MODELO = 50_000
+ARBOLES_BENCHMARK = 10
+
+def generar_ohlcv(n_velas, semilla=42, precio_inicial=30000.0, volatilidad=0.005, frecuencia='10min',
+                  inicio='2020-01-01'):
+    """
+    Velas OHLCV sintéticas con un paseo aleatorio geométrico.
+
+    El 'open' de cada vela es el 'close' de la anterior; 'high' y 'low' se separan de ambos con
+    mechas aleatorias y el volumen es log-normal.
+
+    Args:
+        n_velas (int): Número de velas.
+        semilla (int): Semilla del generador (mismos datos con la misma semilla).
+        precio_inicial (float): Precio de la primera vela.
+        volatilidad (float): Desviación típica del retorno logarítmico por vela.
+        frecuencia (str): Temporalidad de pandas de las fechas.
+        inicio (str): Fecha de la primera vela.
+
+    Returns:
+        pd.DataFrame: Columnas 'date', 'open', 'high', 'low', 'close', 'volume'.
+    """
+    rng = np.random.default_rng(semilla)
+    closes = precio_inicial * np.exp(np.cumsum(rng.normal(0.0, volatilidad, n_velas)))
+    opens = np.empty(n_velas)
+    opens[0] = precio_inicial
+    opens[1:] = closes[:-1]
+
+    cuerpo_max = np.maximum(opens, closes)
+    cuerpo_min = np.minimum(opens, closes)
+    highs = cuerpo_max * np.exp(np.abs(rng.normal(0.0, volatilidad / 2, n_velas)))
+    lows = cuerpo_min * np.exp(-np.abs(rng.normal(0.0, volatilidad / 2, n_velas)))
+    volumenes = rng.lognormal(mean=3.0, sigma=1.0, size=n_velas)
+
+    return pd.DataFrame({
+        'date': pd.date_range(inicio, periods=n_velas, freq=frecuencia),
+        'open': opens,
+        'high': highs,
+        'low': lows,
+        'close': closes,
+        'volume': volumenes,
+    })
+
+def datos_etiquetados(df):
+    """Indicadores y etiquetas de main.py sobre las velas (modifica df)."""
+    df, _ = add_rsi(df, verbose=False)
+    df, _ = add_ema(df, period=12, verbose=False)
+    df, _ = add_ema_cross(df, fast=12, slow=26, verbose=False)
+    df, _, _ = add_trade_outcome(df, horizon=24, take_profit=3, stop_loss=1)
+    return df
+
+def contexto_benchmark(n_velas, semilla=42, contexto_modelo=None):
+    """
+    Datos que comparten los casos de un tamaño.
+
+    Returns:
+        dict: 'velas' (OHLCV), 'etiquetado' (con indicadores y etiquetas), 'modelo', 'feature_cols'
+              y 'prediccion' (salida de predict_from_model para el backtesting).
+    """
+    velas = generar_ohlcv(n_velas, semilla=semilla)
+    etiquetado = datos_etiquetados(velas.copy())
+
+    if contexto_modelo is None:
+        contexto_modelo = modelo_benchmark(semilla)
+
+    prediccion = predict_from_model(etiquetado, contexto_modelo['modelo'], contexto_modelo['feature_cols'],
+                                    threshold=0.5)
+    return {'velas': velas, 'etiquetado': etiquetado, 'prediccion': prediccion, **contexto_modelo}
+
+def modelo_benchmark(semilla=42):
+    """Bosque pequeño entrenado una vez sobre VELAS_MODELO velas sintéticas."""
+    df = datos_etiquetados(generar_ohlcv(VELAS_MODELO, semilla=semilla + 1))
+    modelo, feature_cols, _ = execute_random_forest(df, n_estimators=ARBOLES_BENCHMARK, random_state=semilla)
+    return {'modelo': modelo, 'feature_cols': feature_cols}
+
+def arrays_backtesting(df_pred):
+    return (df_pred['open'].to_numpy(dtype=float), df_pred['high'].to_numpy(dtype=float),
+            df_pred['low'].to_numpy(dtype=float), df_pred['close'].to_numpy(dtype=float),
+            df_pred['model_pred'].to_numpy(dtype=bool))
+
+# Cada caso prepara, fuera de la medición, una función sin argumentos a partir del contexto.
+# 'max_velas' limita los casos que no escalan a decenas de millones de velas.
+CASOS = {
+    'functions.add_rsi': {
+        'preparar': lambda ctx: (lambda df=ctx['velas'].copy(): add_rsi(df, verbose=False)),
+    },
+    'functions.add_ema': {
+        'preparar': lambda ctx: (lambda df=ctx['velas'].copy(): add_ema(df, period=12, verbose=False)),
+    },
+    'functions.add_ema_cross': {
+        'preparar': lambda ctx: (lambda df=ctx['velas'].copy(): add_ema_cross(df, fast=12, slow=26, verbose=False)),
+    },
+    'functions.add_trade_outcome': {
+        'preparar': lambda ctx: (lambda df=ctx['velas'].copy(): add_trade_outcome(df, horizon=24, take_profit=3,
+                                                                                  stop_loss=1)),
+    },
+    'functions.filtrar_fecha': {
+        'preparar': lambda ctx: (lambda: filtrar_fecha(ctx['etiquetado'], total_anios=5, eliminar_anios_final=0.1)),
+    },
+    'train.matriz_features': {
+        'preparar': lambda ctx: (lambda: matriz_features(ctx['etiquetado'], columnas_modelo(ctx['etiquetado'])[0])),
+    },
+    'train.clean_train': {
+        'preparar': lambda ctx: (lambda: clean_train(ctx['etiquetado'], balanced=True)),
+    },
+    'train.execute_random_forest': {
+        'preparar': lambda ctx: (lambda: execute_random_forest(ctx['etiquetado'], n_estimators=ARBOLES_BENCHMARK,
+                                                               balanced=True)),
+        'max_velas': 1_000_000,
+    },
+    'inferencia.predict_from_model': {
+        'preparar': lambda ctx: (lambda: predict_from_model(ctx['etiquetado'], ctx['modelo'], ctx['feature_cols'],
+                                                            threshold=0.5)),
+        'max_velas': 5_000_000,
+    },
+    'inferencia.predict_from_model[bosque]': {
+        'preparar': lambda ctx: (lambda: predict_from_model(ctx['etiquetado'], ctx['modelo'], ctx['feature_cols'],
+                                                            threshold=0.5, backend='bosque')),
+        'max_velas': 5_000_000,
+    },
+    'backtesting.simular_operaciones': {
+        'preparar': lambda ctx: (lambda arrays=arrays_backtesting(ctx['prediccion']): simular_operaciones(*arrays)),
+    },
+    'backtesting.backtesting': {
+        'preparar': lambda ctx: (lambda: backtesting(ctx['prediccion'], return_ledger=True)),
+    },
+}
+
+def medir(funcion, repeticiones=3):
+    """Tiempos en segundos de repeticiones llamadas a funcion."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+def exponente_escalado(velas, tiempos):
+    """
+    Pendiente de log(tiempo) frente a log(velas): 1 es lineal, 2 cuadrático.
+
+    Returns:
+        float: Exponente, o None con menos de dos tamaños.
+    """
+    velas, tiempos = np.asarray(velas, dtype=float), np.asarray(tiempos, dtype=float)
+    validos = tiempos > 0
+    if validos.sum() < 2:
+        return None
+    return float(np.polyfit(np.log(velas[validos]), np.log(tiempos[validos]), 1)[0])
+
+def entorno():
+    """Versiones y máquina con las que se ha medido."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'plataforma': platform.platform(),
+        'procesador': platform.processor() or platform.machine(),
+        'nucleos': os.cpu_count(),
+    }
+
+def ejecutar_benchmarks(tamanos=None, casos=None, repeticiones=3, semilla=42, verbose=True):
+    """
+    Mide cada caso a cada tamaño.
+
+    Args:
+        tamanos (list): Números de velas (por defecto TAMANOS).
+        casos (list): Nombres de CASOS a medir (por defecto todos).
+        repeticiones (int): Llamadas por caso y tamaño; se guarda la mejor y la mediana.
+        semilla (int): Semilla de los datos sintéticos.
+        verbose (bool): Si True, imprime cada medición y el escalado.
+
+    Returns:
+        dict: 'fecha', 'entorno', 'semilla', 'repeticiones', 'resultados' (una fila por caso y
+              tamaño con 'caso', 'velas', 'tiempo_s', 'mediana_s', 'velas_por_s') y 'escalado'
+              ({caso: exponente}).
+    """
+    tamanos = sorted(tamanos or TAMANOS)
+    casos = casos or list(CASOS)
+    desconocidos = [caso for caso in casos if caso not in CASOS]
+    if desconocidos:
+        raise ValueError(f"Casos no válidos: {desconocidos}. Usa alguno de {list(CASOS)}.")
+
+    # Los mensajes de la cadena se mezclarían con los tiempos: solo se muestran los del benchmark
+    silenciar()
+    try:
+        contexto_modelo = modelo_benchmark(semilla)
+        resultados = []
+        for n_velas in tamanos:
+            contexto = contexto_benchmark(n_velas, semilla, contexto_modelo)
+            for caso in casos:
+                if n_velas > CASOS[caso].get('max_velas', float('inf')):
+                    continue
+                # Cada repetición con sus datos recién preparados (los add_* modifican el DataFrame)
+                tiempos = [medir(CASOS[caso]['preparar'](contexto), 1)[0] for _ in range(repeticiones)]
+                fila = {'caso': caso, 'velas': n_velas, 'tiempo_s': min(tiempos),
+                        'mediana_s': float(np.median(tiempos))}
+                fila['velas_por_s'] = n_velas / fila['tiempo_s'] if fila['tiempo_s'] > 0 else None
+                resultados.append(fila)
+                if verbose:
+                    silenciar(False)
+                    log(f"   {caso:<40} {n_velas:>11,} velas  {fila['tiempo_s']:9.4f}s")
+                    silenciar()
+            del contexto
+    finally:
+        silenciar(False)
+
+    escalado = {}
+    for caso in casos:
+        filas = [fila for fila in resultados if fila['caso'] == caso]
+        escalado[caso] = exponente_escalado([fila['velas'] for fila in filas], [fila['tiempo_s'] for fila in filas])
+
+    if verbose:
+        log("✅ Escalado (exponente del tiempo respecto a las velas, 1 = lineal):")
+        for caso, exponente in escalado.items():
+            log(f"   {caso:<40} {'-' if exponente is None else f'{exponente:.2f}'}")
+
+    return {
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'entorno': entorno(),
+        'semilla': semilla,
+        'repeticiones': repeticiones,
+        'resultados': resultados,
+        'escalado': escalado,
+    }
+
+def guardar_resultados(resultados, ruta=RUTA_BASE):
+    with open(ruta, 'w') as f:
+        json.dump(resultados, f, indent=2)
+    return ruta
+
+def cargar_resultados(ruta=RUTA_BASE):
+    if not os.path.exists(ruta):
+        raise ValueError(f"No existe la línea base '{ruta}'. Créala con --guardar-base.")
+    with open(ruta) as f:
+        return json.load(f)
+
+def comparar_con_base(resultados, base, umbral=UMBRAL_REGRESION, verbose=True):
+    """
+    Compara los tiempos con los de la línea base para los mismos casos y tamaños.
+
+    Args:
+        resultados (dict): Salida de ejecutar_benchmarks.
+        base (dict): Resultados guardados (ver cargar_resultados).
+        umbral (float): Fracción de tiempo extra a partir de la cual es una regresión (0.2 = 20%).
+        verbose (bool): Si True, imprime la comparación.
+
+    Returns:
+        pd.DataFrame: 'caso', 'velas', 'tiempo_base_s', 'tiempo_s', 'ratio' y 'regresion'.
+    """
+    tiempos_base = {(fila['caso'], fila['velas']): fila['tiempo_s'] for fila in base['resultados']}
+    filas = []
+    for fila in resultados['resultados']:
+        tiempo_base = tiempos_base.get((fila['caso'], fila['velas']))
+        if tiempo_base is None:
+            continue
+        ratio = fila['tiempo_s'] / tiempo_base if tiempo_base > 0 else float('inf')
+        filas.append({'caso': fila['caso'], 'velas': fila['velas'], 'tiempo_base_s': tiempo_base,
+                      'tiempo_s': fila['tiempo_s'], 'ratio': ratio, 'regresion': ratio > 1 + umbral})
+
+    comparacion = pd.DataFrame(filas, columns=['caso', 'velas', 'tiempo_base_s', 'tiempo_s', 'ratio', 'regresion'])
+
+    if verbose:
+        if base.get('entorno') != resultados.get('entorno'):
+            log("⚠️ La línea base se midió en otro entorno; los tiempos pueden no ser comparables.")
+        for fila in comparacion.itertuples():
+            marca = '❌' if fila.regresion else '✅'
+            log(f"   {marca} {fila.caso:<40} {fila.velas:>11,} velas  {fila.tiempo_base_s:9.4f}s → "
+                f"{fila.tiempo_s:9.4f}s  (x{fila.ratio:.2f})")
+        log(f"✅ {int(comparacion['regresion'].sum())} regresiones de {len(comparacion)} mediciones "
+            f"(umbral {umbral:.0%})")
+
+    return comparacion
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de la cadena sobre velas sintéticas.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS, help="Números de velas a medir.")
+    parser.add_argument('--casos', nargs='+', choices=list(CASOS), help="Casos a medir (por defecto todos).")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', help="JSON donde guardar los resultados de esta ejecución.")
+    parser.add_argument('--base', default=RUTA_BASE, help="JSON de la línea base.")
+    parser.add_argument('--guardar-base', action='store_true', help="Guarda los resultados como línea base.")
+    parser.add_argument('--comparar', action='store_true', help="Compara con la línea base.")
+    parser.add_argument('--umbral', type=float, default=UMBRAL_REGRESION,
+                        help="Tiempo extra tolerado respecto a la base (0.2 = 20%%).")
+    args = parser.parse_args(argumentos)
+
+    resultados = ejecutar_benchmarks(args.tamanos, args.casos, args.repeticiones, args.semilla)
+
+    if args.salida:
+        guardar_resultados(resultados, args.salida)
+    if args.comparar:
+        comparacion = comparar_con_base(resultados, cargar_resultados(args.base), args.umbral)
+        if comparacion['regresion'].any():
+            return 1
+    if args.guardar_base:
+        guardar_resultados(resultados, args.base)
+        log(f"✅ Línea base guardada en {args.base}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
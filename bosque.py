@@ -0,0 +1,182 @@
+"""
+Representación plana de un bosque de árboles (RandomForest de execute_random_forest).
+
+Todos los nodos de todos los árboles se guardan en arrays contiguos, con los hijos como índices
+globales, para poder guardarlos como .npy, abrirlos con mmap y recorrerlos sin sklearn.
+"""
+
+import numpy as np
+
+from instrumentacion import log
+
+ARRAYS_BOSQUE = ['raices', 'izquierda', 'derecha', 'feature', 'umbral', 'proba']
+
+def es_bosque(model):
+    return hasattr(model, 'estimators_') and all(hasattr(arbol, 'tree_') for arbol in model.estimators_)
+
+def columna_positiva(model):
+    """
+    Posición de la clase 1 en model.classes_ (columna de predict_proba).
+
+    Returns:
+        int: Posición, o None si el modelo se entrenó sin ninguna fila de la clase 1
+             (si solo vio la clase 1, predict_proba tiene una sola columna y es la 0).
+    """
+    clases = list(getattr(model, 'classes_', [0, 1]))
+    return clases.index(1) if 1 in clases else None
+
+def proba_positiva(model, X):
+    """Probabilidad de la clase 1 con model.predict_proba, aunque el modelo solo viera una clase."""
+    columna = columna_positiva(model)
+    if columna is None:
+        return np.zeros(len(X))
+    return model.predict_proba(X)[:, columna]
+
+def aplanar_bosque(model):
+    """
+    Convierte un bosque entrenado en arrays contiguos.
+
+    Args:
+        model: RandomForestClassifier (o cualquier ensemble de árboles de clasificación binaria).
+
+    Returns:
+        dict: 'raices' (nodo raíz de cada árbol), 'izquierda'/'derecha' (índice global del hijo,
+              -1 en las hojas), 'feature', 'umbral' y 'proba' (probabilidad de la clase 1 en cada
+              nodo, como la calcula DecisionTreeClassifier.predict_proba; 0 o 1 si el bosque
+              se entrenó con una sola clase).
+    """
+    if not es_bosque(model):
+        raise ValueError("El modelo no es un ensemble de árboles entrenado.")
+
+    # Los valores de los nodos tienen una columna por clase del bosque (ver columna_positiva)
+    columna = columna_positiva(model)
+
+    arboles = [arbol.tree_ for arbol in model.estimators_]
+    tamanos = np.array([arbol.node_count for arbol in arboles], dtype=np.int64)
+    raices = np.concatenate([[0], np.cumsum(tamanos)[:-1]])
+
+    izquierda, derecha, feature, umbral, proba = [], [], [], [], []
+    for raiz, arbol in zip(raices, arboles):
+        hoja = arbol.children_left == -1
+        izquierda.append(np.where(hoja, -1, arbol.children_left + raiz))
+        derecha.append(np.where(hoja, -1, arbol.children_right + raiz))
+        feature.append(np.where(hoja, 0, arbol.feature))
+        umbral.append(arbol.threshold)
+
+        valores = arbol.value[:, 0, :]
+        normalizador = valores.sum(axis=1)
+        normalizador[normalizador == 0.0] = 1.0
+        if columna is None:
+            proba.append(np.zeros(len(valores)))
+        else:
+            proba.append(valores[:, columna] / normalizador)
+
+    return {
+        'raices': raices,
+        'izquierda': np.concatenate(izquierda).astype(np.int64),
+        'derecha': np.concatenate(derecha).astype(np.int64),
+        'feature': np.concatenate(feature).astype(np.int64),
+        'umbral': np.concatenate(umbral).astype(np.float64),
+        'proba': np.concatenate(proba).astype(np.float64),
+    }
+
+def predict_proba_bosque(arrays, X, tam_bloque=8192):
+    """
+    Probabilidad de la clase 1 recorriendo el bosque plano con operaciones vectorizadas.
+
+    En cada nivel solo se avanzan los pares (fila, árbol) que aún no han llegado a una hoja.
+    Las comparaciones se hacen con X en float32 y los umbrales en float64 y las probabilidades
+    de los árboles se suman en orden, igual que sklearn, por lo que el resultado coincide con
+    proba_positiva(model, X).
+
+    Args:
+        arrays (dict): Resultado de aplanar_bosque (o los arrays del registro de modelos).
+        X (np.ndarray): Matriz de features (o una sola fila).
+        tam_bloque (int): Filas procesadas a la vez, para acotar la memoria en lotes grandes.
+
+    Returns:
+        np.ndarray: Probabilidades, una por fila.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X[np.newaxis, :]
+
+    raices = np.asarray(arrays['raices'])
+    izquierda, derecha = arrays['izquierda'], arrays['derecha']
+    feature, umbral, proba = arrays['feature'], arrays['umbral'], arrays['proba']
+    n_arboles = len(raices)
+
+    resultado = np.empty(len(X))
+    for inicio in range(0, len(X), tam_bloque):
+        bloque = X[inicio:inicio + tam_bloque]
+        m = len(bloque)
+
+        nodos = np.tile(raices, m)
+        filas = np.repeat(np.arange(m), n_arboles)
+        activos = np.arange(m * n_arboles)
+
+        while activos.size:
+            actuales = nodos[activos]
+            hijos_izq = izquierda[actuales]
+            internos = hijos_izq >= 0
+            activos, actuales, hijos_izq = activos[internos], actuales[internos], hijos_izq[internos]
+            if not activos.size:
+                break
+            a_izquierda = bloque[filas[activos], feature[actuales]] <= umbral[actuales]
+            nodos[activos] = np.where(a_izquierda, hijos_izq, derecha[actuales])
+
+        # Suma acumulada por árbol en orden (como sklearn) y media
+        probas = proba[nodos].reshape(m, n_arboles)
+        resultado[inicio:inicio + m] = np.cumsum(probas, axis=1)[:, -1] / n_arboles
+
+    return resultado
+
+def benchmark_inferencia(model, X, filas_latencia=200, repeticiones=3, verbose=True):
+    """
+    Compara sklearn y el recorrido del bosque plano en latencia por fila y filas por segundo.
+
+    Args:
+        model: Bosque entrenado.
+        X (np.ndarray): Filas de features para las pruebas.
+        filas_latencia (int): Filas puntuadas de una en una para medir la latencia.
+        repeticiones (int): Repeticiones del lote completo (se toma la mejor).
+        verbose (bool): Si True, imprime la tabla de resultados.
+
+    Returns:
+        dict: {'sklearn': {...}, 'bosque': {...}} con 'latencia_ms' y 'filas_por_segundo'.
+    """
+    import time
+    import warnings
+
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    arrays = aplanar_bosque(model)
+    caminos = {
+        'sklearn': lambda filas: proba_positiva(model, filas),
+        'bosque': lambda filas: predict_proba_bosque(arrays, filas),
+    }
+
+    resultados = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # sklearn avisa de que X no tiene nombres de columnas
+        for nombre, predecir in caminos.items():
+            filas = X[:filas_latencia]
+            inicio = time.perf_counter()
+            for i in range(len(filas)):
+                predecir(filas[i:i + 1])
+            latencia = (time.perf_counter() - inicio) / max(len(filas), 1)
+
+            mejor = np.inf
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                predecir(X)
+                mejor = min(mejor, time.perf_counter() - inicio)
+
+            resultados[nombre] = {'latencia_ms': latencia * 1000, 'filas_por_segundo': len(X) / mejor}
+
+    if verbose:
+        log(f"✅ Benchmark de inferencia ({len(model.estimators_)} árboles, lote de {len(X)} filas):")
+        for nombre, medidas in resultados.items():
+            log(f"   {nombre:<8} latencia por fila {medidas['latencia_ms']:.3f} ms   "
+                f"{medidas['filas_por_segundo']:,.0f} filas/s")
+
+    return resultados
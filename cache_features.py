@@ -0,0 +1,142 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from instrumentacion import log
+
+CARPETA_CACHE = 'cache'
+TAMANO_MAX_CACHE = 2 * 1024 ** 3  # 2 GB
+
+COLUMNAS_BASE = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+def huella_datos(df, columnas=COLUMNAS_BASE):
+    """
+    Calcula una huella de los datos de origen (fechas y OHLCV).
+
+    Si cambia cualquier vela, o el rango de fechas, cambia la huella y las columnas
+    guardadas para los datos anteriores dejan de usarse.
+
+    Args:
+        df (pd.DataFrame): Datos de velas.
+        columnas (list): Columnas de origen que se tienen en cuenta.
+
+    Returns:
+        str: Huella hexadecimal.
+    """
+    columnas = [col for col in columnas if col in df.columns]
+    filas = pd.util.hash_pandas_object(df[columnas], index=False).to_numpy()
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(columnas).encode())
+    h.update(filas.tobytes())
+    return h.hexdigest()
+
+def clave_cache(funcion, huella, params):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(huella.encode())
+    h.update(funcion.__name__.encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def parametros_funcion(funcion, params):
+    """Parámetros efectivos de la llamada (incluyendo valores por defecto), sin df ni verbose."""
+    argumentos = inspect.signature(funcion).bind(None, **params)
+    argumentos.apply_defaults()
+    efectivos = dict(list(argumentos.arguments.items())[1:])
+    efectivos.pop('verbose', None)
+    return efectivos
+
+def tamano_directorio(ruta):
+    return sum(entrada.stat().st_size for entrada in os.scandir(ruta) if entrada.is_file())
+
+def limpiar_cache(carpeta=CARPETA_CACHE, tamano_max=TAMANO_MAX_CACHE, conservar=None):
+    """
+    Elimina las entradas usadas hace más tiempo hasta que la caché ocupe como mucho tamano_max bytes.
+
+    Returns:
+        int: Número de entradas eliminadas.
+    """
+    if not os.path.isdir(carpeta):
+        return 0
+
+    entradas = []
+    for entrada in os.scandir(carpeta):
+        meta = os.path.join(entrada.path, 'meta.json')
+        if entrada.is_dir() and os.path.exists(meta):
+            entradas.append((os.path.getmtime(meta), entrada.name, tamano_directorio(entrada.path)))
+
+    total = sum(tamano for _, _, tamano in entradas)
+    eliminadas = 0
+    for _, nombre, tamano in sorted(entradas):
+        if total <= tamano_max:
+            break
+        if nombre == conservar:
+            continue
+        shutil.rmtree(os.path.join(carpeta, nombre), ignore_errors=True)
+        total -= tamano
+        eliminadas += 1
+
+    return eliminadas
+
+def con_cache(funcion, df, huella=None, carpeta=CARPETA_CACHE, tamano_max=TAMANO_MAX_CACHE, **params):
+    """
+    Ejecuta un indicador o etiquetado reutilizando sus columnas si ya se calcularon.
+
+    La clave combina la huella de los datos de origen con el nombre de la función y sus
+    parámetros efectivos, ej: con_cache(add_rsi, df, period=14). Cada columna que escribe la
+    función (nueva o sobrescrita) se guarda por separado en formato .npy, así que la entrada
+    no depende de las columnas que ya tuviera el df. Las entradas menos usadas se eliminan
+    cuando la caché supera tamano_max bytes.
+
+    Args:
+        funcion (callable): Función del tipo add_* que devuelve (df, ...).
+        df (pd.DataFrame): DataFrame de entrada.
+        huella (str): Huella de huella_datos(df); se calcula si no se pasa.
+        carpeta (str): Carpeta de la caché.
+        tamano_max (int): Tamaño máximo de la caché en bytes.
+        **params: Parámetros de la función.
+
+    Returns:
+        tuple: Lo mismo que devolvería funcion(df, **params).
+    """
+    huella = huella or huella_datos(df)
+    clave = clave_cache(funcion, huella, parametros_funcion(funcion, params))
+    ruta = os.path.join(carpeta, clave)
+    ruta_meta = os.path.join(ruta, 'meta.json')
+
+    if os.path.exists(ruta_meta):
+        with open(ruta_meta) as f:
+            meta = json.load(f)
+        for i, col in enumerate(meta['columnas']):
+            valores = np.load(os.path.join(ruta, f'{i}.npy'))
+            df[col] = valores.astype(object) if valores.dtype.kind == 'U' else valores
+        os.utime(ruta_meta)  # Marca de uso para el desalojo LRU
+
+        log(f"✅ Cargado desde caché {funcion.__name__}: {', '.join(meta['columnas'])}")
+        return (df, *meta['retorno'])
+
+    # Con copy-on-write cualquier columna que la función escriba (nueva o sobrescrita, aunque
+    # sea con los mismos valores) deja de compartir memoria con la de antes de llamarla
+    antes = {col: df[col].to_numpy() for col in df.columns}
+    resultado = funcion(df, **params)
+    df = resultado[0]
+    nuevas = [col for col in df.columns
+              if col not in antes or not np.shares_memory(df[col].to_numpy(), antes[col])]
+
+    os.makedirs(ruta, exist_ok=True)
+    for i, col in enumerate(nuevas):
+        valores = df[col].to_numpy()
+        if valores.dtype == object:
+            valores = valores.astype(str)
+        np.save(os.path.join(ruta, f'{i}.npy'), valores)
+    with open(ruta_meta, 'w') as f:
+        json.dump({'funcion': funcion.__name__, 'columnas': nuevas, 'retorno': list(resultado[1:])}, f)
+
+    limpiar_cache(carpeta, tamano_max, conservar=clave)
+
+    return resultado
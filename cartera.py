@@ -0,0 +1,229 @@
+"""
+Backtesting de cartera: las señales de muchos símbolos comparten un mismo capital.
+
+Cada símbolo aporta un flujo de señales ordenado por fecha y los flujos se combinan con una
+mezcla k-way (heapq.merge), sin alinear los símbolos en un panel ancho. Las posiciones abiertas
+se guardan en un heap por fecha de salida, y antes de cada entrada se cierran todas las que
+salen en esa fecha o antes (las salidas se procesan antes que las entradas).
+
+Las reglas de cada operación (entrada al 'open' de la vela siguiente, take profit y stop loss)
+son las de backtesting.simular_operaciones. La curva de capital se valora a mercado en cada
+fecha: las posiciones abiertas cuentan al 'close' de la vela (ver valorar_posiciones).
+"""
+
+import heapq
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtesting import preparar_ejecucion, resolver_operacion
+from instrumentacion import log
+
+COLUMNAS_PREDICCION = ['date', 'open', 'high', 'low', 'close', 'model_pred']
+
+def arrays_simbolo(df_pred):
+    """Arrays ordenados por fecha que necesita la cartera (fechas en int64 ns)."""
+    df = df_pred.sort_values('date')
+    return {
+        'date': pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]').view(np.int64),
+        'open': df['open'].to_numpy(dtype=float),
+        'high': df['high'].to_numpy(dtype=float),
+        'low': df['low'].to_numpy(dtype=float),
+        'close': df['close'].to_numpy(dtype=float),
+        'senales': df['model_pred'].to_numpy(dtype=bool),
+    }
+
+def cargar_predicciones(carpeta_salida, simbolos=None):
+    """
+    Lee las predicciones por símbolo que deja lote.ejecutar_lote ('{carpeta_salida}/{simbolo}/predicciones.csv').
+
+    Returns:
+        dict: {simbolo: arrays de arrays_simbolo}
+    """
+    if simbolos is None:
+        simbolos = sorted(nombre for nombre in os.listdir(carpeta_salida)
+                          if os.path.exists(os.path.join(carpeta_salida, nombre, 'predicciones.csv')))
+
+    datos = {}
+    for simbolo in simbolos:
+        df = pd.read_csv(os.path.join(carpeta_salida, simbolo, 'predicciones.csv'), usecols=COLUMNAS_PREDICCION)
+        datos[simbolo] = arrays_simbolo(df)
+    return datos
+
+def flujo_senales(simbolo, arrays):
+    """Genera (fecha, simbolo, indice) para cada señal del símbolo, en orden de fecha."""
+    fechas = arrays['date']
+    for indice in np.flatnonzero(arrays['senales'][:max(len(fechas) - 1, 0)]):
+        yield int(fechas[indice]), simbolo, int(indice)
+
+def valorar_posiciones(datos, tramos, fechas):
+    """
+    Valor a mercado de las posiciones abiertas en cada fecha.
+
+    Cada símbolo tiene como mucho una posición abierta a la vez, así que su valor es un array
+    por vela del símbolo: lo asignado en la vela de la señal (aún no se ha entrado), asignado ×
+    close / precio de entrada mientras está abierta y 0 desde la vela de salida (el efectivo ya
+    ha vuelto). En las fechas en que el símbolo no tiene vela se mantiene su último valor.
+
+    Args:
+        datos (dict): {simbolo: arrays de arrays_simbolo}.
+        tramos (dict): {simbolo: [(vela de la señal, vela de salida, precio de entrada, asignado), ...]}.
+        fechas (np.ndarray): Fechas de la curva en int64 ns, ordenadas.
+
+    Returns:
+        np.ndarray: Valor de las posiciones abiertas en cada fecha.
+    """
+    total = np.zeros(len(fechas))
+    for simbolo, operaciones_simbolo in tramos.items():
+        arrays = datos[simbolo]
+        valor = np.zeros(len(arrays['date']))
+        for indice, salida, entry_price, asignado in operaciones_simbolo:
+            valor[indice] = asignado
+            valor[indice + 1:salida] = asignado * arrays['close'][indice + 1:salida] / entry_price
+
+        posiciones = np.searchsorted(arrays['date'], fechas, side='right') - 1
+        total += np.where(posiciones >= 0, valor[np.maximum(posiciones, 0)], 0.0)
+    return total
+
+def acumular_eventos(fechas_eventos, cambios, fechas):
+    """Suma acumulada de los cambios con fecha <= cada fecha de la curva."""
+    orden = np.argsort(fechas_eventos, kind='stable')
+    acumulado = np.cumsum(np.asarray(cambios, dtype=float)[orden])
+    posiciones = np.searchsorted(np.asarray(fechas_eventos)[orden], fechas, side='right') - 1
+    return np.where(posiciones >= 0, acumulado[np.maximum(posiciones, 0)], 0.0)
+
+def backtesting_cartera(predicciones, capital_inicial=100, tamano_posicion=0.1, max_posiciones=10,
+                        take_profit=3, stop_loss=1, ejecucion=None, verbose=True):
+    """
+    Simula todas las señales de varios símbolos con un capital común.
+
+    Cada señal abre una posición de tamano_posicion × capital (efectivo más lo invertido a precio
+    de entrada) si el símbolo no tiene ya una abierta, hay menos de max_posiciones abiertas y
+    queda efectivo; si no, se rechaza. Las señales de la misma fecha se atienden por orden
+    alfabético de símbolo.
+
+    Args:
+        predicciones (dict): {simbolo: DataFrame de predict_from_model o arrays de arrays_simbolo}
+                             (ver también cargar_predicciones).
+        capital_inicial (float): Capital común con el que se empieza.
+        tamano_posicion (float): Fracción del capital asignada a cada posición.
+        max_posiciones (int): Máximo de posiciones abiertas a la vez.
+        take_profit (float): Porcentaje de take profit.
+        stop_loss (float): Porcentaje de stop loss.
+        ejecucion (dict): Comisiones, deslizamiento y resolución intrabar (ver backtesting.crear_ejecucion).
+        verbose (bool): Si True, imprime el resumen.
+
+    Returns:
+        tuple: (curva, operaciones, atribucion)
+            curva (pd.DataFrame): Una fila por fecha de cualquier símbolo con 'date', 'efectivo',
+                                  'invertido' (a coste), 'valor_posiciones' (a mercado, ver
+                                  valorar_posiciones), 'capital' (efectivo + valor_posiciones)
+                                  y 'posiciones'.
+            operaciones (pd.DataFrame): Una fila por operación ejecutada.
+            atribucion (pd.DataFrame): Por símbolo, operaciones, rechazadas, beneficio y su peso.
+    """
+    if not 0 < tamano_posicion <= 1:
+        raise ValueError("tamano_posicion debe estar entre 0 y 1.")
+
+    datos = {simbolo: valores if isinstance(valores, dict) else arrays_simbolo(valores)
+             for simbolo, valores in predicciones.items()}
+    ejecuciones = {simbolo: preparar_ejecucion(ejecucion, arrays['date']) for simbolo, arrays in datos.items()}
+
+    efectivo, invertido = float(capital_inicial), 0.0
+    abiertas = []           # heap de (fecha de salida, simbolo, operación)
+    bloqueado_hasta = {}    # vela de salida de la última posición de cada símbolo
+    rechazadas = dict.fromkeys(datos, 0)
+    tramos = {simbolo: [] for simbolo in datos}  # velas de cada operación para valorar a mercado
+    operaciones = []
+
+    def cerrar_hasta(fecha):
+        nonlocal efectivo, invertido
+        while abiertas and abiertas[0][0] <= fecha:
+            _, _, operacion = heapq.heappop(abiertas)
+            efectivo += operacion['asignado'] * (1 + operacion['gain'])
+            invertido -= operacion['asignado']
+
+    flujos = [flujo_senales(simbolo, arrays) for simbolo, arrays in sorted(datos.items())]
+    for fecha, simbolo, indice in heapq.merge(*flujos):
+        cerrar_hasta(fecha)
+
+        if indice <= bloqueado_hasta.get(simbolo, -1):
+            continue  # Posición abierta (o cerrada en esta vela) en el mismo símbolo
+
+        asignado = min(tamano_posicion * (efectivo + invertido), efectivo)
+        if len(abiertas) >= max_posiciones or asignado <= 0:
+            rechazadas[simbolo] += 1
+            continue
+
+        arrays = datos[simbolo]
+        salida, entry_price, exit_price, reason, gain = resolver_operacion(
+            arrays['open'], arrays['high'], arrays['low'], arrays['close'], indice, take_profit, stop_loss,
+            ejecuciones[simbolo], arrays['date'])
+        bloqueado_hasta[simbolo] = salida
+
+        operacion = {
+            'simbolo': simbolo,
+            'entry_date': fecha,
+            'exit_date': int(arrays['date'][salida]),
+            'entry_price': entry_price,
+            'exit_price': exit_price,
+            'exit_reason': reason,
+            'gain': gain,
+            'asignado': asignado,
+            'beneficio': asignado * gain,
+        }
+        operaciones.append(operacion)
+        tramos[simbolo].append((indice, salida, entry_price, asignado))
+        efectivo -= asignado
+        invertido += asignado
+        heapq.heappush(abiertas, (operacion['exit_date'], simbolo, operacion))
+
+    cerrar_hasta(np.iinfo(np.int64).max)
+
+    operaciones = pd.DataFrame(operaciones, columns=['simbolo', 'entry_date', 'exit_date', 'entry_price',
+                                                     'exit_price', 'exit_reason', 'gain', 'asignado', 'beneficio'])
+
+    # Curva en cada fecha: efectivo e invertido por eventos de entrada/salida y posiciones a mercado
+    fechas = np.unique(np.concatenate([arrays['date'] for arrays in datos.values()] or [np.empty(0, np.int64)]))
+    fechas_eventos = np.concatenate([operaciones['entry_date'].to_numpy(dtype=np.int64),
+                                     operaciones['exit_date'].to_numpy(dtype=np.int64)])
+    asignados = operaciones['asignado'].to_numpy(dtype=float)
+    devueltos = asignados * (1 + operaciones['gain'].to_numpy(dtype=float))
+    unos = np.ones(len(operaciones))
+    curva = pd.DataFrame({
+        'date': pd.to_datetime(fechas),
+        'efectivo': capital_inicial + acumular_eventos(fechas_eventos, np.concatenate([-asignados, devueltos]), fechas),
+        'invertido': acumular_eventos(fechas_eventos, np.concatenate([asignados, -asignados]), fechas),
+        'valor_posiciones': valorar_posiciones(datos, tramos, fechas),
+        'posiciones': acumular_eventos(fechas_eventos, np.concatenate([unos, -unos]), fechas).round().astype(np.int64),
+    })
+    curva.insert(4, 'capital', curva['efectivo'] + curva['valor_posiciones'])
+
+    for col in ('entry_date', 'exit_date'):
+        operaciones[col] = pd.to_datetime(operaciones[col].to_numpy(dtype=np.int64))
+
+    por_simbolo = operaciones.groupby('simbolo')
+    atribucion = pd.DataFrame({
+        'operaciones': por_simbolo.size(),
+        'TP': por_simbolo['exit_reason'].apply(lambda razones: int((razones == 'TP').sum())),
+        'SL': por_simbolo['exit_reason'].apply(lambda razones: int((razones == 'SL').sum())),
+        'End': por_simbolo['exit_reason'].apply(lambda razones: int((razones == 'End').sum())),
+        'asignado': por_simbolo['asignado'].sum(),
+        'beneficio': por_simbolo['beneficio'].sum(),
+    }).reindex(sorted(datos)).fillna(0)
+    atribucion['rechazadas'] = pd.Series(rechazadas)
+    beneficio_total = atribucion['beneficio'].sum()
+    atribucion['peso_beneficio'] = atribucion['beneficio'] / beneficio_total if beneficio_total else 0.0
+    atribucion.index.name = 'simbolo'
+    atribucion = atribucion.reset_index()
+
+    if verbose:
+        capital_final = efectivo + invertido
+        log(f"✅ Cartera de {len(datos)} símbolos: capital {capital_inicial:.2f} → {capital_final:.2f} "
+            f"({(capital_final / capital_inicial - 1) * 100:.2f}%), {len(operaciones)} operaciones, "
+            f"{sum(rechazadas.values())} señales rechazadas")
+        for fila in atribucion.itertuples():
+            log(f"   {fila.simbolo:<12} {int(fila.operaciones):>5} operaciones  beneficio {fila.beneficio:10.2f}")
+
+    return curva, operaciones, atribucion
@@ -1,38 +1,242 @@
+import os
+import sys
+
 import pandas as pd
 
-def lecturaYescritura():
-    # Leer datos
-    df = pd.read_csv('btcusd_1-min_data.csv')
-
-    # Convertir timestamp a datetime
-    df['date'] = pd.to_datetime(df['Timestamp'], unit='s', utc=True)
-    df.set_index('date', inplace=True)
-
-    # Renombrar columna Open a price
-    df.rename(columns={'Open': 'price'}, inplace=True)
-
-    # Crear OHLC a 10 minutos
-    df_10m = df.resample('10T').agg({
-        'price': 'first',
-        'High': 'max',
-        'Low': 'min',
-        'Close': 'last',
-        'Volume': 'sum'
-    })
-
-    # Renombrar columnas
-    df_10m.rename(columns={
-        'price': 'open',
-        'High': 'high',
-        'Low': 'low',
-        'Close': 'close',
-        'Volume': 'volume'
-    }, inplace=True)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from almacen import existe_almacen, guardar_almacen, anexar_almacen, recortar_almacen, cargar_almacen, leer_meta, ruta_almacen
+from instrumentacion import log
+
+CAMBIO_1M = 'btcusd_1m'
+RUTA_1M = 'btcusd_1-min_data.csv'
+
+# Filas del CSV de 1 minuto leídas a la vez: la memoria no depende del tamaño del fichero
+TAM_BLOQUE = 1_000_000
+
+AGREGACION = {
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum'
+}
+
+def leer_1m_por_bloques(ruta_csv=RUTA_1M, tam_bloque=TAM_BLOQUE, desde=None):
+    """
+    Lee el CSV de velas de 1 minuto por bloques de tam_bloque filas.
+
+    Args:
+        ruta_csv (str): CSV con columnas Timestamp (segundos), Open, High, Low, Close, Volume.
+        tam_bloque (int): Filas por bloque.
+        desde: Si se indica, solo se devuelven los minutos con fecha >= desde.
+
+    Yields:
+        pd.DataFrame: Bloque con 'date' (UTC sin zona) y OHLCV en minúsculas.
+    """
+    desde = None if desde is None else pd.Timestamp(desde)
+    ultima = None
+
+    for bloque in pd.read_csv(ruta_csv, chunksize=tam_bloque):
+        # Convertir timestamp a datetime
+        bloque['date'] = pd.to_datetime(bloque['Timestamp'], unit='s')
+        bloque = bloque.drop(columns=['Timestamp']).rename(columns={
+            'Open': 'open',
+            'High': 'high',
+            'Low': 'low',
+            'Close': 'close',
+            'Volume': 'volume'
+        })[['date', 'open', 'high', 'low', 'close', 'volume']]
+
+        fechas = bloque['date']
+        if not fechas.is_monotonic_increasing or (ultima is not None and len(fechas) and fechas.iloc[0] < ultima):
+            raise ValueError(f"{ruta_csv} no está ordenado por Timestamp; no se puede leer por bloques.")
+        if len(fechas):
+            ultima = fechas.iloc[-1]
 
+        if desde is not None:
+            bloque = bloque[fechas >= desde]
+        if len(bloque):
+            yield bloque.reset_index(drop=True)
+
+def remuestrear_bloques(bloques, frecuencias):
+    """
+    Agrega bloques de velas de 1 minuto a varias temporalidades en una sola lectura.
+
+    Los minutos de la última vela de cada bloque (que puede seguir en el bloque siguiente) se
+    guardan y se añaden delante del siguiente bloque, así que cada vela se agrega con todos sus
+    minutos y el resultado es el mismo que remuestrear el fichero entero. Las velas se alinean
+    a la medianoche (origin='epoch'), igual que resample con las temporalidades que dividen el día.
+
+    Args:
+        bloques (iterable): DataFrames de leer_1m_por_bloques.
+        frecuencias (list): Temporalidades de pandas (ej: '5min', '10min', '1h', '4h').
+
+    Yields:
+        tuple: (frecuencia, DataFrame de velas cerradas con 'date' en UTC). La última vela de
+               cada frecuencia se emite al final y puede estar incompleta.
+    """
+    arrastre = {frecuencia: None for frecuencia in frecuencias}
+
+    for bloque in bloques:
+        for frecuencia in frecuencias:
+            minutos = bloque if arrastre[frecuencia] is None else pd.concat([arrastre[frecuencia], bloque], ignore_index=True)
+            velas = minutos.resample(frecuencia, on='date', origin='epoch').agg(AGREGACION)
+
+            # La última vela puede continuar en el siguiente bloque
+            arrastre[frecuencia] = minutos[minutos['date'] >= velas.index[-1]]
+            yield frecuencia, formatear_velas(velas.iloc[:-1])
+
+    for frecuencia, minutos in arrastre.items():
+        if minutos is not None:
+            yield frecuencia, formatear_velas(minutos.resample(frecuencia, on='date', origin='epoch').agg(AGREGACION))
+
+def formatear_velas(velas):
     # Eliminar filas con datos faltantes (por huecos)
-    df_10m.dropna(inplace=True)
+    velas = velas.dropna()
+    velas.index = velas.index.tz_localize('UTC')
+    return velas.reset_index()  # Devolver con fecha como columna
+
+def ultima_fecha_csv(ruta):
+    """Fecha de la última vela de un CSV de velas (sin leerlo entero), o None si está vacío."""
+    with open(ruta, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        posicion = f.tell()
+        bloque = b''
+        while posicion > 0 and bloque.count(b'\n') < 3:
+            paso = min(4096, posicion)
+            posicion -= paso
+            f.seek(posicion)
+            bloque = f.read(paso) + bloque
+    lineas = bloque.strip().split(b'\n')
+    if len(lineas) < 2 and posicion == 0:
+        return None  # Solo cabecera
+    return pd.Timestamp(lineas[-1].split(b',')[0].decode())
+
+def recortar_csv(ruta):
+    """Elimina la última línea de un CSV truncando el fichero."""
+    with open(ruta, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        fin = f.tell()
+        posicion = fin
+        while posicion > 0:
+            paso = min(4096, posicion)
+            f.seek(posicion - paso)
+            trozo = f.read(paso)
+            # Salto de línea anterior a la última línea (ignorando el final del fichero)
+            corte = trozo.rfind(b'\n', 0, paso - (1 if posicion == fin else 0))
+            if corte >= 0:
+                f.truncate(posicion - paso + corte + 1)
+                return
+            posicion -= paso
+
+def ultima_fecha(cambio, formato):
+    if formato == 'almacen':
+        if not existe_almacen(cambio) or leer_meta(ruta_almacen(cambio))['filas'] == 0:
+            return None
+        fechas = cargar_almacen(cambio, columnas=[], como_arrays=True)['date']
+        return pd.Timestamp(int(fechas[-1]), tz='UTC')
+    ruta = f'data/{cambio}.csv'
+    return ultima_fecha_csv(ruta) if os.path.exists(ruta) else None
+
+def remuestrear_1m(ruta_csv=RUTA_1M, destinos=None, formatos=('csv', 'almacen'), anexar=True,
+                   tam_bloque=TAM_BLOQUE):
+    """
+    Genera las velas de varias temporalidades leyendo el CSV de 1 minuto por bloques.
+
+    Con anexar=True solo se procesan los minutos desde la última vela guardada de cada destino;
+    esa vela se elimina antes (pudo guardarse incompleta) y se vuelve a escribir completa.
+
+    Args:
+        ruta_csv (str): CSV de velas de 1 minuto.
+        destinos (dict): {frecuencia: cambio}, ej: {'10min': 'BTCUSDT', '1h': 'BTCUSDT_1h'}.
+        formatos (tuple): 'csv' (data/{cambio}.csv) y/o 'almacen' (data/{cambio}/, ver almacen.py).
+        anexar (bool): Si False, se rehacen los destinos desde cero.
+        tam_bloque (int): Filas del CSV de 1 minuto leídas a la vez.
+
+    Returns:
+        dict: {cambio: velas escritas}
+    """
+    destinos = destinos or {'10min': 'BTCUSDT'}
+
+    # Desde dónde rehacer cada destino (None = desde el principio)
+    desde = {}
+    for frecuencia, cambio in destinos.items():
+        fechas = [ultima_fecha(cambio, formato) for formato in formatos] if anexar else [None]
+        desde[frecuencia] = None if any(fecha is None for fecha in fechas) else min(fechas)
+
+    for frecuencia, cambio in destinos.items():
+        for formato in formatos:
+            if desde[frecuencia] is None:
+                borrar_destino(cambio, formato)
+            else:
+                quitar_desde(cambio, formato, desde[frecuencia])
+
+    inicio = None if any(fecha is None for fecha in desde.values()) else min(desde.values()).tz_localize(None)
+    escritas = {cambio: 0 for cambio in destinos.values()}
+
+    bloques = leer_1m_por_bloques(ruta_csv, tam_bloque=tam_bloque, desde=inicio)
+    for frecuencia, velas in remuestrear_bloques(bloques, list(destinos)):
+        if desde[frecuencia] is not None:
+            velas = velas[velas['date'] >= desde[frecuencia]]
+        if velas.empty:
+            continue
+        cambio = destinos[frecuencia]
+        for formato in formatos:
+            escribir_velas(velas, cambio, formato)
+        escritas[cambio] += len(velas)
+
+    for cambio, filas in escritas.items():
+        log(f"✅ {cambio}: {filas} velas escritas")
+    return escritas
+
+def borrar_destino(cambio, formato):
+    if formato == 'csv':
+        if os.path.exists(f'data/{cambio}.csv'):
+            os.remove(f'data/{cambio}.csv')
+    elif existe_almacen(cambio):
+        recortar_almacen(cambio, leer_meta(ruta_almacen(cambio))['filas'])
+
+def quitar_desde(cambio, formato, fecha):
+    """Quita del destino las velas con fecha >= fecha (en la práctica, la última)."""
+    if formato == 'csv':
+        ruta = f'data/{cambio}.csv'
+        while (ultima := ultima_fecha_csv(ruta)) is not None and ultima >= fecha:
+            recortar_csv(ruta)
+    else:
+        fechas = cargar_almacen(cambio, columnas=[], como_arrays=True)['date']
+        sobran = len(fechas) - int(fechas.searchsorted(fecha.tz_convert('UTC').tz_localize(None).value, side='left'))
+        recortar_almacen(cambio, sobran)
+
+def escribir_velas(velas, cambio, formato):
+    if formato == 'csv':
+        ruta = f'data/{cambio}.csv'
+        velas.to_csv(ruta, mode='a', header=not os.path.exists(ruta), index=False)
+    elif existe_almacen(cambio) and leer_meta(ruta_almacen(cambio))['filas'] > 0:
+        anexar_almacen(velas, cambio)
+    else:
+        guardar_almacen(velas, cambio)
+
+def convertir_datos_1m(ruta_csv=RUTA_1M, tam_bloque=TAM_BLOQUE):
+    """
+    Convierte el CSV de velas de 1 minuto al almacén columnar 'data/btcusd_1m/' por bloques.
+    Si el almacén ya existe, solo se añaden los minutos posteriores al último guardado.
+    """
+    ultima = ultima_fecha(CAMBIO_1M, 'almacen')
+    desde = None if ultima is None else ultima.tz_localize(None) + pd.Timedelta(seconds=1)
+
+    for bloque in leer_1m_por_bloques(ruta_csv, tam_bloque=tam_bloque, desde=desde):
+        if existe_almacen(CAMBIO_1M) and leer_meta(ruta_almacen(CAMBIO_1M))['filas'] > 0:
+            anexar_almacen(bloque, CAMBIO_1M)
+        else:
+            guardar_almacen(bloque, CAMBIO_1M)
+
+    return ruta_almacen(CAMBIO_1M)
 
-    return df_10m.reset_index()  # Devolver con fecha como columna
+def lecturaYescritura(frecuencia='10min', ruta_csv=RUTA_1M):
+    """Devuelve las velas de una temporalidad leyendo el CSV de 1 minuto por bloques."""
+    partes = [velas for _, velas in remuestrear_bloques(leer_1m_por_bloques(ruta_csv), [frecuencia])]
+    return pd.concat(partes, ignore_index=True)
 
 if __name__ == "__main__":
-    lecturaYescritura().to_csv('data/BTCUSDT.csv', index=False)
+    convertir_datos_1m()
+    remuestrear_1m(destinos={'10min': 'BTCUSDT'}, formatos=('csv', 'almacen'))
@@ -0,0 +1,134 @@
+"""
+Inferencia en vivo: consume velas de una fuente, actualiza los indicadores de forma incremental
+y puntúa solo la vela nueva con un modelo ya cargado.
+"""
+
+import csv
+import json
+import os
+import socket
+import time
+
+import numpy as np
+
+from bosque import aplanar_bosque, es_bosque, predict_proba_bosque, proba_positiva
+from incremental import actualizar_vela
+
+COLUMNAS_VELA = ['open', 'high', 'low', 'close', 'volume']
+
+def leer_vela(registro):
+    vela = {'date': registro.get('date')}
+    for col in COLUMNAS_VELA:
+        if col in registro:
+            vela[col] = float(registro[col])
+    return vela
+
+def fuente_fichero(ruta, intervalo=0.5, desde_inicio=False, seguir=True):
+    """
+    Lee velas de un CSV a medida que se le añaden líneas (como 'tail -f').
+
+    Args:
+        ruta (str): CSV con cabecera (mismo formato que data/{cambio}.csv).
+        intervalo (float): Segundos de espera cuando no hay líneas nuevas.
+        desde_inicio (bool): Si True, emite también las velas ya existentes.
+        seguir (bool): Si False, termina al llegar al final del fichero.
+
+    Yields:
+        dict: Vela con 'date' y columnas OHLCV.
+    """
+    with open(ruta, newline='') as f:
+        cabecera = next(csv.reader([f.readline()]))
+        if not desde_inicio:
+            f.seek(0, os.SEEK_END)
+
+        pendiente = ''
+        while True:
+            linea = f.readline()
+            if not linea:
+                if not seguir:
+                    return
+                time.sleep(intervalo)
+                continue
+            pendiente += linea
+            if not pendiente.endswith('\n'):
+                continue  # Línea a medio escribir
+            yield leer_vela(dict(zip(cabecera, next(csv.reader([pendiente.strip()])))))
+            pendiente = ''
+
+def fuente_socket(host='127.0.0.1', port=9999):
+    """
+    Lee velas de un socket TCP local, una vela por línea en JSON (sustituto del feed del exchange).
+
+    Yields:
+        dict: Vela con 'date' y columnas OHLCV.
+    """
+    with socket.create_connection((host, port)) as conexion, conexion.makefile('r') as lector:
+        for linea in lector:
+            if linea.strip():
+                yield leer_vela(json.loads(linea))
+
+def servicio_inferencia(fuente, model, feature_cols, estado, threshold=0.5):
+    """
+    Emite una señal por cada vela de la fuente.
+
+    Para cada vela se actualiza el estado de los indicadores (ver incremental.py), se rellena un
+    vector de features preasignado y se puntúa solo esa fila, sin construir DataFrames. Si el
+    modelo es un bosque, se aplana una vez (bosque.py) y cada fila se puntúa recorriendo los
+    arrays, sin el coste fijo por llamada de predict_proba.
+
+    Args:
+        fuente (iterable): Velas de fuente_fichero, fuente_socket o cualquier iterable de dicts.
+        model: Modelo ya entrenado (ej. RandomForest) o dict de arrays de aplanar_bosque
+               (ej. registro_modelos.cargar_modelo(clave)['arrays']).
+        feature_cols (list): Columnas usadas al entrenar, en el mismo orden.
+        estado (dict): Estado de incremental.crear_estado/cargar_estado inicializado con la historia.
+        threshold (float): Umbral de probabilidad para decidir True/False.
+
+    Yields:
+        dict: {'date', 'pred_proba', 'model_pred', 'latencia_ms'}.
+    """
+    disponibles = set(COLUMNAS_VELA) | set(estado['rsi']) | set(estado['ema']) | set(estado['cross'])
+    faltan = [col for col in feature_cols if col not in disponibles]
+    if faltan:
+        raise ValueError(f"El estado incremental no calcula las features: {faltan}")
+
+    X = np.zeros((1, len(feature_cols)))
+    fila = X[0]
+    arrays = model if isinstance(model, dict) else (aplanar_bosque(model) if es_bosque(model) else None)
+    tiene_proba = hasattr(model, "predict_proba")
+
+    for vela in fuente:
+        inicio = time.perf_counter()
+
+        valores = actualizar_vela(estado, vela[estado['price_col']])
+        valores.update(vela)
+        for i, col in enumerate(feature_cols):
+            valor = valores[col]
+            fila[i] = 0.0 if valor != valor else valor  # igual que fillna(0)
+
+        if arrays is not None:
+            proba = float(predict_proba_bosque(arrays, X)[0])
+        elif tiene_proba:
+            proba = float(proba_positiva(model, X)[0])
+        else:
+            proba = float(model.predict(X)[0])
+
+        yield {
+            'date': vela.get('date'),
+            'pred_proba': proba,
+            'model_pred': proba >= threshold,
+            'latencia_ms': (time.perf_counter() - inicio) * 1000,
+        }
+
+def estadisticas_latencia(senales):
+    """Resume las latencias (ms) de una lista de señales de servicio_inferencia."""
+    latencias = np.array([senal['latencia_ms'] for senal in senales])
+    if latencias.size == 0:
+        return {}
+    return {
+        'velas': int(latencias.size),
+        'media_ms': float(latencias.mean()),
+        'p50_ms': float(np.percentile(latencias, 50)),
+        'p99_ms': float(np.percentile(latencias, 99)),
+        'max_ms': float(latencias.max()),
+    }
@@ -0,0 +1,276 @@
+"""
+Pipeline declarativo de indicadores.
+
+Se describe la lista de indicadores como specs, ej:
+
+    specs = [
+        {'tipo': 'rsi', 'period': 14},                # metodo 'sma' (defecto) o 'wilder'
+        {'tipo': 'ema', 'period': 12},
+        {'tipo': 'ema_cross', 'fast': 12, 'slow': 26},
+        {'tipo': 'macd', 'fast': 12, 'slow': 26, 'signal': 9},
+        {'tipo': 'bollinger', 'period': 20, 'k': 2},
+        {'tipo': 'atr', 'period': 14},
+        {'tipo': 'volatilidad', 'period': 20},
+        {'tipo': 'volumen_z', 'period': 20},
+        {'tipo': 'retornos', 'lags': [1, 3, 6]},
+    ]
+
+y se calculan todos en una sola pasada sobre una matriz float32 preasignada. Los cálculos
+intermedios (la misma EMA, el mismo diff, la misma media móvil...) se hacen una sola vez
+aunque los usen varios indicadores.
+
+Los mismos specs se pueden calcular en temporalidades mayores que la de las velas base
+(add_features_multitemporal), ej: {'1h': [{'tipo': 'rsi', 'period': 14}]} añade 'rsi_14_1h'.
+"""
+
+import numpy as np
+import pandas as pd
+
+from almacen import columnas_a_arrays
+from functions import calcular_rsi
+from instrumentacion import log
+
+AGREGACION_VELAS = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+
+def nombres_spec(spec):
+    """Nombres de las columnas que genera un spec, en orden."""
+    tipo = spec['tipo']
+    if tipo == 'rsi':
+        return [f"rsi_{spec.get('period', 14)}"]
+    if tipo == 'ema':
+        return [f"ema_{spec.get('period', 12)}"]
+    if tipo == 'ema_cross':
+        return [f"ema_cross_signal_{spec.get('fast', 12)}_{spec.get('slow', 26)}"]
+    if tipo == 'macd':
+        fast, slow, signal = spec.get('fast', 12), spec.get('slow', 26), spec.get('signal', 9)
+        return [f'macd_{fast}_{slow}', f'macd_signal_{fast}_{slow}_{signal}', f'macd_hist_{fast}_{slow}_{signal}']
+    if tipo == 'bollinger':
+        period, k = spec.get('period', 20), spec.get('k', 2)
+        return [f'bb_mid_{period}', f'bb_upper_{period}_{k}', f'bb_lower_{period}_{k}', f'bb_pctb_{period}_{k}']
+    if tipo == 'atr':
+        return [f"atr_{spec.get('period', 14)}"]
+    if tipo == 'volatilidad':
+        return [f"volatilidad_{spec.get('period', 20)}"]
+    if tipo == 'volumen_z':
+        return [f"volumen_z_{spec.get('period', 20)}"]
+    if tipo == 'retornos':
+        return [f'ret_{lag}' for lag in spec.get('lags', [1])]
+    raise ValueError(f"Tipo de indicador desconocido: '{tipo}'")
+
+def intermedio(memo, clave, calcular):
+    """Devuelve la serie intermedia memorizada con esa clave, calculándola la primera vez."""
+    if clave not in memo:
+        memo[clave] = calcular()
+    return memo[clave]
+
+def serie_columna(df, memo, col):
+    return intermedio(memo, ('col', col), lambda: df[col].astype(float))
+
+def serie_ema(df, memo, col, span):
+    return intermedio(memo, ('ema', col, span),
+                      lambda: serie_columna(df, memo, col).ewm(span=span, adjust=False).mean())
+
+def serie_media(memo, clave_serie, serie, window):
+    return intermedio(memo, ('media', clave_serie, window),
+                      lambda: serie.rolling(window=window, min_periods=window).mean())
+
+def serie_std(memo, clave_serie, serie, window):
+    return intermedio(memo, ('std', clave_serie, window),
+                      lambda: serie.rolling(window=window, min_periods=window).std())
+
+def serie_rango_verdadero(df, memo, price_col):
+    def calcular():
+        high, low = serie_columna(df, memo, 'high'), serie_columna(df, memo, 'low')
+        prev_close = serie_columna(df, memo, price_col).shift(1)
+        return pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
+    return intermedio(memo, ('true_range', price_col), calcular)
+
+def calcular_spec(spec, df, memo, price_col='close'):
+    """Devuelve la lista de series de un spec (mismo orden que nombres_spec)."""
+    tipo = spec['tipo']
+    precio = serie_columna(df, memo, price_col)
+
+    if tipo == 'rsi':
+        delta = intermedio(memo, ('diff', price_col, 1), lambda: precio.diff())
+        gain = intermedio(memo, ('gain', price_col), lambda: delta.clip(lower=0))
+        loss = intermedio(memo, ('loss', price_col), lambda: -delta.clip(upper=0))
+        return [calcular_rsi(gain, loss, period=spec.get('period', 14), metodo=spec.get('metodo', 'sma'))]
+
+    if tipo == 'ema':
+        return [serie_ema(df, memo, price_col, spec.get('period', 12))]
+
+    if tipo == 'ema_cross':
+        fast = serie_ema(df, memo, price_col, spec.get('fast', 12))
+        slow = serie_ema(df, memo, price_col, spec.get('slow', 26))
+        cond_up = (fast > slow) & (fast.shift(1) <= slow.shift(1))
+        cond_down = (fast < slow) & (fast.shift(1) >= slow.shift(1))
+        return [pd.Series(np.where(cond_up, 1, np.where(cond_down, -1, 0)), index=fast.index)]
+
+    if tipo == 'macd':
+        macd = serie_ema(df, memo, price_col, spec.get('fast', 12)) - serie_ema(df, memo, price_col, spec.get('slow', 26))
+        signal = macd.ewm(span=spec.get('signal', 9), adjust=False).mean()
+        return [macd, signal, macd - signal]
+
+    if tipo == 'bollinger':
+        period, k = spec.get('period', 20), spec.get('k', 2)
+        mid = serie_media(memo, ('col', price_col), precio, period)
+        std = serie_std(memo, ('col', price_col), precio, period)
+        upper, lower = mid + k * std, mid - k * std
+        return [mid, upper, lower, (precio - lower) / (upper - lower)]
+
+    if tipo == 'atr':
+        # Suavizado de Wilder (alpha = 1 / period)
+        period = spec.get('period', 14)
+        rango = serie_rango_verdadero(df, memo, price_col)
+        return [rango.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()]
+
+    if tipo == 'volatilidad':
+        log_ret = intermedio(memo, ('log_ret', price_col), lambda: np.log(precio).diff())
+        return [serie_std(memo, ('log_ret', price_col), log_ret, spec.get('period', 20))]
+
+    if tipo == 'volumen_z':
+        period = spec.get('period', 20)
+        volumen = serie_columna(df, memo, 'volume')
+        media = serie_media(memo, ('col', 'volume'), volumen, period)
+        std = serie_std(memo, ('col', 'volume'), volumen, period)
+        return [(volumen - media) / std]
+
+    if tipo == 'retornos':
+        return [precio / precio.shift(lag) - 1 for lag in spec.get('lags', [1])]
+
+    raise ValueError(f"Tipo de indicador desconocido: '{tipo}'")
+
+def calcular_features(df, specs, price_col='close', dtype=np.float32):
+    """
+    Calcula todos los indicadores de specs en una matriz preasignada.
+
+    Args:
+        df (pd.DataFrame): Velas con 'close' (y 'high', 'low', 'volume' si los specs los usan).
+        specs (list[dict]): Indicadores a calcular (ver cabecera del módulo).
+        price_col (str): Columna de precio base.
+        dtype: Tipo de la matriz de salida.
+
+    Returns:
+        tuple: (matriz np.ndarray de forma (len(df), n_features), lista de nombres de columna)
+    """
+    nombres = []
+    for spec in specs:
+        for nombre in nombres_spec(spec):
+            if nombre not in nombres:
+                nombres.append(nombre)
+
+    matriz = np.empty((len(df), len(nombres)), dtype=dtype)
+    posiciones = {nombre: i for i, nombre in enumerate(nombres)}
+    memo = {}
+
+    for spec in specs:
+        for nombre, serie in zip(nombres_spec(spec), calcular_spec(spec, df, memo, price_col)):
+            matriz[:, posiciones[nombre]] = serie.to_numpy()
+
+    return matriz, nombres
+
+def add_features(df, specs, price_col='close', verbose=True):
+    """
+    Añade al DataFrame las columnas de calcular_features de una sola vez.
+
+    Returns:
+        tuple: (DataFrame con las nuevas columnas, lista de nombres de las features)
+    """
+    matriz, nombres = calcular_features(df, specs, price_col=price_col)
+    nuevas = pd.DataFrame(matriz, columns=nombres, index=df.index)
+    df = pd.concat([df.drop(columns=nombres, errors='ignore'), nuevas], axis=1)
+
+    if verbose:
+        log(f"✅ Añadidas {len(nombres)} features: {', '.join(nombres)}")
+
+    return df, nombres
+
+def velas_temporalidad(df, temporalidad, price_col='close'):
+    """
+    Agrega las velas base a una temporalidad mayor (ej. '1h', '4h').
+
+    Returns:
+        pd.DataFrame: Velas con 'date' (inicio de la vela) y las columnas OHLCV disponibles.
+    """
+    agregacion = {col: funcion for col, funcion in AGREGACION_VELAS.items() if col in df.columns}
+    agregacion.setdefault(price_col, 'last')
+    velas = df.resample(temporalidad, on='date', origin='epoch').agg(agregacion)
+    return velas.dropna(subset=[price_col]).reset_index()
+
+def alinear_temporalidad(fechas_base, duracion_base, cierres, valores):
+    """
+    Lleva a cada vela base los valores de la última vela mayor ya cerrada al cerrar la vela base.
+
+    Args:
+        fechas_base (np.ndarray): Inicio de cada vela base (int64 ns).
+        duracion_base (int): Duración de la vela base (ns).
+        cierres (np.ndarray): Cierre de cada vela mayor (int64 ns, ordenado).
+        valores (np.ndarray): Valores por vela mayor (filas, columnas).
+
+    Returns:
+        np.ndarray: Valores por vela base (NaN si todavía no hay ninguna vela mayor cerrada).
+    """
+    posiciones = np.searchsorted(cierres, fechas_base + duracion_base, side='right') - 1
+    alineados = valores[np.maximum(posiciones, 0)]
+    alineados[posiciones < 0] = np.nan
+    return alineados
+
+def calcular_features_multitemporal(df, specs_temporalidades, price_col='close', duracion_base=None,
+                                    dtype=np.float32):
+    """
+    Calcula specs en temporalidades mayores y los alinea con las velas base sin mirar al futuro.
+
+    Para cada temporalidad se construyen sus velas a partir de las base, se calculan los
+    indicadores con calcular_features y cada vela base recibe los de la última vela mayor que
+    haya cerrado como tarde al cierre de la vela base (unión as-of con búsqueda binaria).
+
+    Args:
+        df (pd.DataFrame): Velas base con 'date' y precios.
+        specs_temporalidades (dict): {temporalidad: specs}, ej: {'1h': [...], '4h': [...]}.
+        price_col (str): Columna de precio base.
+        duracion_base: Duración de la vela base (por defecto, la mediana entre fechas).
+        dtype: Tipo de la matriz de salida.
+
+    Returns:
+        tuple: (matriz np.ndarray de forma (len(df), n_features), lista de nombres '{feature}_{temporalidad}')
+    """
+    fechas = columnas_a_arrays(df[['date']])['date']
+    if duracion_base is None:
+        if len(fechas) < 2:
+            raise ValueError("No se puede deducir la duración de las velas base; indica duracion_base.")
+        duracion_base = int(np.median(np.diff(np.sort(fechas))))
+    else:
+        duracion_base = pd.Timedelta(duracion_base).value
+
+    bloques, nombres = [], []
+    for temporalidad, specs in specs_temporalidades.items():
+        duracion = pd.Timedelta(temporalidad).value
+        if duracion <= duracion_base:
+            raise ValueError(f"La temporalidad '{temporalidad}' no es mayor que la de las velas base.")
+
+        velas = velas_temporalidad(df, temporalidad, price_col)
+        matriz, nombres_tf = calcular_features(velas, specs, price_col=price_col, dtype=np.float64)
+        cierres = columnas_a_arrays(velas[['date']])['date'] + duracion
+
+        bloques.append(alinear_temporalidad(fechas, duracion_base, cierres, matriz).astype(dtype))
+        nombres.extend(f'{nombre}_{temporalidad}' for nombre in nombres_tf)
+
+    matriz = np.hstack(bloques) if bloques else np.empty((len(df), 0), dtype=dtype)
+    return matriz, nombres
+
+def add_features_multitemporal(df, specs_temporalidades, price_col='close', duracion_base=None, verbose=True):
+    """
+    Añade al DataFrame las columnas de calcular_features_multitemporal.
+
+    Returns:
+        tuple: (DataFrame con las nuevas columnas, lista de nombres de las features)
+    """
+    matriz, nombres = calcular_features_multitemporal(df, specs_temporalidades, price_col=price_col,
+                                                      duracion_base=duracion_base)
+    nuevas = pd.DataFrame(matriz, columns=nombres, index=df.index)
+    df = pd.concat([df.drop(columns=nombres, errors='ignore'), nuevas], axis=1)
+
+    if verbose:
+        log(f"✅ Añadidas {len(nombres)} features multitemporales: {', '.join(nombres)}")
+
+    return df, nombres
@@ -1,27 +1,83 @@
+import math
+
+import numpy as np
 import pandas as pd
 
-def read_data(cambio: str):
-    df = pd.read_csv(f'data/{cambio}.csv')
+from almacen import existe_almacen, cargar_almacen
+from instrumentacion import log
+
+def read_data(cambio: str, columnas=None, desde=None, hasta=None):
+    """
+    Carga las velas de un par, ordenadas por fecha.
+
+    Si existe el almacén columnar 'data/{cambio}/' (ver almacen.py) se mapea desde disco leyendo
+    solo las columnas y el rango de fechas pedidos; si no, se lee 'data/{cambio}.csv'.
+
+    Args:
+        cambio (str): Nombre del par (ej: 'BTCUSDT').
+        columnas (list): Columnas a cargar además de 'date' (por defecto todas).
+        desde, hasta: Rango de fechas [desde, hasta) a cargar (por defecto todo).
+
+    Returns:
+        pd.DataFrame con columna 'date' y las columnas pedidas.
+    """
+    if existe_almacen(cambio):
+        return cargar_almacen(cambio, columnas=columnas, desde=desde, hasta=hasta)
+
+    usecols = None if columnas is None else ['date'] + [col for col in columnas if col != 'date']
+    df = pd.read_csv(f'data/{cambio}.csv', usecols=usecols)
 
     df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d %H:%M:%S+00:00')
 
     # Ordenamos por fecha de menos a mayor
     df.sort_values(by='date', inplace=True)
 
+    if desde is not None:
+        df = df[df['date'] >= pd.Timestamp(desde)]
+    if hasta is not None:
+        df = df[df['date'] < pd.Timestamp(hasta)]
+
     return df
 
-def save_checkpoint(df, moneda):
-    """
-    Guarda el DataFrame en un archivo CSV con el nombre de la moneda _ el nombre de todas las columnas excepto las 6 primeras.
+def leer_por_bloques(cambio: str, tam_bloque=1_000_000, columnas=None, desde=None, hasta=None):
     """
+    Lee las velas de un par por bloques de tam_bloque filas, sin cargar la historia entera.
+
+    Con almacén columnar cada bloque se copia desde los ficheros mapeados; con CSV se lee por
+    trozos (el CSV debe estar ordenado por fecha).
+
+    Args:
+        cambio (str): Nombre del par (ej: 'BTCUSDT').
+        tam_bloque (int): Filas por bloque.
+        columnas (list): Columnas a cargar además de 'date' (por defecto todas).
+        desde, hasta: Rango de fechas [desde, hasta) a cargar (por defecto todo).
 
-    nombre_columnas = df.columns[6:].tolist()
-    if not nombre_columnas:
-        print("⚠️ No hay columnas para guardar.")
+    Yields:
+        pd.DataFrame: Bloques consecutivos con columna 'date' y las columnas pedidas.
+    """
+    if existe_almacen(cambio):
+        arrays = cargar_almacen(cambio, columnas=columnas, desde=desde, hasta=hasta, como_arrays=True)
+        filas = len(arrays['date'])
+        for inicio in range(0, filas, tam_bloque):
+            bloque = {col: np.array(valores[inicio:inicio + tam_bloque]) for col, valores in arrays.items()}
+            bloque['date'] = bloque['date'].view('datetime64[ns]')
+            yield pd.DataFrame(bloque)[list(arrays)]
         return
-    nombre_archivo = f'checkpoints/{moneda}_{"_".join(nombre_columnas)}.csv'
-    df.to_csv(nombre_archivo, index=False)
-    print(f"✅ Checkpoint guardado como {nombre_archivo}")
+
+    usecols = None if columnas is None else ['date'] + [col for col in columnas if col != 'date']
+    ultima = None
+    for df in pd.read_csv(f'data/{cambio}.csv', usecols=usecols, chunksize=tam_bloque):
+        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d %H:%M:%S+00:00')
+        if not df['date'].is_monotonic_increasing or (ultima is not None and df['date'].iloc[0] < ultima):
+            raise ValueError(f"data/{cambio}.csv no está ordenado por fecha; no se puede leer por bloques.")
+        ultima = df['date'].iloc[-1]
+
+        if desde is not None:
+            df = df[df['date'] >= pd.Timestamp(desde)]
+        if hasta is not None:
+            df = df[df['date'] < pd.Timestamp(hasta)]
+        if len(df):
+            yield df.reset_index(drop=True)
 
 
 import pandas as pd
@@ -48,7 +104,112 @@ def filtrar_fecha(df, total_anios=5, eliminar_anios_final=1.0):
     return df_filtrado, df_eliminado
 
 
-def add_rsi(df, period=14, verbose=True):
+def media_wilder(serie, period):
+    """
+    Suavizado de Wilder: la primera media es la simple de los 'period' primeros valores (tras el
+    NaN inicial del diff) y después media_t = media_{t-1} + (valor_t - media_{t-1}) / period.
+    Se calcula en una sola pasada recursiva con ewm(alpha=1/period, adjust=False).
+    """
+    valores = serie.to_numpy(dtype=float, copy=True)
+    if len(valores) <= period:
+        return pd.Series(np.nan, index=serie.index)
+
+    valores[period] = math.fsum(valores[1:period + 1]) / period
+    valores[:period] = np.nan
+    return pd.Series(valores, index=serie.index).ewm(alpha=1 / period, adjust=False).mean()
+
+def continuar_ewm(serie, previo=None, **parametros):
+    """
+    ewm(adjust=False).mean() de un bloque continuando desde 'previo', el último valor de la media
+    en el bloque anterior (mismo resultado que sobre la serie entera).
+    """
+    if previo is None:
+        return serie.ewm(adjust=False, **parametros).mean()
+    extendida = pd.concat([pd.Series([previo], dtype=float), serie.astype(float)], ignore_index=True)
+    media = extendida.ewm(adjust=False, **parametros).mean().iloc[1:]
+    media.index = serie.index
+    return media
+
+def rsi_por_bloques(close, period, metodo, estado):
+    """
+    RSI de un bloque de cierres continuando desde el estado del bloque anterior.
+
+    Hasta tener la primera media de Wilder (o siempre con 'sma') se guardan los últimos cierres
+    y se calculan delante del bloque; después basta con el último cierre y las últimas medias.
+
+    Args:
+        close (pd.Series): Cierres del bloque.
+        period (int): Periodo del RSI.
+        metodo (str): 'wilder' o 'sma'.
+        estado (dict): Estado de la columna (vacío en el primer bloque; se modifica).
+
+    Returns:
+        pd.Series: RSI del bloque.
+    """
+    if metodo not in ('wilder', 'sma'):
+        raise ValueError(f"Método de RSI '{metodo}' no válido. Usa 'wilder' o 'sma'.")
+
+    if metodo == 'wilder' and 'gain' in estado:
+        delta = close.diff()
+        delta.iloc[0] = close.iloc[0] - estado['cierre']
+        gain = delta.clip(lower=0)
+        loss = -delta.clip(upper=0)
+        avg_gain = continuar_ewm(gain, estado['gain'], alpha=1 / period)
+        avg_loss = continuar_ewm(loss, estado['loss'], alpha=1 / period)
+    else:
+        cola = estado.get('cola', [])
+        serie = pd.concat([pd.Series(cola, dtype=float), close.astype(float)], ignore_index=True)
+        delta = serie.diff()
+        gain = delta.clip(lower=0)
+        loss = -delta.clip(upper=0)
+        if metodo == 'wilder':
+            avg_gain = media_wilder(gain, period)
+            avg_loss = media_wilder(loss, period)
+        else:
+            avg_gain = gain.rolling(window=period, min_periods=period).mean()
+            avg_loss = loss.rolling(window=period, min_periods=period).mean()
+        avg_gain = avg_gain.iloc[len(cola):].set_axis(close.index)
+        avg_loss = avg_loss.iloc[len(cola):].set_axis(close.index)
+
+        if metodo == 'wilder' and len(serie) > period:
+            estado.pop('cola', None)
+        else:
+            estado['cola'] = serie.iloc[-period:].tolist()
+
+    if metodo == 'wilder' and 'cola' not in estado:
+        estado['gain'] = float(avg_gain.iloc[-1])
+        estado['loss'] = float(avg_loss.iloc[-1])
+    estado['cierre'] = float(close.iloc[-1])
+
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+def calcular_rsi(gain, loss, period=14, metodo='sma'):
+    """
+    Calcula el RSI a partir de las series de subidas y bajadas.
+
+    Args:
+        gain, loss (pd.Series): Subidas y bajadas (positivas) de cada vela.
+        period (int): Número de velas del RSI.
+        metodo (str): 'sma' (medias móviles simples, el cálculo original y el de por defecto)
+                      o 'wilder' (suavizado de Wilder, el estándar de otras plataformas).
+
+    Returns:
+        pd.Series: RSI entre 0 y 100.
+    """
+    if metodo == 'wilder':
+        avg_gain = media_wilder(gain, period)
+        avg_loss = media_wilder(loss, period)
+    elif metodo == 'sma':
+        avg_gain = gain.rolling(window=period, min_periods=period).mean()
+        avg_loss = loss.rolling(window=period, min_periods=period).mean()
+    else:
+        raise ValueError(f"Método de RSI '{metodo}' no válido. Usa 'wilder' o 'sma'.")
+
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+def add_rsi(df, period=14, verbose=True, metodo='sma', estado=None):
 
     """
     Añade una columna RSI al DataFrame usando el precio de cierre.
@@ -58,6 +219,10 @@ def add_rsi(df, period=14, verbose=True):
         period (int): Número de velas pasadas que se usan para calcular el RSI. 
                       Valores típicos: 14 (clásico), 21, etc.
         verbose (bool): Si True, imprime una descripción del indicador al generarlo.
+        metodo (str): 'sma' (por defecto, medias simples como siempre) o 'wilder' (suavizado
+                      de Wilder). Con con_cache forma parte de la clave aunque no se pase.
+        estado (dict): Si se pasa, df es un bloque de una serie más larga y el cálculo continúa
+                       desde el bloque anterior (ver por_bloques.py); se actualiza para el siguiente.
 
     Returns:
         pd.DataFrame: DataFrame original con una nueva columna 'rsi_{period}'.
@@ -68,26 +233,57 @@ def add_rsi(df, period=14, verbose=True):
         Valores altos indican sobrecompra (>70), valores bajos indican sobreventa (<30).
     """
 
+    col_name = f'rsi_{period}'
+    if estado is not None:
+        df[col_name] = rsi_por_bloques(df['close'], period, metodo, estado.setdefault(col_name, {}))
+    else:
+        delta = df['close'].diff()
+        gain = delta.clip(lower=0)
+        loss = -delta.clip(upper=0)
+        df[col_name] = calcular_rsi(gain, loss, period=period, metodo=metodo)
+
+    if verbose:
+        log(f"✅ Añadido {col_name}: mide momentum (fuerza relativa) en los últimos {period} cierres. "
+            f"Valores >70 = sobrecompra, <30 = sobreventa.")
+
+    return df, col_name
+
+def add_rsi_multi(df, periods=(7, 14, 21, 28), verbose=True, metodo='sma', estado=None):
+    """
+    Añade varias columnas RSI calculando las subidas y bajadas una sola vez.
+
+    Args:
+        df (pd.DataFrame): DataFrame base con columnas 'close'.
+        periods (list[int]): Periodos de RSI a calcular.
+        verbose (bool): Si True, imprime las columnas añadidas.
+        metodo (str): 'wilder' o 'sma' (ver add_rsi).
+        estado (dict): Estado entre bloques (ver add_rsi).
+
+    Returns:
+        pd.DataFrame: DataFrame con las columnas 'rsi_{period}'.
+        col_names (list): Nombres de las columnas creadas.
+    """
+    if estado is not None:
+        for period in periods:
+            df, _ = add_rsi(df, period=period, verbose=False, metodo=metodo, estado=estado)
+        return df, [f'rsi_{period}' for period in periods]
+
     delta = df['close'].diff()
     gain = delta.clip(lower=0)
     loss = -delta.clip(upper=0)
 
-    avg_gain = gain.rolling(window=period, min_periods=period).mean()
-    avg_loss = loss.rolling(window=period, min_periods=period).mean()
-
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-
-    col_name = f'rsi_{period}'
-    df[col_name] = rsi
+    col_names = []
+    for period in periods:
+        col_name = f'rsi_{period}'
+        df[col_name] = calcular_rsi(gain, loss, period=period, metodo=metodo)
+        col_names.append(col_name)
 
     if verbose:
-        print(f"✅ Añadido {col_name}: mide momentum (fuerza relativa) en los últimos {period} cierres. "
-              f"Valores >70 = sobrecompra, <30 = sobreventa.")
+        log(f"✅ Añadidos {', '.join(col_names)}: RSI ({metodo}) para los periodos {list(periods)}.")
 
-    return df, col_name
+    return df, col_names
 
-def add_ema(df, period=12, price_col='close', verbose=True):
+def add_ema(df, period=12, price_col='close', verbose=True, estado=None):
     """
     Añade una columna EMA (media móvil exponencial) al DataFrame.
 
@@ -97,6 +293,7 @@ def add_ema(df, period=12, price_col='close', verbose=True):
                       Común usar 12, 26, 50, 100, 200 según el horizonte.
         price_col (str): Columna de precio sobre la que se calcula (por defecto 'close').
         verbose (bool): Si True, imprime descripción del indicador generado.
+        estado (dict): Estado entre bloques (ver add_rsi).
 
     Returns:
         pd.DataFrame: DataFrame con nueva columna 'ema_{period}'.
@@ -108,15 +305,20 @@ def add_ema(df, period=12, price_col='close', verbose=True):
         Cruces de EMAs (ej: EMA12 y EMA26) generan señales clásicas de entrada/salida.
     """
     col_name = f'ema_{period}'
-    df[col_name] = df[price_col].ewm(span=period, adjust=False).mean()
+    if estado is not None:
+        ema = continuar_ewm(df[price_col], estado.get(col_name), span=period)
+        estado[col_name] = float(ema.iloc[-1])
+        df[col_name] = ema
+    else:
+        df[col_name] = df[price_col].ewm(span=period, adjust=False).mean()
 
     if verbose:
-        print(f"✅ Añadido {col_name}: media móvil exponencial sobre {price_col} en {period} velas. "
-              f"Señala tendencias con mayor sensibilidad que una SMA.")
+        log(f"✅ Añadido {col_name}: media móvil exponencial sobre {price_col} en {period} velas. "
+            f"Señala tendencias con mayor sensibilidad que una SMA.")
 
     return df, col_name
 
-def add_ema_cross(df, fast=12, slow=26, price_col='close', verbose=True):
+def add_ema_cross(df, fast=12, slow=26, price_col='close', verbose=True, estado=None):
     """
     Añade columnas para detectar cruces entre dos EMAs (media móvil exponencial).
 
@@ -126,6 +328,7 @@ def add_ema_cross(df, fast=12, slow=26, price_col='close', verbose=True):
         slow (int): Periodo para la EMA lenta (ej: 26).
         price_col (str): Columna de precio sobre la que se calculan las EMAs.
         verbose (bool): Si True, imprime descripción de lo generado.
+        estado (dict): Estado entre bloques (ver add_rsi); guarda las EMAs de la última vela.
 
     Returns:
         tuple: 
@@ -144,25 +347,142 @@ def add_ema_cross(df, fast=12, slow=26, price_col='close', verbose=True):
 
     # Añade las EMAs si no existen ya
     if col_fast not in df.columns:
-        df, _ = add_ema(df, period=fast, price_col=price_col, verbose=False)
+        df, _ = add_ema(df, period=fast, price_col=price_col, verbose=False, estado=estado)
     if col_slow not in df.columns:
-        df, _ = add_ema(df, period=slow, price_col=price_col, verbose=False)
+        df, _ = add_ema(df, period=slow, price_col=price_col, verbose=False, estado=estado)
+
+    # EMAs de la vela anterior (la primera del bloque usa las del bloque anterior)
+    previas = (estado or {}).get(col_signal, {'fast': np.nan, 'slow': np.nan})
+    fast_previa = df[col_fast].shift(1, fill_value=previas['fast'])
+    slow_previa = df[col_slow].shift(1, fill_value=previas['slow'])
+    if estado is not None and len(df):
+        estado[col_signal] = {'fast': float(df[col_fast].iloc[-1]), 'slow': float(df[col_slow].iloc[-1])}
 
     # Señal de cruce
-    cond_up = (df[col_fast] > df[col_slow]) & (df[col_fast].shift(1) <= df[col_slow].shift(1))
-    cond_down = (df[col_fast] < df[col_slow]) & (df[col_fast].shift(1) >= df[col_slow].shift(1))
+    cond_up = (df[col_fast] > df[col_slow]) & (fast_previa <= slow_previa)
+    cond_down = (df[col_fast] < df[col_slow]) & (fast_previa >= slow_previa)
 
     df[col_signal] = 0
     df.loc[cond_up, col_signal] = 1   # cruce hacia arriba
     df.loc[cond_down, col_signal] = -1  # cruce hacia abajo
 
     if verbose:
-        print(f"✅ Añadido {col_signal}: señales de cruce entre EMA{fast} y EMA{slow}. "
-              f"1 = cruce alcista, -1 = cruce bajista, 0 = sin cruce.")
+        log(f"✅ Añadido {col_signal}: señales de cruce entre EMA{fast} y EMA{slow}. "
+            f"1 = cruce alcista, -1 = cruce bajista, 0 = sin cruce.")
 
     return df, col_signal
 
-def add_trade_outcome(df, horizon=24, take_profit=3, stop_loss=3):
+def tabla_extremos(valores, horizon, funcion):
+    """
+    Construye una tabla dispersa con el extremo de cada bloque de 2**k velas.
+
+    Args:
+        valores (np.ndarray): Serie de precios (ej: 'high' o 'low').
+        horizon (int): Tamaño máximo de ventana que se va a consultar.
+        funcion (ufunc): np.fmax para máximos o np.fmin para mínimos (ignoran NaN).
+
+    Returns:
+        list[np.ndarray]: niveles[k][j] = extremo de valores[j:j + 2**k].
+    """
+    niveles = [np.asarray(valores)]
+    paso = 1
+    while paso * 2 <= horizon:
+        previo = niveles[-1]
+        m = max(len(previo) - paso, 0)
+        nivel = previo.copy()
+        nivel[:m] = funcion(previo[:m], previo[paso:paso + m])
+        niveles.append(nivel)
+        paso *= 2
+    return niveles
+
+def primer_toque(niveles, alcanzado, horizon):
+    """
+    Busca, para cada fila, la primera de las próximas 'horizon' velas que cumple una condición.
+
+    Recorre la tabla de extremos de mayor a menor bloque saltando los bloques en los que la
+    condición no se cumple (búsqueda binaria vectorizada, O(n log horizon)).
+
+    Args:
+        niveles (list[np.ndarray]): Tabla devuelta por tabla_extremos.
+        alcanzado (callable): alcanzado(extremos, filas) -> array bool. Debe ser monótona en el
+                              extremo (si se cumple para un valor, se cumple para uno más extremo).
+        horizon (int): Número de velas a mirar hacia el futuro.
+
+    Returns:
+        np.ndarray: Desplazamiento (1..horizon) de la primera vela que cumple, 0 si ninguna.
+    """
+    n = len(niveles[0])
+    filas = np.arange(n)
+    pos = filas + 1
+    restante = np.clip(n - 1 - filas, 0, max(horizon, 0))
+
+    for k in range(len(niveles) - 1, -1, -1):
+        paso = 1 << k
+        candidatas = np.flatnonzero(restante >= paso)
+        if candidatas.size == 0:
+            continue
+        libres = candidatas[~alcanzado(niveles[k][pos[candidatas]], candidatas)]
+        pos[libres] += paso
+        restante[libres] -= paso
+
+    return np.where(restante > 0, pos - filas, 0)
+
+def calcular_barreras(closes, highs, lows, horizon=24, take_profit=3, stop_loss=3):
+    """
+    Motor de etiquetado por triple barrera sobre arrays (sin bucles por fila).
+
+    Args:
+        closes, highs, lows (np.ndarray): Precios de cada vela.
+        horizon (int): Número de velas a mirar hacia el futuro.
+        take_profit (float): Porcentaje de ganancia objetivo (ej 3 = 3%).
+        stop_loss (float): Porcentaje de pérdida máxima permitida (ej 3 = 3%).
+
+    Returns:
+        tuple:
+            - codigos (np.ndarray int8): 1 = take_profit, -1 = stop_loss, 0 = ninguno.
+            - desplazamientos (np.ndarray int64): velas hasta la salida (barrera tocada o fin
+              del horizonte), 0 si no hay velas futuras.
+            - retornos (np.ndarray float): retorno % realizado: +take_profit, -stop_loss o el
+              del cierre de la última vela del horizonte. NaN si no hay velas futuras.
+    """
+    closes = np.asarray(closes)
+    n = len(closes)
+
+    tabla_highs = tabla_extremos(highs, horizon, np.fmax)
+    tabla_lows = tabla_extremos(lows, horizon, np.fmin)
+
+    # Misma expresión que el cálculo vela a vela para obtener resultados idénticos
+    tp_offset = primer_toque(
+        tabla_highs,
+        lambda h, filas: (h - closes[filas]) / closes[filas] * 100 >= take_profit,
+        horizon,
+    )
+    sl_offset = primer_toque(
+        tabla_lows,
+        lambda l, filas: (closes[filas] - l) / closes[filas] * 100 >= stop_loss,
+        horizon,
+    )
+
+    gana = (tp_offset > 0) & ((sl_offset == 0) | (tp_offset < sl_offset))
+    pierde = (sl_offset > 0) & ~gana
+
+    codigos = np.zeros(n, dtype=np.int8)
+    codigos[gana] = 1
+    codigos[pierde] = -1
+
+    ventana = np.clip(n - 1 - np.arange(n), 0, max(horizon, 0))
+    desplazamientos = np.where(gana, tp_offset, np.where(pierde, sl_offset, ventana))
+
+    retornos = np.full(n, np.nan)
+    retornos[gana] = take_profit
+    retornos[pierde] = -stop_loss
+    vertical = (codigos == 0) & (ventana > 0)
+    filas = np.flatnonzero(vertical)
+    retornos[filas] = (closes[filas + ventana[filas]] - closes[filas]) / closes[filas] * 100
+
+    return codigos, desplazamientos, retornos
+
+def add_trade_outcome(df, horizon=24, take_profit=3, stop_loss=3, futuro=None, verbose=True):
     """
     Añade columna 'trade_outcome' con el resultado esperado del trade en las próximas 'horizon' velas.
 
@@ -171,68 +491,134 @@ def add_trade_outcome(df, horizon=24, take_profit=3, stop_loss=3):
         horizon (int): Número de velas a mirar hacia el futuro.
         take_profit (float): Porcentaje de ganancia objetivo (ej 3 = 3%).
         stop_loss (float): Porcentaje de pérdida máxima permitida (ej 3 = 3%).
+        futuro (pd.DataFrame): Si df es un bloque de una serie más larga, las velas que le siguen
+                               (se usan las 'horizon' primeras para etiquetar el final del bloque).
+        verbose (bool): Si True, imprime la descripción de las columnas añadidas.
 
     Returns:
-        tuple: (DataFrame modificado, nombre columna outcome)
+        tuple: (DataFrame modificado, nombre columna outcome, nombre columna booleana)
+
+    Además añade 'result_offset_...' (velas hasta la salida) y 'result_return_...'
+    (retorno % realizado), calculadas por calcular_barreras.
     """
-    closes = df['close'].values
-    highs = df['high'].values
-    lows = df['low'].values
-    length = len(df)
+    closes, highs, lows = df['close'].values, df['high'].values, df['low'].values
+    if futuro is not None:
+        cola = futuro.iloc[:horizon]
+        closes = np.concatenate([closes, cola['close'].values])
+        highs = np.concatenate([highs, cola['high'].values])
+        lows = np.concatenate([lows, cola['low'].values])
 
-    outcomes = []
+    codigos, desplazamientos, retornos = calcular_barreras(
+        closes, highs, lows,
+        horizon=horizon, take_profit=take_profit, stop_loss=stop_loss,
+    )
+    codigos, desplazamientos, retornos = codigos[:len(df)], desplazamientos[:len(df)], retornos[:len(df)]
 
-    for i in range(length):
-        window_highs = highs[i+1:i+1+horizon]
-        window_lows = lows[i+1:i+1+horizon]
+    sufijo = f'{horizon}N_{take_profit}TP_{stop_loss}SL'
+    col_outcome = f'result_trade_outcome_{sufijo}'
+    df[col_outcome] = np.array(['stop_loss', 'ninguno', 'take_profit'], dtype=object)[codigos + 1]
 
-        if len(window_highs) == 0:
-            outcomes.append('ninguno')
-            continue
+    col_gain_bool = f'result_gain_{sufijo}_bool'
+    df[col_gain_bool] = codigos == 1
 
-        entry_price = closes[i]
+    df[f'result_offset_{sufijo}'] = desplazamientos
+    df[f'result_return_{sufijo}'] = retornos
 
-        tp_hit_idx = None
-        sl_hit_idx = None
+    if verbose:
+        log(f"✅ Añadida columna {col_outcome}: resultado del trade en las próximas {horizon} velas.")
+        log(f"✅ Añadida columna {col_gain_bool}: indica si se alcanzó el take profit.")
+        log(f"   'take_profit' si el precio subió al menos {take_profit}% antes que la caída de {stop_loss}%.")
+        log(f"   'stop_loss' si la caída ocurrió antes que la subida objetivo.")
+        log(f"   'ninguno' si ninguna condición se cumplió en el horizonte.")
+        log(f"✅ Añadidas columnas result_offset_{sufijo} y result_return_{sufijo}: velas hasta la salida y retorno % realizado.")
 
-        for idx, (h, l) in enumerate(zip(window_highs, window_lows)):
-            gain = (h - entry_price) / entry_price * 100
-            loss = (entry_price - l) / entry_price * 100
+    return df, col_outcome, col_gain_bool
 
-            if tp_hit_idx is None and gain >= take_profit:
-                tp_hit_idx = idx
-            if sl_hit_idx is None and loss >= stop_loss:
-                sl_hit_idx = idx
+def calcular_barreras_grid(closes, highs, lows, horizons, take_profits, stop_losses):
+    """
+    Calcula el resultado de todas las combinaciones (horizon, take_profit, stop_loss) en una sola pasada.
 
-            if tp_hit_idx is not None and sl_hit_idx is not None:
-                break
+    Las tablas de máximos/mínimos se construyen una vez para el horizonte más largo y el primer
+    toque de cada nivel de TP/SL se busca una sola vez; cada horizonte solo compara desplazamientos.
 
-        if tp_hit_idx is not None and sl_hit_idx is not None:
-            if tp_hit_idx < sl_hit_idx:
-                outcomes.append('take_profit')
-            else:
-                outcomes.append('stop_loss')
-        elif tp_hit_idx is not None:
-            outcomes.append('take_profit')
-        elif sl_hit_idx is not None:
-            outcomes.append('stop_loss')
-        else:
-            outcomes.append('ninguno')
+    Args:
+        closes, highs, lows (np.ndarray): Precios de cada vela.
+        horizons (list[int]): Horizontes en velas.
+        take_profits (list[float]): Porcentajes de take profit.
+        stop_losses (list[float]): Porcentajes de stop loss.
 
-    col_outcome = f'result_trade_outcome_{horizon}N_{take_profit}TP_{stop_loss}SL'
-    df[col_outcome] = outcomes
+    Returns:
+        np.ndarray int8 de forma (n, len(horizons), len(take_profits), len(stop_losses)) con
+        1 = take_profit, -1 = stop_loss, 0 = ninguno.
+    """
+    closes = np.asarray(closes)
+    n = len(closes)
+    horizon_max = max(horizons)
 
-    col_gain_bool = f'result_gain_{horizon}N_{take_profit}TP_{stop_loss}SL_bool'
+    tabla_highs = tabla_extremos(highs, horizon_max, np.fmax)
+    tabla_lows = tabla_extremos(lows, horizon_max, np.fmin)
 
-    df[col_gain_bool] = df[col_outcome].apply(lambda x: x == 'take_profit')
+    tp_offsets = [
+        primer_toque(tabla_highs, lambda h, filas, tp=tp: (h - closes[filas]) / closes[filas] * 100 >= tp, horizon_max)
+        for tp in take_profits
+    ]
+    sl_offsets = [
+        primer_toque(tabla_lows, lambda l, filas, sl=sl: (closes[filas] - l) / closes[filas] * 100 >= sl, horizon_max)
+        for sl in stop_losses
+    ]
 
-    print(f"✅ Añadida columna {col_outcome}: resultado del trade en las próximas {horizon} velas.")
-    print(f"✅ Añadida columna {col_gain_bool}: indica si se alcanzó el take profit.")
-    print(f"   'take_profit' si el precio subió al menos {take_profit}% antes que la caída de {stop_loss}%.")
-    print(f"   'stop_loss' si la caída ocurrió antes que la subida objetivo.")
-    print(f"   'ninguno' si ninguna condición se cumplió en el horizonte.")
+    codigos = np.zeros((n, len(horizons), len(take_profits), len(stop_losses)), dtype=np.int8)
+    for i_h, horizon in enumerate(horizons):
+        for i_tp, tp_offset in enumerate(tp_offsets):
+            tp_dentro = np.where((tp_offset > 0) & (tp_offset <= horizon), tp_offset, 0)
+            for i_sl, sl_offset in enumerate(sl_offsets):
+                sl_dentro = np.where((sl_offset > 0) & (sl_offset <= horizon), sl_offset, 0)
+                gana = (tp_dentro > 0) & ((sl_dentro == 0) | (tp_dentro < sl_dentro))
+                codigos[:, i_h, i_tp, i_sl] = np.where(gana, 1, np.where(sl_dentro > 0, -1, 0))
 
-    return df, col_outcome, col_gain_bool
+    return codigos
+
+def add_trade_outcome_grid(df, horizons=(24,), take_profits=(3,), stop_losses=(3,), verbose=True):
+    """
+    Añade las columnas de add_trade_outcome para una rejilla de parámetros en una sola pasada.
+
+    Args:
+        df (pd.DataFrame): DataFrame con columnas 'close', 'high', 'low'.
+        horizons (list[int]): Horizontes en velas.
+        take_profits (list[float]): Porcentajes de take profit.
+        stop_losses (list[float]): Porcentajes de stop loss.
+        verbose (bool): Si True, imprime las columnas añadidas.
+
+    Returns:
+        tuple: (DataFrame modificado, lista de (col_outcome, col_gain_bool) por combinación)
+    """
+    codigos = calcular_barreras_grid(
+        df['close'].values, df['high'].values, df['low'].values,
+        horizons, take_profits, stop_losses,
+    )
+    nombres = np.array(['stop_loss', 'ninguno', 'take_profit'], dtype=object)
+
+    nuevas = {}
+    columnas = []
+    for i_h, horizon in enumerate(horizons):
+        for i_tp, take_profit in enumerate(take_profits):
+            for i_sl, stop_loss in enumerate(stop_losses):
+                sufijo = f'{horizon}N_{take_profit}TP_{stop_loss}SL'
+                col_outcome = f'result_trade_outcome_{sufijo}'
+                col_gain_bool = f'result_gain_{sufijo}_bool'
+                combinacion = codigos[:, i_h, i_tp, i_sl]
+                nuevas[col_outcome] = nombres[combinacion + 1]
+                nuevas[col_gain_bool] = combinacion == 1
+                columnas.append((col_outcome, col_gain_bool))
+
+    df = pd.concat([df.drop(columns=list(nuevas), errors='ignore'),
+                    pd.DataFrame(nuevas, index=df.index)], axis=1)
+
+    if verbose:
+        log(f"✅ Añadidas {len(columnas)} combinaciones de resultado: horizons={list(horizons)}, "
+            f"take_profits={list(take_profits)}, stop_losses={list(stop_losses)}.")
+
+    return df, columnas
 
 # Funcion para sacar la relacion entre las varibales y la salida binaria
 from sklearn.feature_selection import mutual_info_classif
@@ -273,9 +659,9 @@ def calcular_importancia_features(df, verbose=True):
     ranking = sorted(zip(feature_cols, importancias), key=lambda x: x[1], reverse=True)
 
     if verbose:
-        print(f"✅ Importancia de features respecto a la salida binaria '{target_col}':\n")
+        log(f"✅ Importancia de features respecto a la salida binaria '{target_col}':\n")
         for nombre, score in ranking:
-            print(f"   {nombre:<30} ➜ {score:.4f}")
+            log(f"   {nombre:<30} ➜ {score:.4f}")
 
     return ranking
 
@@ -0,0 +1,218 @@
+"""
+Importancia de features respecto a la salida binaria, con varios métodos:
+
+    - 'mi': información mutua de sklearn (k-NN) sobre submuestras estratificadas, con intervalo
+      de confianza entre submuestras y las features repartidas entre procesos.
+    - 'mi_histograma': información mutua con la feature discretizada en cuantiles (histogramas),
+      mucho más barata y sobre las mismas submuestras.
+    - 'permutacion': caída de la métrica al permutar cada feature en un bosque ya entrenado.
+
+El ranking se guarda en la caché de features (cache_features.py) con la huella de los datos
+de origen y de los valores de las features, así que no se recalcula mientras no cambien los
+datos, las features ni los parámetros.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_selection import mutual_info_classif
+from sklearn.inspection import permutation_importance
+from sklearn.model_selection import train_test_split
+
+from cache_features import CARPETA_CACHE, TAMANO_MAX_CACHE, clave_cache, huella_datos, limpiar_cache
+from instrumentacion import log
+from train import columnas_modelo, matriz_features
+
+METODOS_IMPORTANCIA = ('mi', 'mi_histograma', 'permutacion')
+
+# Matriz y submuestras compartidas por cada proceso del pool (se cargan una vez en init_worker)
+DATOS_WORKER = {}
+
+
+def init_worker(datos):
+    DATOS_WORKER.update(datos)
+
+
+def submuestras_estratificadas(y, n_muestras=10, tam_muestra=20000, random_state=42):
+    """
+    Posiciones de n_muestras submuestras con la misma proporción de clases que y.
+
+    Si tam_muestra >= len(y) se devuelve una sola muestra con todas las filas.
+
+    Returns:
+        list[np.ndarray]: Posiciones ordenadas de cada submuestra.
+    """
+    if tam_muestra >= len(y):
+        return [np.arange(len(y))]
+
+    return [
+        np.sort(train_test_split(np.arange(len(y)), train_size=tam_muestra, stratify=y,
+                                 random_state=random_state + i)[0])
+        for i in range(n_muestras)
+    ]
+
+
+def mi_feature(j):
+    """Información mutua de la feature j en cada submuestra (se ejecuta en el pool)."""
+    X, y = DATOS_WORKER['X'], DATOS_WORKER['y']
+    return [
+        float(mutual_info_classif(X[muestra, j:j + 1], y[muestra], discrete_features=False,
+                                  random_state=DATOS_WORKER['random_state'])[0])
+        for muestra in DATOS_WORKER['muestras']
+    ]
+
+
+def mi_histograma(X, y, bins=32):
+    """
+    Información mutua (en nats) de cada columna de X con y, discretizando en cuantiles.
+
+    Args:
+        X (np.ndarray): Matriz (filas, features).
+        y (np.ndarray): Target binario 0/1.
+        bins (int): Número de intervalos por feature.
+
+    Returns:
+        np.ndarray: Una puntuación por feature.
+    """
+    y = np.asarray(y, dtype=np.int64)
+    n = len(y)
+    p_y = np.bincount(y, minlength=2) / n
+    cortes = np.quantile(X, np.linspace(0, 1, bins + 1)[1:-1], axis=0)
+
+    puntuaciones = np.empty(X.shape[1])
+    for j in range(X.shape[1]):
+        intervalo = np.searchsorted(cortes[:, j], X[:, j], side='right')
+        conjunta = np.bincount(intervalo * 2 + y, minlength=2 * bins).reshape(bins, 2) / n
+        p_x = conjunta.sum(axis=1, keepdims=True)
+        esperada = p_x * p_y
+        validos = conjunta > 0
+        puntuaciones[j] = float((conjunta[validos] * np.log(conjunta[validos] / esperada[validos])).sum())
+
+    return puntuaciones
+
+
+def intervalo_confianza(puntuaciones, nivel=0.95):
+    """Media, límite inferior y superior (aproximación normal de la media entre repeticiones)."""
+    puntuaciones = np.asarray(puntuaciones, dtype=float)
+    media = puntuaciones.mean(axis=-1)
+    if puntuaciones.shape[-1] < 2:
+        return media, media, media
+    margen = NormalDist().inv_cdf(0.5 + nivel / 2) * puntuaciones.std(axis=-1, ddof=1) / np.sqrt(puntuaciones.shape[-1])
+    return media, media - margen, media + margen
+
+
+def calcular_importancia(df, metodo='mi', model=None, n_muestras=10, tam_muestra=20000, bins=32,
+                         n_repeticiones=5, scoring='roc_auc', nivel=0.95, n_jobs=None, random_state=42,
+                         usar_cache=True, huella=None, carpeta=CARPETA_CACHE, tamano_max=TAMANO_MAX_CACHE,
+                         verbose=True):
+    """
+    Calcula la importancia de cada feature numérica respecto a la salida binaria.
+
+    Args:
+        df (pd.DataFrame): DataFrame con features y columna 'result_gain_..._bool'.
+        metodo (str): 'mi', 'mi_histograma' o 'permutacion' (ver cabecera del módulo).
+        model: Bosque ya entrenado con las features de columnas_modelo (solo 'permutacion').
+               Conviene pasar un df que no se haya usado para entrenarlo.
+        n_muestras (int): Número de submuestras estratificadas ('mi' y 'mi_histograma').
+        tam_muestra (int): Filas de cada submuestra (o del df en 'permutacion').
+        bins (int): Intervalos por feature en 'mi_histograma'.
+        n_repeticiones (int): Permutaciones por feature en 'permutacion'.
+        scoring (str): Métrica de sklearn para 'permutacion'.
+        nivel (float): Nivel de confianza del intervalo.
+        n_jobs (int): Procesos en paralelo (por defecto, todos los núcleos).
+        random_state (int): Semilla reproducible.
+        usar_cache (bool): Si True, reutiliza el ranking guardado para los mismos datos, features y parámetros.
+        huella (str): Huella de huella_datos(df); se calcula si no se pasa.
+        carpeta (str): Carpeta de la caché.
+        tamano_max (int): Tamaño máximo de la caché en bytes.
+        verbose (bool): Si True, imprime el ranking ordenado.
+
+    Returns:
+        pd.DataFrame: Columnas 'feature', 'importancia', 'ic_inf', 'ic_sup', de mayor a menor importancia.
+    """
+    if metodo not in METODOS_IMPORTANCIA:
+        raise ValueError(f"Método '{metodo}' no válido. Usa uno de {METODOS_IMPORTANCIA}.")
+    if metodo == 'permutacion' and model is None:
+        raise ValueError("El método 'permutacion' necesita un modelo ya entrenado.")
+
+    feature_cols, target_col = columnas_modelo(df)
+    if metodo == 'permutacion' and hasattr(model, 'feature_names_in_'):
+        feature_cols = list(model.feature_names_in_)  # las del entrenamiento, en su orden
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    params = {'metodo': metodo, 'feature_cols': feature_cols, 'target_col': target_col,
+              'tam_muestra': tam_muestra, 'nivel': nivel, 'random_state': random_state}
+    if metodo == 'permutacion':
+        params.update(modelo=joblib.hash(model), n_repeticiones=n_repeticiones, scoring=scoring)
+    else:
+        params.update(n_muestras=n_muestras)
+        if metodo == 'mi_histograma':
+            params['bins'] = bins
+
+    ruta_meta = None
+    if usar_cache:
+        huella = huella or huella_datos(df)
+        # Los valores de las features también forman parte de la clave: la huella solo cubre el
+        # OHLCV y la misma columna (ej: rsi_14) cambia con los parámetros del indicador
+        params['valores'] = huella_datos(df, feature_cols + [target_col])
+        ruta = os.path.join(carpeta, clave_cache(calcular_importancia, huella, params))
+        ruta_meta = os.path.join(ruta, 'meta.json')
+        if os.path.exists(ruta_meta):
+            with open(ruta_meta) as f:
+                ranking = pd.DataFrame(json.load(f)['ranking'])
+            os.utime(ruta_meta)  # Marca de uso para el desalojo LRU
+            if verbose:
+                log(f"✅ Cargada desde caché la importancia de features ({metodo})")
+                imprimir_ranking(ranking, target_col)
+            return ranking
+
+    y = df[target_col].to_numpy(dtype=np.int8)
+
+    if metodo == 'permutacion':
+        muestra = submuestras_estratificadas(y, 1, tam_muestra, random_state)[0]
+        X = pd.DataFrame(matriz_features(df, feature_cols, filas=muestra), columns=feature_cols, copy=False)
+        resultado = permutation_importance(model, X, y[muestra], scoring=scoring, n_repeats=n_repeticiones,
+                                           random_state=random_state, n_jobs=n_jobs)
+        puntuaciones = resultado.importances
+    else:
+        # Solo se materializan las filas que aparecen en alguna submuestra
+        muestras = submuestras_estratificadas(y, n_muestras, tam_muestra, random_state)
+        filas = np.unique(np.concatenate(muestras))
+        muestras = [np.searchsorted(filas, muestra) for muestra in muestras]
+        X = matriz_features(df, feature_cols, filas=filas)
+        y = y[filas]
+
+        if metodo == 'mi_histograma':
+            puntuaciones = np.column_stack([mi_histograma(X[muestra], y[muestra], bins=bins) for muestra in muestras])
+        else:
+            datos = {'X': X, 'y': y, 'muestras': muestras, 'random_state': random_state}
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(feature_cols)), initializer=init_worker,
+                                     initargs=(datos,)) as pool:
+                puntuaciones = np.array(list(pool.map(mi_feature, range(len(feature_cols)))))
+
+    media, ic_inf, ic_sup = intervalo_confianza(puntuaciones, nivel)
+    ranking = pd.DataFrame({'feature': feature_cols, 'importancia': media, 'ic_inf': ic_inf, 'ic_sup': ic_sup})
+    ranking = ranking.sort_values('importancia', ascending=False, kind='stable').reset_index(drop=True)
+
+    if ruta_meta is not None:
+        os.makedirs(os.path.dirname(ruta_meta), exist_ok=True)
+        with open(ruta_meta, 'w') as f:
+            json.dump({'funcion': 'calcular_importancia', 'params': params,
+                       'ranking': ranking.to_dict(orient='records')}, f)
+        limpiar_cache(carpeta, tamano_max, conservar=os.path.basename(os.path.dirname(ruta_meta)))
+
+    if verbose:
+        imprimir_ranking(ranking, target_col)
+
+    return ranking
+
+
+def imprimir_ranking(ranking, target_col):
+    log(f"✅ Importancia de features respecto a la salida binaria '{target_col}':\n")
+    for fila in ranking.itertuples():
+        log(f"   {fila.feature:<30} ➜ {fila.importancia:.4f}  [{fila.ic_inf:.4f}, {fila.ic_sup:.4f}]")
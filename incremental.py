@@ -0,0 +1,200 @@
+"""
+Indicadores incrementales: mantienen el estado de add_rsi, add_ema y add_ema_cross para
+actualizar solo las velas nuevas en lugar de recalcular toda la historia.
+
+Las actualizaciones reproducen paso a paso las operaciones de pandas (ewm con adjust=False,
+el suavizado de Wilder y la media móvil con suma compensada de rolling().mean()), por lo que los valores coinciden bit
+a bit con las funciones de functions.py.
+"""
+
+import json
+import math
+
+import numpy as np
+
+def crear_estado(rsi_periods=(14,), ema_periods=(12,), crosses=((12, 26),), price_col='close', rsi_metodo='sma'):
+    """
+    Crea el estado vacío de los indicadores incrementales.
+
+    Args:
+        rsi_periods (list[int]): Periodos de RSI (columnas 'rsi_{period}').
+        ema_periods (list[int]): Periodos de EMA (columnas 'ema_{period}').
+        crosses (list[tuple]): Pares (fast, slow) de cruces de EMAs.
+        price_col (str): Columna de precio sobre la que se calcula todo.
+        rsi_metodo (str): 'wilder' o 'sma', igual que en add_rsi.
+
+    Returns:
+        dict: Estado serializable con guardar_estado.
+    """
+    if rsi_metodo not in ('wilder', 'sma'):
+        raise ValueError(f"Método de RSI '{rsi_metodo}' no válido. Usa 'wilder' o 'sma'.")
+    media = media_wilder_vacia if rsi_metodo == 'wilder' else media_vacia
+
+    emas = set(ema_periods)
+    for fast, slow in crosses:
+        emas.update((fast, slow))
+
+    return {
+        'price_col': price_col,
+        'ultimo_precio': math.nan,
+        'filas': 0,
+        'rsi': {f'rsi_{period}': {'period': period, 'metodo': rsi_metodo, 'gain': media(), 'loss': media()}
+                for period in rsi_periods},
+        'ema': {f'ema_{period}': {'period': period, 'valor': math.nan} for period in sorted(emas)},
+        'cross': {f'ema_cross_signal_{fast}_{slow}': {'fast': f'ema_{fast}', 'slow': f'ema_{slow}',
+                                                      'prev_fast': math.nan, 'prev_slow': math.nan}
+                  for fast, slow in crosses},
+    }
+
+def media_vacia():
+    return {'sum_x': 0.0, 'comp_add': 0.0, 'comp_remove': 0.0, 'nobs': 0, 'neg_ct': 0,
+            'consecutivos': 0, 'prev': math.nan, 'ventana': []}
+
+def media_wilder_vacia():
+    return {'filas': 0, 'primeros': [], 'valor': math.nan}
+
+def alpha_ewm(com):
+    # pandas recalcula alpha a partir del centro de masa; se hace igual para coincidir bit a bit
+    return 1.0 / (1.0 + com)
+
+def actualizar_media_wilder(media, valor, period):
+    """Un paso de functions.media_wilder: semilla con la media simple y después ewm(alpha=1/period)."""
+    fila = media['filas']
+    media['filas'] += 1
+
+    if fila < period:
+        if fila >= 1:
+            media['primeros'].append(valor)
+        return math.nan
+    if fila == period:
+        media['valor'] = math.fsum(media['primeros'] + [valor]) / period
+        media['primeros'] = []
+        return media['valor']
+
+    alpha = 1 / period
+    media['valor'] = paso_ewm(media['valor'], valor, alpha_ewm((1 - alpha) / alpha))
+    return media['valor']
+
+def actualizar_media(media, valor, period):
+    """Un paso de rolling(period, min_periods=period).mean() con la suma compensada de pandas."""
+    ventana = media['ventana']
+
+    if valor == valor:
+        media['nobs'] += 1
+        y = valor - media['comp_add']
+        t = media['sum_x'] + y
+        media['comp_add'] = t - media['sum_x'] - y
+        media['sum_x'] = t
+        if math.copysign(1.0, valor) < 0:
+            media['neg_ct'] += 1
+        media['consecutivos'] = media['consecutivos'] + 1 if valor == media['prev'] else 1
+        media['prev'] = valor
+
+    ventana.append(valor)
+    if len(ventana) > period:
+        saliente = ventana.pop(0)
+        if saliente == saliente:
+            media['nobs'] -= 1
+            y = -saliente - media['comp_remove']
+            t = media['sum_x'] + y
+            media['comp_remove'] = t - media['sum_x'] - y
+            media['sum_x'] = t
+            if math.copysign(1.0, saliente) < 0:
+                media['neg_ct'] -= 1
+
+    nobs = media['nobs']
+    if nobs < period or nobs == 0:
+        return math.nan
+    resultado = media['sum_x'] / nobs
+    if media['consecutivos'] >= nobs:
+        resultado = media['prev']
+    elif media['neg_ct'] == 0 and resultado < 0:
+        resultado = 0.0
+    elif media['neg_ct'] == nobs and resultado > 0:
+        resultado = 0.0
+    return resultado
+
+def paso_ewm(valor_previo, valor, alpha):
+    """Un paso de ewm(adjust=False).mean() tal y como lo calcula pandas."""
+    if valor_previo != valor_previo:
+        return valor
+    if valor != valor or valor_previo == valor:
+        return valor_previo
+    old_wt = 1.0 - alpha
+    return (old_wt * valor_previo + alpha * valor) / (old_wt + alpha)
+
+def actualizar_vela(estado, precio):
+    """
+    Incorpora una vela nueva al estado y devuelve sus indicadores.
+
+    Args:
+        estado (dict): Estado de crear_estado (se modifica).
+        precio (float): Precio de la vela en estado['price_col'].
+
+    Returns:
+        dict: {nombre_columna: valor} para todas las columnas del estado.
+    """
+    precio = float(precio)
+    valores = {}
+
+    delta = precio - estado['ultimo_precio']
+    gain = 0.0 if delta < 0 else delta
+    loss = -(0.0 if delta > 0 else delta)
+    for col, rsi in estado['rsi'].items():
+        actualizar = actualizar_media_wilder if rsi['metodo'] == 'wilder' else actualizar_media
+        avg_gain = actualizar(rsi['gain'], gain, rsi['period'])
+        avg_loss = actualizar(rsi['loss'], loss, rsi['period'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = np.float64(avg_gain) / np.float64(avg_loss)
+            valores[col] = float(100 - (100 / (1 + rs)))
+
+    for col, ema in estado['ema'].items():
+        ema['valor'] = paso_ewm(ema['valor'], precio, alpha_ewm((ema['period'] - 1) / 2.0))
+        valores[col] = ema['valor']
+
+    for col, cruce in estado['cross'].items():
+        fast, slow = valores[cruce['fast']], valores[cruce['slow']]
+        if fast > slow and cruce['prev_fast'] <= cruce['prev_slow']:
+            valores[col] = 1
+        elif fast < slow and cruce['prev_fast'] >= cruce['prev_slow']:
+            valores[col] = -1
+        else:
+            valores[col] = 0
+        cruce['prev_fast'], cruce['prev_slow'] = fast, slow
+
+    estado['ultimo_precio'] = precio
+    estado['filas'] += 1
+    return valores
+
+def actualizar_indicadores(df_nuevas, estado):
+    """
+    Calcula los indicadores solo para las velas nuevas, continuando desde el estado.
+
+    Sirve también para inicializar: actualizar_indicadores(df, crear_estado(...)) da los mismos
+    valores que add_rsi / add_ema / add_ema_cross sobre df.
+
+    Args:
+        df_nuevas (pd.DataFrame): Velas posteriores a las ya procesadas, en orden.
+        estado (dict): Estado de crear_estado o cargar_estado (se modifica).
+
+    Returns:
+        pd.DataFrame: df_nuevas con las columnas de indicadores añadidas.
+    """
+    filas = [actualizar_vela(estado, precio) for precio in df_nuevas[estado['price_col']].to_numpy()]
+
+    df_nuevas = df_nuevas.copy()
+    columnas = list(estado['rsi']) + list(estado['ema']) + list(estado['cross'])
+    for col in columnas:
+        df_nuevas[col] = [fila[col] for fila in filas]
+        if col in estado['cross']:
+            df_nuevas[col] = df_nuevas[col].astype(np.int64)
+
+    return df_nuevas
+
+def guardar_estado(estado, ruta):
+    with open(ruta, 'w') as f:
+        json.dump(estado, f)
+
+def cargar_estado(ruta):
+    with open(ruta) as f:
+        return json.load(f)
@@ -1,23 +1,79 @@
-def predict_from_model(df, model, feature_cols, threshold=0.5, return_probs=True):
+import numpy as np
+
+from bosque import aplanar_bosque, es_bosque, predict_proba_bosque, proba_positiva
+from registro_modelos import cargar_modelo
+
+BACKENDS = ('sklearn', 'bosque')
+
+def validar_features(df, feature_cols, feature_cols_modelo=None):
+    """
+    Comprueba que el DataFrame tiene las features del modelo y en el mismo orden de entrenamiento.
+    """
+    if feature_cols_modelo is not None and list(feature_cols) != list(feature_cols_modelo):
+        raise ValueError(f"Las features no coinciden con las del modelo registrado: "
+                         f"esperadas {list(feature_cols_modelo)}, recibidas {list(feature_cols)}")
+
+    faltan = [col for col in feature_cols if col not in df.columns]
+    if faltan:
+        raise ValueError(f"Faltan columnas de features en el DataFrame: {faltan}")
+
+def predict_from_model(df, model, feature_cols=None, threshold=None, return_probs=True, backend='sklearn'):
     """
     Aplica un modelo entrenado a un DataFrame con las columnas necesarias.
 
     Args:
         df (pd.DataFrame): Datos ya preparados con features.
-        model: Modelo ya entrenado (ej. RandomForest).
-        feature_cols (list): Lista de nombres de columnas a usar como input.
-        threshold (float): Umbral de probabilidad para decidir True/False.
+        model: Modelo ya entrenado (ej. RandomForest) o clave del registro de modelos
+               (ver registro_modelos.guardar_modelo).
+        feature_cols (list): Lista de nombres de columnas a usar como input. Con una clave del
+                             registro es opcional; si se pasa, debe coincidir con la registrada.
+        threshold (float): Umbral de probabilidad para decidir True/False. Por defecto, el del
+                           registro para una clave o 0.5 para un modelo en memoria.
         return_probs (bool): Si True, añade columna con probabilidades.
+        backend (str): 'sklearn' (predict_proba del estimador) o 'bosque' (recorrido de los arrays
+                       planos de bosque.py, mismo resultado). 'bosque' tiene mucha menos latencia
+                       con pocas filas; en lotes grandes sklearn es más rápido. Con 'bosque',
+                       model también puede ser el dict de arrays de aplanar_bosque.
 
     Returns:
         pd.Series (predicciones True/False)
         Si return_probs=True, también añade columna 'pred_proba'
     """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend '{backend}' no válido. Usa {' o '.join(repr(b) for b in BACKENDS)}.")
+
+    arrays = model if isinstance(model, dict) else None
+    if arrays is not None and backend != 'bosque':
+        raise ValueError("Un dict de arrays del bosque solo se puede usar con backend='bosque'.")
+
+    if isinstance(model, str):
+        registro = cargar_modelo(model, cargar_estimador=backend == 'sklearn')
+        feature_cols = feature_cols if feature_cols is not None else registro['feature_cols']
+        validar_features(df, feature_cols, registro['feature_cols'])
+        threshold = registro['threshold'] if threshold is None else threshold
+        model, arrays = registro['modelo'], registro['arrays']
+        if backend == 'bosque' and arrays is None:
+            raise ValueError("El modelo registrado no es un bosque; usa backend='sklearn'.")
+    else:
+        if feature_cols is None:
+            raise ValueError("feature_cols es obligatorio si model no es una clave del registro.")
+        validar_features(df, feature_cols)
+        threshold = 0.5 if threshold is None else threshold
+        if backend == 'bosque' and arrays is None:
+            if not es_bosque(model):
+                raise ValueError("backend='bosque' requiere un bosque de árboles entrenado.")
+            arrays = aplanar_bosque(model)
+
     df = df.copy()
     X = df[feature_cols].fillna(0)
 
-    if hasattr(model, "predict_proba"):
-        probs = model.predict_proba(X)[:, 1]
+    if backend == 'bosque':
+        probs = predict_proba_bosque(arrays, X.to_numpy(dtype=np.float32))
+        preds = probs >= threshold
+        if return_probs:
+            df['pred_proba'] = probs
+    elif hasattr(model, "predict_proba"):
+        probs = proba_positiva(model, X)
         preds = probs >= threshold
         if return_probs:
             df['pred_proba'] = probs
@@ -27,8 +83,8 @@ def predict_from_model(df, model, feature_cols, threshold=0.5, return_probs=True
             df['pred_proba'] = preds  # En este caso no hay proba real
 
     df['model_pred'] = preds.astype(bool)
-    
+
     if return_probs:
         return df
     else:
-        return df['model_pred']
\ No newline at end of file
+        return df['model_pred']
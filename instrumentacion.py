@@ -0,0 +1,238 @@
+"""
+Instrumentación de la cadena: mensajes por logger y medición de etapas.
+
+Los mensajes de todos los módulos ('✅ Añadido ...', resúmenes...) pasan por log(), que usa el
+logger 'tradingalgoritmico'; silenciar() los quita de la consola sin tocar los 'verbose' de cada función.
+
+Cada etapa medida con el context manager etapa() o el decorador instrumentar() registra tiempo
+real, tiempo de CPU, memoria pico y filas procesadas:
+
+    iniciar_ejecucion(medir_memoria=True, perfilar='entrenamiento')
+    with etapa('carga') as registro:
+        df = read_data('BTCUSDT')
+        registro['filas'] = len(df)
+    ...
+    guardar_informe('informe_ejecucion.json')
+
+La memoria pico por etapa usa tracemalloc (medir_memoria=True, ralentiza la ejecución); siempre
+se anota además el pico de memoria residente del proceso. Con perfilar se ejecuta cProfile solo
+en esa etapa ('auto' elige la etapa más lenta del informe anterior).
+"""
+
+import contextlib
+import cProfile
+import datetime
+import functools
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOGGER = logging.getLogger('tradingalgoritmico')
+if not LOGGER.handlers:
+    consola = logging.StreamHandler(sys.stdout)
+    consola.setFormatter(logging.Formatter('%(message)s'))
+    consola.setLevel(logging.INFO)
+    LOGGER.addHandler(consola)
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.propagate = False
+CONSOLA = LOGGER.handlers[0]
+
+# Estado de la ejecución en curso (ver iniciar_ejecucion)
+EJECUCION = {'inicio': None, 'etapas': [], 'pila': [], 'medir_memoria': False, 'perfilar': None, 'perfil': None}
+
+def log(mensaje, nivel=logging.INFO):
+    """Emite un mensaje por el logger de la cadena (sustituye a print)."""
+    LOGGER.log(nivel, mensaje)
+
+def ajustar_nivel():
+    # El logger descarta los mensajes que ningún destino va a escribir sin llegar a formatearlos
+    LOGGER.setLevel(min(manejador.level for manejador in LOGGER.handlers))
+
+def silenciar(silencioso=True):
+    """Modo silencioso: la consola solo muestra avisos y errores (los ficheros de log_en_fichero siguen completos)."""
+    CONSOLA.setLevel(logging.WARNING if silencioso else logging.INFO)
+    ajustar_nivel()
+
+@contextlib.contextmanager
+def log_en_fichero(ruta):
+    """Copia los mensajes del logger a un fichero mientras dura el bloque."""
+    manejador = logging.FileHandler(ruta, mode='w', encoding='utf-8')
+    manejador.setFormatter(logging.Formatter('%(message)s'))
+    manejador.setLevel(logging.INFO)
+    LOGGER.addHandler(manejador)
+    ajustar_nivel()
+    try:
+        yield
+    finally:
+        LOGGER.removeHandler(manejador)
+        manejador.close()
+        ajustar_nivel()
+
+def memoria_residente_mb():
+    """Pico de memoria residente del proceso en MB (None si no se puede consultar)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024  # bytes en macOS, KB en Linux
+
+def etapa_mas_lenta(ruta):
+    if not ruta or not os.path.exists(ruta):
+        return None
+    with open(ruta) as f:
+        informe = json.load(f)
+    return informe.get('etapa_mas_lenta')
+
+def iniciar_ejecucion(medir_memoria=False, perfilar=None, ruta_informe_anterior='informe_ejecucion.json'):
+    """
+    Empieza un informe nuevo.
+
+    Args:
+        medir_memoria (bool): Si True, mide la memoria pico de cada etapa con tracemalloc.
+        perfilar (str): Etapa a perfilar con cProfile, 'auto' para la más lenta del informe
+                        anterior, o None.
+        ruta_informe_anterior (str): Informe del que se toma la etapa con perfilar='auto'.
+    """
+    if perfilar == 'auto':
+        perfilar = etapa_mas_lenta(ruta_informe_anterior)
+
+    EJECUCION.update(inicio=time.time(), etapas=[], pila=[], medir_memoria=medir_memoria,
+                     perfilar=perfilar, perfil=None)
+    if medir_memoria and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+@contextlib.contextmanager
+def etapa(nombre, filas=None):
+    """
+    Mide una etapa de la cadena.
+
+    Args:
+        nombre (str): Nombre de la etapa en el informe.
+        filas (int): Filas procesadas (también se puede anotar en el dict que se devuelve).
+
+    Yields:
+        dict: Registro de la etapa; se puede fijar registro['filas'] dentro del bloque.
+    """
+    if EJECUCION['inicio'] is None:
+        iniciar_ejecucion()
+
+    registro = {'etapa': nombre, 'nivel': len(EJECUCION['pila']), 'filas': filas, 'pico_hijos': 0}
+    memoria = EJECUCION['medir_memoria'] and tracemalloc.is_tracing()
+    if memoria:
+        # El pico acumulado hasta aquí pertenece a la etapa que contiene a esta
+        if EJECUCION['pila']:
+            padre = EJECUCION['pila'][-1]
+            padre['pico_hijos'] = max(padre['pico_hijos'], tracemalloc.get_traced_memory()[1])
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    perfil = None
+    if EJECUCION['perfilar'] == nombre and EJECUCION['perfil'] is None:
+        perfil = cProfile.Profile()
+
+    EJECUCION['pila'].append(registro)
+    inicio, inicio_cpu = time.perf_counter(), time.process_time()
+    if perfil is not None:
+        perfil.enable()
+    try:
+        yield registro
+    finally:
+        if perfil is not None:
+            perfil.disable()
+            EJECUCION['perfil'] = perfil
+        registro['tiempo_s'] = time.perf_counter() - inicio
+        registro['cpu_s'] = time.process_time() - inicio_cpu
+        EJECUCION['pila'].pop()
+
+        if memoria:
+            pico = max(tracemalloc.get_traced_memory()[1], registro['pico_hijos'])
+            registro['memoria_pico_mb'] = (pico - memoria_inicial) / 1024 ** 2
+            if EJECUCION['pila']:
+                padre = EJECUCION['pila'][-1]
+                padre['pico_hijos'] = max(padre['pico_hijos'], pico)
+        registro['rss_max_mb'] = memoria_residente_mb()
+
+        if registro['filas'] is not None and registro['tiempo_s'] > 0:
+            registro['filas_por_s'] = registro['filas'] / registro['tiempo_s']
+        del registro['pico_hijos']
+        EJECUCION['etapas'].append(registro)
+
+def filas_de(valor):
+    """Filas de un DataFrame/array, o del primer elemento si es una tupla (ej. (df, columna))."""
+    if isinstance(valor, tuple) and valor:
+        valor = valor[0]
+    return len(valor) if isinstance(valor, (pd.DataFrame, pd.Series)) or hasattr(valor, 'shape') else None
+
+def instrumentar(nombre=None):
+    """
+    Decorador que mide cada llamada a la función como una etapa.
+
+    Las filas se toman del primer argumento si es un DataFrame, o del resultado.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with etapa(nombre or funcion.__name__) as registro:
+                resultado = funcion(*args, **kwargs)
+                registro['filas'] = filas_de(args[0]) if args and filas_de(args[0]) is not None else filas_de(resultado)
+            return resultado
+        return envoltura
+    return decorador
+
+def informe_ejecucion(top_perfil=25):
+    """
+    Informe de la ejecución en curso.
+
+    Returns:
+        dict: 'inicio', 'duracion_s', 'etapas' (en orden de finalización), 'etapa_mas_lenta'
+              (de primer nivel) y, si se perfiló, 'perfil' con las funciones de más tiempo acumulado.
+    """
+    etapas = EJECUCION['etapas']
+    principales = [registro for registro in etapas if registro['nivel'] == 0] or etapas
+    informe = {
+        'inicio': datetime.datetime.fromtimestamp(EJECUCION['inicio'] or time.time()).isoformat(timespec='seconds'),
+        'duracion_s': time.time() - EJECUCION['inicio'] if EJECUCION['inicio'] else 0.0,
+        'etapas': etapas,
+        'etapa_mas_lenta': max(principales, key=lambda registro: registro['tiempo_s'])['etapa'] if principales else None,
+    }
+
+    if EJECUCION['perfil'] is not None:
+        estadisticas = pstats.Stats(EJECUCION['perfil']).stats
+        funciones = sorted(estadisticas.items(), key=lambda item: item[1][3], reverse=True)[:top_perfil]
+        informe['perfil'] = {
+            'etapa': EJECUCION['perfilar'],
+            'funciones': [
+                {'funcion': f'{os.path.basename(fichero)}:{linea}({nombre})', 'llamadas': llamadas,
+                 'tiempo_propio_s': propio, 'tiempo_acumulado_s': acumulado}
+                for (fichero, linea, nombre), (_, llamadas, propio, acumulado, _) in funciones
+            ],
+        }
+
+    return informe
+
+def guardar_informe(ruta='informe_ejecucion.json', verbose=True):
+    """Guarda el informe en JSON y, si verbose, imprime la tabla de etapas."""
+    informe = informe_ejecucion()
+    with open(ruta, 'w') as f:
+        json.dump(informe, f, indent=2, default=str)
+
+    if verbose:
+        log(f"✅ Informe de ejecución guardado en {ruta} ({informe['duracion_s']:.2f}s):")
+        for registro in informe['etapas']:
+            memoria = registro.get('memoria_pico_mb')
+            log(f"   {'  ' * registro['nivel']}{registro['etapa']:<24} {registro['tiempo_s']:8.3f}s  "
+                f"CPU {registro['cpu_s']:8.3f}s"
+                + (f"  pico {memoria:8.1f} MB" if memoria is not None else '')
+                + (f"  {registro['filas']} filas" if registro['filas'] is not None else ''))
+
+    return informe
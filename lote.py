@@ -0,0 +1,246 @@
+"""
+Ejecución por lotes de la cadena de main.py (carga → indicadores → etiquetas → entrenamiento →
+predicción → backtesting) para muchos símbolos, cada uno en un proceso.
+
+El número de procesos simultáneos se limita por la memoria disponible, no solo por núcleos.
+Cada símbolo deja sus artefactos en '{carpeta_salida}/{simbolo}/' (predicciones, backtesting,
+operaciones, log y modelo) y una fila con sus tiempos por etapa en la tabla consolidada
+'{carpeta_salida}/resultados.csv'. Si un símbolo falla, se registra el error y se sigue.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import traceback
+from multiprocessing.connection import wait
+
+import pandas as pd
+
+from almacen import existe_almacen, ruta_almacen
+from backtesting import backtesting
+from cache_features import CARPETA_CACHE, con_cache, huella_datos
+from functions import read_data, add_rsi, add_ema, add_ema_cross, add_trade_outcome, filtrar_fecha
+from inferencia import predict_from_model
+from instrumentacion import etapa, guardar_informe, informe_ejecucion, iniciar_ejecucion, log, log_en_fichero, silenciar
+from registro_modelos import guardar_modelo
+from train import execute_random_forest
+
+ETAPAS = ['carga', 'indicadores', 'etiquetas', 'entrenamiento', 'prediccion', 'backtesting']
+
+# Memoria estimada de la cadena completa respecto al tamaño en disco de los datos de origen
+FACTOR_MEMORIA = 12
+
+def memoria_disponible():
+    """Bytes de memoria física libre según el sistema, o None si no se puede consultar."""
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def tamano_datos(simbolo, carpeta='data'):
+    """Bytes en disco de los datos de un símbolo (almacén columnar o CSV)."""
+    if existe_almacen(simbolo, carpeta):
+        ruta = ruta_almacen(simbolo, carpeta)
+        return sum(entrada.stat().st_size for entrada in os.scandir(ruta) if entrada.is_file())
+    ruta_csv = os.path.join(carpeta, f'{simbolo}.csv')
+    return os.path.getsize(ruta_csv) if os.path.exists(ruta_csv) else 0
+
+def procesos_por_memoria(simbolos, n_jobs=None, fraccion_memoria=0.7, memoria_por_simbolo=None):
+    """
+    Número de procesos que caben a la vez en memoria.
+
+    Args:
+        simbolos (list): Símbolos a procesar.
+        n_jobs (int): Máximo de procesos (por defecto, todos los núcleos).
+        fraccion_memoria (float): Parte de la memoria libre que se puede usar.
+        memoria_por_simbolo (int): Bytes por proceso (por defecto, el símbolo más grande × FACTOR_MEMORIA).
+
+    Returns:
+        int: Procesos simultáneos (al menos 1).
+    """
+    n_jobs = min(n_jobs or os.cpu_count() or 1, max(len(simbolos), 1))
+    libre = memoria_disponible()
+    if memoria_por_simbolo is None:
+        memoria_por_simbolo = max((tamano_datos(simbolo) for simbolo in simbolos), default=0) * FACTOR_MEMORIA
+    if libre is None or memoria_por_simbolo <= 0:
+        return n_jobs
+    return max(1, min(n_jobs, int(libre * fraccion_memoria // memoria_por_simbolo)))
+
+def procesar_simbolo(simbolo, params):
+    """
+    Ejecuta la cadena completa de un símbolo y guarda sus artefactos.
+
+    Los mensajes de la cadena se guardan en '{simbolo}/log.txt' (no en la consola) y los tiempos
+    de cada etapa en '{simbolo}/informe.json' (ver instrumentacion.py).
+
+    Returns:
+        dict: Fila de resultados con 'simbolo', 'estado' ('ok' o 'error'), 'etapa_error', 'error', los tiempos
+              'tiempo_{etapa}' en segundos y, si termina, filas, capital final y operaciones.
+    """
+    carpeta = os.path.join(params['carpeta_salida'], simbolo)
+    os.makedirs(carpeta, exist_ok=True)
+    # Caché propia del símbolo: el desalojo LRU de otro proceso no puede borrar sus ficheros
+    carpeta_cache = os.path.join(params['carpeta_cache'], simbolo)
+
+    fila = {'simbolo': simbolo, 'estado': 'ok', 'etapa_error': None, 'error': None}
+    for nombre in ETAPAS:
+        fila[f'tiempo_{nombre}'] = None
+
+    # Cada símbolo corre en un proceso nuevo: la consola se silencia solo aquí
+    silenciar()
+    iniciar_ejecucion()
+    with log_en_fichero(os.path.join(carpeta, 'log.txt')):
+        try:
+            with etapa('carga') as registro:
+                df = read_data(simbolo)
+                registro['filas'] = len(df)
+
+            with etapa('indicadores'):
+                huella = huella_datos(df)
+                df, _ = con_cache(add_rsi, df, huella=huella, carpeta=carpeta_cache)
+                df, _ = con_cache(add_ema, df, huella=huella, carpeta=carpeta_cache, period=12, price_col='close',
+                                  verbose=True)
+                df, _ = con_cache(add_ema_cross, df, huella=huella, carpeta=carpeta_cache, fast=12, slow=26,
+                                  price_col='close', verbose=True)
+                df, df_test = filtrar_fecha(df, total_anios=params['total_anios'],
+                                            eliminar_anios_final=params['eliminar_anios_final'])
+
+            with etapa('etiquetas'):
+                df, _, _ = con_cache(add_trade_outcome, df, carpeta=carpeta_cache, horizon=params['horizon'],
+                                     take_profit=params['take_profit'], stop_loss=params['stop_loss'])
+
+            with etapa('entrenamiento'):
+                modelo, feature_cols, target_col = execute_random_forest(
+                    df, n_estimators=params['n_estimators'], balanced=params['balanced'])
+                guardar_modelo(modelo, feature_cols, target_col, threshold=params['threshold'], clave=simbolo,
+                               carpeta=os.path.join(params['carpeta_salida'], 'modelos'),
+                               parametros={'horizon': params['horizon'], 'take_profit': params['take_profit'],
+                                           'stop_loss': params['stop_loss']})
+
+            with etapa('prediccion'):
+                pred = predict_from_model(df_test, modelo, feature_cols, threshold=params['threshold'])
+                pred.to_csv(os.path.join(carpeta, 'predicciones.csv'), index=False)
+
+            with etapa('backtesting'):
+                back, operaciones = backtesting(pred, capital_inicial=params['capital_inicial'],
+                                                take_profit=params['take_profit'], stop_loss=params['stop_loss'],
+                                                return_ledger=True)
+                back.to_csv(os.path.join(carpeta, 'back.csv'), index=False)
+                operaciones.to_csv(os.path.join(carpeta, 'operaciones.csv'), index=False)
+
+            razones = operaciones['exit_reason'].value_counts()
+            fila.update({
+                'filas_train': len(df),
+                'filas_test': len(df_test),
+                'capital_final': float(back['disponible'].iloc[-1]) if len(back) else params['capital_inicial'],
+                'operaciones': len(operaciones),
+                'TP': int(razones.get('TP', 0)),
+                'SL': int(razones.get('SL', 0)),
+                'End': int(razones.get('End', 0)),
+            })
+        except Exception as error:
+            log(traceback.format_exc(), logging.ERROR)
+            etapas = informe_ejecucion()['etapas']
+            fila.update({'estado': 'error', 'etapa_error': etapas[-1]['etapa'] if etapas else None,
+                         'error': f'{type(error).__name__}: {error}'})
+
+        informe = guardar_informe(os.path.join(carpeta, 'informe.json'), verbose=False)
+
+    for registro in informe['etapas']:
+        fila[f"tiempo_{registro['etapa']}"] = registro['tiempo_s']
+    return fila
+
+def ejecutar_en_proceso(simbolo, params):
+    """Punto de entrada del proceso de cada símbolo: deja su fila de resultados en '{simbolo}/fila.json'."""
+    fila = procesar_simbolo(simbolo, params)
+    with open(os.path.join(params['carpeta_salida'], simbolo, 'fila.json'), 'w') as f:
+        json.dump(fila, f)
+
+def recoger_proceso(simbolo, proceso, params):
+    """Fila de resultados de un proceso terminado; si murió sin dejarla (ej. sin memoria), una fila de error."""
+    proceso.join()
+    ruta = os.path.join(params['carpeta_salida'], simbolo, 'fila.json')
+    if proceso.exitcode == 0 and os.path.exists(ruta):
+        with open(ruta) as f:
+            return json.load(f)
+    return {'simbolo': simbolo, 'estado': 'error', 'etapa_error': None,
+            'error': f'El proceso terminó con código {proceso.exitcode}'}
+
+def ejecutar_lote(simbolos, carpeta_salida='resultados_lote', horizon=24, take_profit=3, stop_loss=1,
+                  threshold=0.5, total_anios=5, eliminar_anios_final=1, n_estimators=100, balanced=True,
+                  capital_inicial=100, n_jobs=None, fraccion_memoria=0.7, memoria_por_simbolo=None,
+                  carpeta_cache=CARPETA_CACHE, verbose=True):
+    """
+    Ejecuta la cadena de main.py para cada símbolo en procesos en paralelo.
+
+    Args:
+        simbolos (list): Símbolos con datos en 'data/{simbolo}.csv' (o su almacén columnar).
+        carpeta_salida (str): Carpeta de resultados y artefactos por símbolo.
+        horizon, take_profit, stop_loss: Parámetros de add_trade_outcome y del backtesting.
+        threshold (float): Umbral de probabilidad del modelo.
+        total_anios, eliminar_anios_final: Parámetros de filtrar_fecha (el final es el test).
+        n_estimators (int): Árboles del RandomForest.
+        balanced (bool): Si True, entrena con las clases balanceadas.
+        capital_inicial (float): Capital inicial del backtesting.
+        n_jobs (int): Máximo de procesos (por defecto, todos los núcleos).
+        fraccion_memoria (float): Parte de la memoria libre que pueden ocupar los procesos.
+        memoria_por_simbolo (int): Bytes estimados por proceso (ver procesos_por_memoria).
+        carpeta_cache (str): Carpeta base de la caché de features; cada símbolo usa '{carpeta_cache}/{simbolo}'.
+        verbose (bool): Si True, imprime el progreso y el resumen.
+
+    Returns:
+        pd.DataFrame: Una fila por símbolo (también en '{carpeta_salida}/resultados.csv').
+    """
+    os.makedirs(carpeta_salida, exist_ok=True)
+    params = {
+        'carpeta_salida': carpeta_salida, 'horizon': horizon, 'take_profit': take_profit,
+        'stop_loss': stop_loss, 'threshold': threshold, 'total_anios': total_anios,
+        'eliminar_anios_final': eliminar_anios_final, 'n_estimators': n_estimators,
+        'balanced': balanced, 'capital_inicial': capital_inicial, 'carpeta_cache': carpeta_cache,
+    }
+    n_procesos = procesos_por_memoria(simbolos, n_jobs, fraccion_memoria, memoria_por_simbolo)
+    if verbose:
+        log(f"✅ Procesando {len(simbolos)} símbolos con {n_procesos} procesos")
+
+    filas = []
+    # Un proceso por símbolo: se libera su memoria al terminar y, si muere (ej. sin memoria), solo
+    # falla ese símbolo; los demás siguen en sus propios procesos
+    pendientes = list(simbolos)
+    activos = {}
+    while pendientes or activos:
+        while pendientes and len(activos) < n_procesos:
+            simbolo = pendientes.pop(0)
+            ruta_fila = os.path.join(carpeta_salida, simbolo, 'fila.json')
+            if os.path.exists(ruta_fila):
+                os.remove(ruta_fila)
+            proceso = multiprocessing.Process(target=ejecutar_en_proceso, args=(simbolo, params))
+            proceso.start()
+            activos[simbolo] = proceso
+
+        wait([proceso.sentinel for proceso in activos.values()])
+        for simbolo in [simbolo for simbolo, proceso in activos.items() if not proceso.is_alive()]:
+            fila = recoger_proceso(simbolo, activos.pop(simbolo), params)
+            filas.append(fila)
+            if verbose:
+                if fila['estado'] == 'ok':
+                    log(f"   {simbolo:<12} capital final {fila['capital_final']:.2f}  "
+                        f"({fila['operaciones']} operaciones)")
+                else:
+                    log(f"   {simbolo:<12} ❌ {fila.get('etapa_error') or ''} {fila['error']}", logging.WARNING)
+
+    orden = {simbolo: i for i, simbolo in enumerate(simbolos)}
+    resultados = pd.DataFrame(filas)
+    resultados = resultados.sort_values('simbolo', key=lambda col: col.map(orden)).reset_index(drop=True)
+    resultados.to_csv(os.path.join(carpeta_salida, 'resultados.csv'), index=False)
+
+    if verbose:
+        columnas_tiempo = [f'tiempo_{etapa}' for etapa in ETAPAS if f'tiempo_{etapa}' in resultados]
+        log(f"✅ Lote terminado: {(resultados['estado'] == 'ok').sum()} correctos, "
+            f"{(resultados['estado'] == 'error').sum()} con error")
+        if columnas_tiempo:
+            medias = resultados[columnas_tiempo].mean()
+            log("   Tiempo medio por etapa: " + "  ".join(
+                f"{col[len('tiempo_'):]} {segundos:.2f}s" for col, segundos in medias.items()))
+
+    return resultados
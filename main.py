@@ -5,41 +5,76 @@ from train import *
 from inferencia import predict_from_model
 from config import *
 from backtesting import *
+from cache_features import con_cache, huella_datos
+from registro_modelos import buscar_modelo, guardar_modelo, huella_entrenamiento, podar_registro
+from importancia import calcular_importancia
+from instrumentacion import etapa, guardar_informe, iniciar_ejecucion
+from metricas import guardar_metricas
 
 moneda = 'BTCUSDT'
 
+def main():
+    """Pipeline completo: datos, indicadores, etiquetas, importancia, modelo, predicción y backtesting."""
+    # Tiempo, CPU y filas de cada etapa (perfilar='auto' perfila la etapa más lenta de la ejecución anterior)
+    iniciar_ejecucion(medir_memoria=False, perfilar=None)
 
-# Carga de BTC
-df_btc = read_data(moneda)
+    # Carga de BTC
+    with etapa('carga') as registro:
+        df_btc = read_data(moneda)
+        registro['filas'] = len(df_btc)
 
 
-df_btc, col_rsi = add_rsi(df_btc)
-df_btc, col_ema = add_ema(df_btc, period=12, price_col='close', verbose=True)
-df_btc, col_ema_cross = add_ema_cross(df_btc, fast=12, slow=26, price_col='close', verbose=True)
+    # Los indicadores se reutilizan de la caché mientras no cambien los datos de origen
+    with etapa('indicadores', filas=len(df_btc)):
+        huella = huella_datos(df_btc)
+        df_btc, col_rsi = con_cache(add_rsi, df_btc, huella=huella)
+        df_btc, col_ema = con_cache(add_ema, df_btc, huella=huella, period=12, price_col='close', verbose=True)
+        df_btc, col_ema_cross = con_cache(add_ema_cross, df_btc, huella=huella, fast=12, slow=26, price_col='close', verbose=True)
 
-# Filtramos solo por las ultimas fechas
-df_btc, df_test = filtrar_fecha(df_btc, total_anios = 5, eliminar_anios_final = 1)
+    # Filtramos solo por las ultimas fechas
+    df_btc, df_test = filtrar_fecha(df_btc, total_anios = 5, eliminar_anios_final = 1)
 
-# Obtenemos las columnas de resultados para cada caso
-df_btc, col_outcome, col_gain_bool = add_trade_outcome(df_btc, horizon=24, take_profit = TAKE_PROFIT, stop_loss= STOP_LOSS)
+    # Obtenemos las columnas de resultados para cada caso
+    with etapa('etiquetas', filas=len(df_btc)):
+        df_btc, col_outcome, col_gain_bool = con_cache(add_trade_outcome, df_btc, horizon=24, take_profit = TAKE_PROFIT, stop_loss= STOP_LOSS)
 
-# Obtenemos la dependencia con la salida
-ranking = calcular_importancia_features(df_btc)
+    # Obtenemos la dependencia con la salida
+    with etapa('importancia', filas=len(df_btc)):
+        ranking = calcular_importancia(df_btc, metodo='mi')
 
-# Balanceamos datos
-df_btc, _ = balanced_methods(df_btc)
+    # Creamos el modelo con los datos balanceados (por índices, sin copiar el DataFrame)
+    # Si ya hay en el registro un modelo entrenado con los mismos datos y parámetros, se reutiliza
+    with etapa('entrenamiento', filas=len(df_btc)):
+        parametros = {'horizon': 24, 'take_profit': TAKE_PROFIT, 'stop_loss': STOP_LOSS}
+        huella_modelo = huella_entrenamiento(df_btc, {**parametros, 'n_estimators': 100, 'random_state': 42, 'balanced': True})
+        clave_modelo = buscar_modelo(huella_modelo)
 
-# Creamos el modelo
-modelo, feature_cols, target_col = execute_random_forest(df_btc, )
+        if clave_modelo is None:
+            modelo, feature_cols, target_col = execute_random_forest(df_btc, balanced=True)
 
-# Predecimos con el modelo ya entrenado para una fila o varias
-pred = predict_from_model(df_test, modelo, feature_cols, threshold=THRESHOLD, return_probs=True)
+            # Guardamos el modelo en el registro para poder predecir sin reentrenar
+            clave_modelo = guardar_modelo(modelo, feature_cols, target_col, threshold=THRESHOLD,
+                                          parametros=parametros, huella=huella_modelo)
+            podar_registro(conservar=5)
 
-pred.to_csv('predicciones.csv', index=False)
+    # Predecimos con el modelo ya entrenado para una fila o varias
+    with etapa('prediccion', filas=len(df_test)):
+        pred = predict_from_model(df_test, clave_modelo, return_probs=True)
 
-back = backtesting(pred)
+    pred.to_csv('predicciones.csv', index=False)
 
-back_testing_resume(back)
-back_testing_graph(back)
+    with etapa('backtesting', filas=len(pred)):
+        back = backtesting(pred)
 
-back.to_csv('back.csv')
+    metricas = back_testing_resume(back)
+    guardar_metricas(metricas, 'metricas.json')
+    back_testing_graph(back)
+
+    back.to_csv('back.csv')
+
+    guardar_informe('informe_ejecucion.json')
+
+# Los procesos hijos (spawn en Windows y macOS) importan este módulo: sin la guarda
+# volverían a ejecutar todo el pipeline
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Métricas de riesgo y rentabilidad de un backtesting, sobre arrays de NumPy.
+
+Todo se calcula con operaciones vectorizadas sobre la curva de capital (una entrada por vela) y
+el registro de operaciones, sin DataFrames ni bucles por vela, para poder llamarlo dentro de
+barridos con miles de backtestings:
+
+    metricas = metricas_backtesting(capital, entradas, salidas, gains, barras_por_anio=52560)
+    guardar_metricas(metricas, 'metricas.json')
+
+Los retornos son por vela y se anualizan con barras_por_anio; el drawdown es la caída relativa
+desde el máximo anterior de la curva.
+"""
+
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+def barras_por_anio(fechas):
+    """Velas por año según la mediana del paso entre fechas (1.0 si no se puede estimar)."""
+    fechas = pd.to_datetime(pd.Series(fechas))
+    paso = fechas.diff().median()
+    return pd.Timedelta(days=365) / paso if pd.notna(paso) and paso > pd.Timedelta(0) else 1.0
+
+def drawdown(capital):
+    """
+    Drawdown de la curva de capital.
+
+    Returns:
+        tuple: (caidas, duraciones) por vela: caída relativa desde el máximo anterior y velas
+               transcurridas desde ese máximo.
+    """
+    capital = np.asarray(capital, dtype=float)
+    maximos = np.maximum.accumulate(capital)
+    caidas = 1 - capital / maximos
+
+    posiciones = np.arange(len(capital))
+    ultimo_maximo = np.maximum.accumulate(np.where(capital >= maximos, posiciones, 0))
+    return caidas, posiciones - ultimo_maximo
+
+def ratio(numerador, denominador):
+    return float(numerador / denominador) if denominador > 0 else 0.0
+
+def metricas_backtesting(capital, entradas, salidas, gains, barras_por_anio=1.0, razones=None, duracion_barra=None):
+    """
+    Métricas de un backtesting a partir de su curva de capital y sus operaciones.
+
+    Args:
+        capital (np.ndarray): Capital al cierre de cada vela ('disponible' de backtesting).
+        entradas, salidas (np.ndarray): Vela de la señal y de la salida de cada operación
+                                        ('entry_idx' y 'exit_idx' de simular_operaciones).
+        gains (np.ndarray): Retorno de cada operación (0.01 = 1%).
+        barras_por_anio (float): Velas por año para anualizar (ver barras_por_anio).
+        razones (np.ndarray): exit_reason de cada operación, para contar TP / SL / End.
+        duracion_barra (pd.Timedelta): Duración de una vela; si se pasa, se añaden las duraciones en días.
+
+    Returns:
+        dict: Capital, rentabilidad, rentabilidad anual, volatilidad anual, max_drawdown y su
+              duración, Sharpe, Sortino, Calmar, operaciones, win_rate, profit_factor,
+              ganancia_media, tiempo_medio_operacion (velas) y exposicion (fracción de velas
+              con posición abierta). Todos los valores son números de Python.
+    """
+    capital = np.asarray(capital, dtype=float)
+    entradas, salidas = np.asarray(entradas), np.asarray(salidas)
+    gains = np.asarray(gains, dtype=float)
+    n = len(capital)
+
+    capital_inicial = float(capital[0]) if n else 0.0
+    capital_final = float(capital[-1]) if n else 0.0
+    rentabilidad = capital_final / capital_inicial - 1 if capital_inicial else 0.0
+    anios = (n - 1) / barras_por_anio if n > 1 else 0.0
+    rentabilidad_anual = (1 + rentabilidad) ** (1 / anios) - 1 if anios > 0 and rentabilidad > -1 else rentabilidad
+
+    retornos = capital[1:] / capital[:-1] - 1 if n > 1 else np.zeros(0)
+    media = retornos.mean() if len(retornos) else 0.0
+    std = retornos.std() if len(retornos) else 0.0
+    bajista = math.sqrt(np.mean(np.minimum(retornos, 0) ** 2)) if len(retornos) else 0.0
+
+    caidas, duraciones = drawdown(capital) if n else (np.zeros(1), np.zeros(1, dtype=np.int64))
+    max_drawdown = float(caidas.max())
+
+    ganadoras = gains[gains > 0]
+    perdedoras = gains[gains < 0]
+    suma_perdidas = -perdedoras.sum()
+    velas_operacion = salidas - entradas
+
+    metricas = {
+        'capital_inicial': capital_inicial,
+        'capital_final': capital_final,
+        'rentabilidad': float(rentabilidad),
+        'rentabilidad_anual': float(rentabilidad_anual),
+        'volatilidad_anual': float(std * math.sqrt(barras_por_anio)),
+        'max_drawdown': max_drawdown,
+        'duracion_max_drawdown': int(duraciones.max()),
+        'sharpe': ratio(media, std) * math.sqrt(barras_por_anio),
+        'sortino': ratio(media, bajista) * math.sqrt(barras_por_anio),
+        'calmar': ratio(rentabilidad_anual, max_drawdown),
+        'operaciones': int(len(gains)),
+        'win_rate': ratio(len(ganadoras), len(gains)),
+        'profit_factor': float(ganadoras.sum() / suma_perdidas) if suma_perdidas > 0 else (math.inf if len(ganadoras) else 0.0),
+        'ganancia_media': float(gains.mean()) if len(gains) else 0.0,
+        'tiempo_medio_operacion': float(velas_operacion.mean()) if len(gains) else 0.0,
+        'exposicion': ratio(velas_operacion.sum(), n),
+    }
+
+    if razones is not None:
+        razones = np.asarray(razones)
+        for razon in ('TP', 'SL', 'End'):
+            metricas[razon] = int((razones == razon).sum())
+
+    if duracion_barra is not None:
+        dias_barra = pd.Timedelta(duracion_barra) / pd.Timedelta(days=1)
+        metricas['duracion_max_drawdown_dias'] = metricas['duracion_max_drawdown'] * dias_barra
+        metricas['tiempo_medio_operacion_dias'] = metricas['tiempo_medio_operacion'] * dias_barra
+
+    return metricas
+
+def arrays_backtest(df):
+    """Capital y operaciones a partir de la salida de backtesting.backtesting (sin el ledger)."""
+    entradas = np.flatnonzero(df['entry_price'].notna().to_numpy())
+    salidas = np.flatnonzero(df['exit_reason'].notna().to_numpy())
+    return {
+        'capital': df['disponible'].to_numpy(dtype=float),
+        'entradas': entradas,
+        'salidas': salidas,
+        'gains': df['gains'].to_numpy(dtype=float)[salidas],
+        'razones': df['exit_reason'].to_numpy()[salidas],
+    }
+
+def metricas_backtest(df, operaciones=None):
+    """
+    metricas_backtesting sobre la salida de backtesting.backtesting.
+
+    Args:
+        df (pd.DataFrame): Resultado de backtesting() con 'date', 'disponible', 'gains',
+                           'entry_price' y 'exit_reason'.
+        operaciones (pd.DataFrame): Ledger de backtesting(return_ledger=True); si no se pasa,
+                                    las operaciones se leen de las columnas de df.
+
+    Returns:
+        dict: Ver metricas_backtesting, más 'desde' y 'hasta'.
+    """
+    if operaciones is not None:
+        arrays = {'capital': df['disponible'].to_numpy(dtype=float),
+                  'entradas': operaciones['entry_idx'].to_numpy(), 'salidas': operaciones['exit_idx'].to_numpy(),
+                  'gains': operaciones['gains'].to_numpy(dtype=float), 'razones': operaciones['exit_reason'].to_numpy()}
+    else:
+        arrays = arrays_backtest(df)
+
+    fechas = pd.to_datetime(df['date'])
+    paso = fechas.diff().median()
+    metricas = metricas_backtesting(arrays['capital'], arrays['entradas'], arrays['salidas'], arrays['gains'],
+                                    barras_por_anio=barras_por_anio(fechas), razones=arrays['razones'],
+                                    duracion_barra=paso if pd.notna(paso) else None)
+    metricas['desde'] = str(fechas.min()) if len(fechas) else None
+    metricas['hasta'] = str(fechas.max()) if len(fechas) else None
+    return metricas
+
+def suma_movil(valores, ventana):
+    """Suma de las últimas 'ventana' posiciones (NaN hasta completar la primera ventana)."""
+    acumulada = np.concatenate([[0.0], np.cumsum(valores, dtype=float)])
+    sumas = np.full(len(valores), np.nan)
+    if len(valores) >= ventana:
+        sumas[ventana - 1:] = acumulada[ventana:] - acumulada[:-ventana]
+    return sumas
+
+def metricas_moviles(capital, ventana, barras_por_anio=1.0, en_posicion=None, fechas=None):
+    """
+    Métricas sobre una ventana móvil de velas.
+
+    El drawdown móvil se mide respecto al máximo de la curva dentro de la ventana y Calmar usa
+    el mayor de esos drawdowns en la ventana.
+
+    Args:
+        capital (np.ndarray): Curva de capital por vela.
+        ventana (int): Velas de la ventana.
+        barras_por_anio (float): Velas por año para anualizar.
+        en_posicion (np.ndarray bool): Velas con posición abierta ('open_position'), para la exposición.
+        fechas: Índice del resultado (por defecto, la posición de la vela).
+
+    Returns:
+        pd.DataFrame: 'rentabilidad', 'volatilidad_anual', 'sharpe', 'sortino', 'drawdown',
+                      'max_drawdown', 'calmar' y, si se pasa en_posicion, 'exposicion'.
+    """
+    if ventana < 2:
+        raise ValueError("La ventana debe tener al menos 2 velas.")
+    capital = np.asarray(capital, dtype=float)
+    retornos = np.zeros(len(capital))
+    retornos[1:] = capital[1:] / capital[:-1] - 1
+
+    # Media y desviación de los ventana - 1 retornos de la ventana con sumas acumuladas
+    n_ret = ventana - 1
+    media = suma_movil(retornos, n_ret) / n_ret
+    std = np.sqrt(np.maximum(suma_movil(retornos ** 2, n_ret) / n_ret - media ** 2, 0))
+    bajista = np.sqrt(suma_movil(np.minimum(retornos, 0) ** 2, n_ret) / n_ret)
+
+    anualizacion = math.sqrt(barras_por_anio)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, media / std * anualizacion, 0.0)
+        sortino = np.where(bajista > 0, media / bajista * anualizacion, 0.0)
+
+        serie = pd.Series(capital)
+        rentabilidad = capital / serie.shift(ventana - 1).to_numpy() - 1
+        caidas = 1 - capital / serie.rolling(ventana, min_periods=1).max().to_numpy()
+        max_drawdown = pd.Series(caidas).rolling(ventana, min_periods=ventana).max().to_numpy()
+        rentabilidad_anual = (1 + rentabilidad) ** (barras_por_anio / n_ret) - 1
+        calmar = np.where(max_drawdown > 0, rentabilidad_anual / max_drawdown, 0.0)
+
+    moviles = pd.DataFrame({
+        'rentabilidad': rentabilidad,
+        'volatilidad_anual': std * anualizacion,
+        'sharpe': sharpe,
+        'sortino': sortino,
+        'drawdown': caidas,
+        'max_drawdown': max_drawdown,
+        'calmar': calmar,
+    }, index=fechas)
+    if en_posicion is not None:
+        moviles['exposicion'] = suma_movil(np.asarray(en_posicion, dtype=float), ventana) / ventana
+
+    # Sin ventana completa no hay métrica
+    moviles.iloc[:ventana - 1] = np.nan
+    return moviles
+
+def operaciones_moviles(gains, ventana=50, salidas=None):
+    """
+    Métricas sobre las últimas 'ventana' operaciones.
+
+    Args:
+        gains (np.ndarray): Retorno de cada operación, en orden de salida.
+        ventana (int): Operaciones de la ventana.
+        salidas: Índice del resultado (ej. fecha o vela de salida de cada operación).
+
+    Returns:
+        pd.DataFrame: 'win_rate', 'profit_factor' y 'ganancia_media' de cada ventana.
+    """
+    gains = np.asarray(gains, dtype=float)
+    ganancias = suma_movil(np.where(gains > 0, gains, 0.0), ventana)
+    perdidas = -suma_movil(np.where(gains < 0, gains, 0.0), ventana)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profit_factor = np.where(perdidas > 0, ganancias / perdidas, np.where(ganancias > 0, np.inf, 0.0))
+    profit_factor[np.isnan(ganancias)] = np.nan
+
+    return pd.DataFrame({
+        'win_rate': suma_movil((gains > 0).astype(float), ventana) / ventana,
+        'profit_factor': profit_factor,
+        'ganancia_media': suma_movil(gains, ventana) / ventana,
+    }, index=salidas)
+
+def metricas_json(metricas):
+    """Copia de las métricas válida como JSON estricto (infinitos y NaN como None)."""
+    return {clave: None if isinstance(valor, float) and not math.isfinite(valor) else valor
+            for clave, valor in metricas.items()}
+
+def guardar_metricas(metricas, ruta):
+    with open(ruta, 'w') as f:
+        json.dump(metricas_json(metricas), f, indent=2)
+    return ruta
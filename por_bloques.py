@@ -0,0 +1,88 @@
+"""
+Procesamiento fuera de memoria: indicadores y etiquetas por bloques, escritos en el almacén.
+
+La serie se lee por bloques (functions.leer_por_bloques) y cada función de indicadores recibe
+un 'estado' con lo que necesita del bloque anterior (últimas medias, último cierre, EMAs de la
+vela anterior), así que los valores son los mismos que calculando la serie entera. Para
+etiquetar un bloque con add_trade_outcome hacen falta las 'horizon' velas siguientes: cada
+bloque se escribe cuando se ha leído el siguiente, usando sus primeras velas como cola.
+
+La memoria depende del tamaño del bloque (dos bloques a la vez), no de la longitud de la historia:
+
+    procesar_por_bloques('btcusd_1m', 'btcusd_1m_features', tam_bloque=1_000_000, horizon=24 * 60)
+    df = read_data('btcusd_1m_features', columnas=['close', 'rsi_14'], desde='2024-01-01')
+"""
+
+from almacen import anexar_almacen, guardar_almacen, ruta_almacen
+from functions import add_rsi, add_ema, add_ema_cross, add_trade_outcome, leer_por_bloques
+from instrumentacion import log
+
+def indicadores_bloque(df, estado, rsi_periods=(14,), ema_periods=(12,), crosses=((12, 26),),
+                       price_col='close', rsi_metodo='sma'):
+    """Añade los indicadores de main.py a un bloque, continuando desde estado (se modifica)."""
+    for period in rsi_periods:
+        df, _ = add_rsi(df, period=period, verbose=False, metodo=rsi_metodo, estado=estado)
+    for period in ema_periods:
+        df, _ = add_ema(df, period=period, price_col=price_col, verbose=False, estado=estado)
+    for fast, slow in crosses:
+        df, _ = add_ema_cross(df, fast=fast, slow=slow, price_col=price_col, verbose=False, estado=estado)
+    return df
+
+def procesar_por_bloques(cambio, destino=None, tam_bloque=1_000_000, rsi_periods=(14,), ema_periods=(12,),
+                         crosses=((12, 26),), price_col='close', rsi_metodo='sma', horizon=24,
+                         take_profit=3, stop_loss=3, carpeta='data', verbose=True):
+    """
+    Calcula indicadores y etiquetas de toda la historia por bloques y los guarda en un almacén.
+
+    El resultado es el mismo que read_data + add_rsi/add_ema/add_ema_cross + add_trade_outcome
+    sobre la serie entera (con rsi_metodo='sma' puede diferir en el último decimal por la suma
+    compensada de rolling).
+
+    Args:
+        cambio (str): Serie de origen (almacén columnar o 'data/{cambio}.csv').
+        destino (str): Almacén de salida (por defecto '{cambio}_features'); se sustituye si existe.
+        tam_bloque (int): Filas por bloque (al menos horizon).
+        rsi_periods, ema_periods, crosses: Indicadores a calcular (como en incremental.crear_estado).
+        price_col (str): Columna de precio de las EMAs.
+        rsi_metodo (str): 'wilder' o 'sma'.
+        horizon, take_profit, stop_loss: Parámetros de add_trade_outcome (None en horizon para no etiquetar).
+        carpeta (str): Carpeta base del almacén de salida.
+        verbose (bool): Si True, imprime el progreso.
+
+    Returns:
+        str: Ruta del almacén de salida.
+    """
+    if horizon is not None and tam_bloque < horizon:
+        raise ValueError(f"tam_bloque ({tam_bloque}) debe ser al menos horizon ({horizon}).")
+    destino = destino or f'{cambio}_features'
+    if destino == cambio:
+        raise ValueError("El almacén de salida no puede ser el de origen.")
+
+    estado = {}
+    escritas = 0
+
+    def escribir(bloque, siguiente):
+        nonlocal escritas
+        if horizon is not None:
+            bloque, _, _ = add_trade_outcome(bloque, horizon=horizon, take_profit=take_profit,
+                                             stop_loss=stop_loss, futuro=siguiente, verbose=False)
+        if escritas:
+            anexar_almacen(bloque, destino, carpeta)
+        else:
+            guardar_almacen(bloque, destino, carpeta)
+        escritas += len(bloque)
+        if verbose:
+            log(f"   {escritas} filas escritas en {ruta_almacen(destino, carpeta)}")
+
+    pendiente = None  # Bloque con indicadores que espera a las velas siguientes para etiquetarse
+    for bloque in leer_por_bloques(cambio, tam_bloque=tam_bloque):
+        bloque = indicadores_bloque(bloque, estado, rsi_periods, ema_periods, crosses, price_col, rsi_metodo)
+        if pendiente is not None:
+            escribir(pendiente, bloque)
+        pendiente = bloque
+    if pendiente is not None:
+        escribir(pendiente, None)
+
+    if verbose:
+        log(f"✅ {cambio}: {escritas} filas con indicadores y etiquetas en {ruta_almacen(destino, carpeta)}")
+    return ruta_almacen(destino, carpeta)
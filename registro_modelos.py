@@ -0,0 +1,193 @@
+"""
+Registro de modelos entrenados.
+
+Cada modelo se guarda en 'modelos/{clave}/' con:
+    - meta.json: feature_cols, target_col, parámetros de las etiquetas y threshold.
+    - modelo.joblib: el estimador de sklearn sin comprimir.
+    - bosque/*.npy: si es un bosque, sus nodos en arrays planos (ver bosque.py), que se abren con
+      mmap: la carga es inmediata y varios procesos comparten las mismas páginas de memoria.
+
+Con la huella de huella_entrenamiento, buscar_modelo devuelve el modelo ya entrenado con los
+mismos datos y parámetros, así que no hace falta reentrenar. podar_registro elimina los antiguos.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import joblib
+import numpy as np
+
+from bosque import ARRAYS_BOSQUE, aplanar_bosque, es_bosque
+from cache_features import huella_datos
+from instrumentacion import log
+from train import columnas_modelo
+
+CARPETA_MODELOS = 'modelos'
+
+# Modelos ya cargados en este proceso
+MODELOS_CARGADOS = {}
+
+def huella_entrenamiento(df, parametros=None):
+    """
+    Huella de un entrenamiento: valores de las features y el target de df y parámetros.
+
+    Args:
+        df (pd.DataFrame): DataFrame con el que se entrena (features y 'result_gain_..._bool').
+        parametros (dict): Parámetros de las etiquetas y del entrenamiento.
+
+    Returns:
+        str: Huella hexadecimal.
+    """
+    feature_cols, target_col = columnas_modelo(df)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(huella_datos(df, feature_cols + [target_col]).encode())
+    h.update(json.dumps(parametros or {}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def guardar_modelo(model, feature_cols, target_col, parametros=None, threshold=0.5, clave=None,
+                   huella=None, carpeta=CARPETA_MODELOS):
+    """
+    Guarda un modelo entrenado junto con todo lo necesario para usarlo en inferencia.
+
+    Args:
+        model: Modelo ya entrenado (ej. el de execute_random_forest).
+        feature_cols (list): Columnas de entrada en el orden de entrenamiento.
+        target_col (str): Columna target con la que se entrenó.
+        parametros (dict): Parámetros de las etiquetas (ej: horizon, take_profit, stop_loss).
+        threshold (float): Umbral de probabilidad a usar con este modelo.
+        clave (str): Nombre del modelo en el registro (por defecto, target, fecha y un sufijo
+                     aleatorio, para que dos modelos guardados en el mismo segundo no se
+                     pisen). Si se indica una clave que ya existe, el modelo se sustituye.
+        huella (str): Huella de huella_entrenamiento, para encontrarlo con buscar_modelo.
+        carpeta (str): Carpeta del registro.
+
+    Returns:
+        str: Clave del modelo.
+    """
+    creado = datetime.datetime.now()
+    clave = clave or f"{target_col}_{creado:%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+    ruta = os.path.join(carpeta, clave)
+    os.makedirs(ruta, exist_ok=True)
+
+    joblib.dump(model, os.path.join(ruta, 'modelo.joblib'))
+
+    bosque = es_bosque(model)
+    if bosque:
+        os.makedirs(os.path.join(ruta, 'bosque'), exist_ok=True)
+        for nombre, valores in aplanar_bosque(model).items():
+            np.save(os.path.join(ruta, 'bosque', f'{nombre}.npy'), valores)
+
+    meta = {
+        'clave': clave,
+        'clase': type(model).__name__,
+        'feature_cols': list(feature_cols),
+        'target_col': target_col,
+        'parametros': parametros or {},
+        'threshold': threshold,
+        'bosque': bosque,
+        'huella': huella,
+        'creado': creado.isoformat(timespec='microseconds'),
+    }
+    with open(os.path.join(ruta, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    MODELOS_CARGADOS.pop(clave, None)
+    log(f"✅ Modelo guardado en el registro como '{clave}'")
+    return clave
+
+def buscar_modelo(huella, carpeta=CARPETA_MODELOS):
+    """
+    Busca en el registro el modelo más reciente guardado con esa huella de entrenamiento.
+
+    Args:
+        huella (str): Huella de huella_entrenamiento.
+        carpeta (str): Carpeta del registro.
+
+    Returns:
+        str: Clave del modelo, o None si no hay ninguno.
+    """
+    for meta in listar_modelos(carpeta):
+        if meta.get('huella') == huella:
+            log(f"✅ Reutilizado el modelo '{meta['clave']}' del registro (mismos datos y parámetros)")
+            return meta['clave']
+    return None
+
+def cargar_modelo(clave, carpeta=CARPETA_MODELOS, cargar_estimador=False):
+    """
+    Carga un modelo del registro (una sola vez por proceso).
+
+    Args:
+        clave (str): Clave devuelta por guardar_modelo.
+        carpeta (str): Carpeta del registro.
+        cargar_estimador (bool): Si True, deserializa también el estimador de sklearn; por
+                                 defecto solo se abren los arrays del bosque con mmap, que es
+                                 lo que necesita la inferencia.
+
+    Returns:
+        dict: meta.json más 'modelo' (estimador o None) y 'arrays' (dict de arrays del bosque o None).
+    """
+    registro = MODELOS_CARGADOS.get(clave)
+    if registro is not None and (registro['modelo'] is not None or not cargar_estimador):
+        return registro
+
+    ruta = os.path.join(carpeta, clave)
+    if not os.path.exists(os.path.join(ruta, 'meta.json')):
+        raise ValueError(f"No existe el modelo '{clave}' en {carpeta}")
+
+    with open(os.path.join(ruta, 'meta.json')) as f:
+        registro = json.load(f)
+
+    registro['arrays'] = None
+    if registro['bosque']:
+        registro['arrays'] = {
+            nombre: np.load(os.path.join(ruta, 'bosque', f'{nombre}.npy'), mmap_mode='r')
+            for nombre in ARRAYS_BOSQUE
+        }
+
+    registro['modelo'] = joblib.load(os.path.join(ruta, 'modelo.joblib'), mmap_mode='r') if cargar_estimador else None
+
+    MODELOS_CARGADOS[clave] = registro
+    return registro
+
+def listar_modelos(carpeta=CARPETA_MODELOS):
+    """Devuelve la meta de todos los modelos del registro, del más reciente al más antiguo."""
+    if not os.path.isdir(carpeta):
+        return []
+
+    modelos = []
+    for nombre in os.listdir(carpeta):
+        ruta_meta = os.path.join(carpeta, nombre, 'meta.json')
+        if os.path.exists(ruta_meta):
+            with open(ruta_meta) as f:
+                modelos.append(json.load(f))
+
+    return sorted(modelos, key=lambda meta: meta['creado'], reverse=True)
+
+def podar_registro(conservar=5, carpeta=CARPETA_MODELOS, target_col=None):
+    """
+    Elimina los modelos más antiguos del registro.
+
+    Args:
+        conservar (int): Número de modelos más recientes que se conservan.
+        carpeta (str): Carpeta del registro.
+        target_col (str): Si se indica, solo se tienen en cuenta los modelos de ese target.
+
+    Returns:
+        int: Número de modelos eliminados.
+    """
+    if conservar < 0:
+        raise ValueError(f"conservar debe ser 0 o mayor (recibido {conservar}).")
+
+    modelos = [meta for meta in listar_modelos(carpeta) if target_col is None or meta['target_col'] == target_col]
+    for meta in modelos[conservar:]:
+        shutil.rmtree(os.path.join(carpeta, meta['clave']), ignore_errors=True)
+        MODELOS_CARGADOS.pop(meta['clave'], None)
+
+    eliminados = len(modelos[conservar:])
+    if eliminados:
+        log(f"✅ Eliminados {eliminados} modelos antiguos del registro")
+    return eliminados
@@ -0,0 +1,91 @@
+"""
+Compara el etiquetado vectorizado (calcular_barreras / add_trade_outcome) con el bucle vela a
+vela original sobre series aleatorias, con NaN y con horizontes 0 y 1.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions import add_trade_outcome, calcular_barreras
+
+
+def etiquetas_bucle(closes, highs, lows, horizon, take_profit, stop_loss):
+    """Bucle por fila de la versión anterior de add_trade_outcome."""
+    outcomes = []
+    for i in range(len(closes)):
+        window_highs = highs[i+1:i+1+horizon]
+        window_lows = lows[i+1:i+1+horizon]
+
+        if len(window_highs) == 0:
+            outcomes.append('ninguno')
+            continue
+
+        entry_price = closes[i]
+        tp_hit_idx = None
+        sl_hit_idx = None
+
+        for idx, (h, l) in enumerate(zip(window_highs, window_lows)):
+            gain = (h - entry_price) / entry_price * 100
+            loss = (entry_price - l) / entry_price * 100
+
+            if tp_hit_idx is None and gain >= take_profit:
+                tp_hit_idx = idx
+            if sl_hit_idx is None and loss >= stop_loss:
+                sl_hit_idx = idx
+
+            if tp_hit_idx is not None and sl_hit_idx is not None:
+                break
+
+        if tp_hit_idx is not None and sl_hit_idx is not None:
+            outcomes.append('take_profit' if tp_hit_idx < sl_hit_idx else 'stop_loss')
+        elif tp_hit_idx is not None:
+            outcomes.append('take_profit')
+        elif sl_hit_idx is not None:
+            outcomes.append('stop_loss')
+        else:
+            outcomes.append('ninguno')
+
+    return outcomes
+
+
+def serie_aleatoria(n, semilla, proporcion_nan=0.0):
+    rng = np.random.RandomState(semilla)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    highs = closes * (1 + rng.uniform(0, 0.02, n))
+    lows = closes * (1 - rng.uniform(0, 0.02, n))
+    if proporcion_nan:
+        for valores in (closes, highs, lows):
+            valores[rng.rand(n) < proporcion_nan] = np.nan
+    return closes, highs, lows
+
+
+@pytest.mark.parametrize('horizon', [0, 1, 2, 7, 24, 300])
+@pytest.mark.parametrize('proporcion_nan', [0.0, 0.05])
+@pytest.mark.parametrize('semilla', [0, 1, 2])
+def test_calcular_barreras_igual_que_bucle(horizon, proporcion_nan, semilla):
+    closes, highs, lows = serie_aleatoria(500, semilla, proporcion_nan)
+
+    codigos, desplazamientos, retornos = calcular_barreras(closes, highs, lows, horizon=horizon,
+                                                           take_profit=1.5, stop_loss=1)
+
+    esperado = etiquetas_bucle(closes, highs, lows, horizon, 1.5, 1)
+    obtenido = np.array(['stop_loss', 'ninguno', 'take_profit'], dtype=object)[codigos + 1]
+    assert list(obtenido) == esperado
+    assert ((desplazamientos >= 0) & (desplazamientos <= horizon)).all()
+    assert np.isnan(retornos[desplazamientos == 0]).all()
+
+
+@pytest.mark.parametrize('horizon', [0, 1, 24])
+def test_add_trade_outcome_por_bloques_igual_que_entero(horizon):
+    closes, highs, lows = serie_aleatoria(400, 3, 0.02)
+    df = pd.DataFrame({'close': closes, 'high': highs, 'low': lows})
+
+    entero, col_outcome, col_gain_bool = add_trade_outcome(df.copy(), horizon=horizon, verbose=False)
+    assert list(entero[col_outcome]) == etiquetas_bucle(closes, highs, lows, horizon, 3, 3)
+    assert (entero[col_gain_bool] == (entero[col_outcome] == 'take_profit')).all()
+
+    bloques = [add_trade_outcome(df.iloc[inicio:inicio + 100].reset_index(drop=True), horizon=horizon,
+                                 futuro=df.iloc[inicio + 100:], verbose=False)[0]
+               for inicio in range(0, len(df), 100)]
+    pd.testing.assert_frame_equal(pd.concat(bloques, ignore_index=True), entero)
@@ -0,0 +1,51 @@
+"""
+Compara predict_proba_bosque (bosque plano) con RandomForestClassifier.predict_proba.
+"""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from bosque import aplanar_bosque, predict_proba_bosque, proba_positiva
+
+
+def datos_aleatorios(n, n_features, semilla):
+    rng = np.random.RandomState(semilla)
+    X = rng.normal(size=(n, n_features)).astype(np.float32)
+    y = (X[:, 0] + 0.5 * X[:, 1] + rng.normal(0, 0.5, n) > 0).astype(int)
+    return X, y
+
+
+@pytest.mark.parametrize('n_estimators, max_depth', [(1, None), (10, 3), (25, None)])
+@pytest.mark.parametrize('semilla', [0, 1])
+def test_igual_que_sklearn(n_estimators, max_depth, semilla):
+    X, y = datos_aleatorios(600, 5, semilla)
+    model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=semilla).fit(X, y)
+
+    X_nuevo, _ = datos_aleatorios(300, 5, semilla + 100)
+    esperado = model.predict_proba(X_nuevo)[:, 1]
+    np.testing.assert_allclose(predict_proba_bosque(aplanar_bosque(model), X_nuevo), esperado, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(predict_proba_bosque(aplanar_bosque(model), X_nuevo, tam_bloque=7), esperado,
+                               rtol=0, atol=1e-12)
+
+
+def test_una_fila():
+    X, y = datos_aleatorios(200, 3, 2)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    assert predict_proba_bosque(aplanar_bosque(model), X[0]) == pytest.approx(model.predict_proba(X[:1])[0, 1])
+
+
+@pytest.mark.parametrize('clase, esperado', [(0, 0.0), (1, 1.0)])
+def test_una_sola_clase(clase, esperado):
+    X, _ = datos_aleatorios(100, 3, 3)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, np.full(len(X), clase))
+
+    assert (predict_proba_bosque(aplanar_bosque(model), X) == esperado).all()
+    assert (proba_positiva(model, X) == esperado).all()
+
+
+def test_clases_booleanas():
+    X, y = datos_aleatorios(300, 4, 4)
+    model = RandomForestClassifier(n_estimators=8, random_state=0).fit(X, y.astype(bool))
+    np.testing.assert_allclose(predict_proba_bosque(aplanar_bosque(model), X), model.predict_proba(X)[:, 1],
+                               rtol=0, atol=1e-12)
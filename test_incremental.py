@@ -0,0 +1,42 @@
+"""
+Comprueba que los indicadores incrementales coinciden bit a bit con add_rsi / add_ema /
+add_ema_cross sobre la serie entera, también guardando y recargando el estado entre bloques.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions import add_ema, add_ema_cross, add_rsi
+from incremental import actualizar_indicadores, cargar_estado, crear_estado, guardar_estado
+
+
+def serie_aleatoria(n, semilla):
+    rng = np.random.RandomState(semilla)
+    return pd.DataFrame({'close': 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))})
+
+
+def indicadores_enteros(df, metodo):
+    df = df.copy()
+    df, _ = add_rsi(df, period=14, metodo=metodo, verbose=False)
+    df, _ = add_ema(df, period=12, verbose=False)
+    df, _ = add_ema_cross(df, fast=12, slow=26, verbose=False)
+    return df
+
+
+@pytest.mark.parametrize('metodo', ['sma', 'wilder'])
+@pytest.mark.parametrize('corte', [1, 10, 300])
+def test_dos_bloques_igual_que_entero(metodo, corte, tmp_path):
+    df = serie_aleatoria(600, 0)
+    esperado = indicadores_enteros(df, metodo)
+
+    estado = crear_estado(rsi_metodo=metodo)
+    primero = actualizar_indicadores(df.iloc[:corte], estado)
+
+    ruta = tmp_path / 'estado.json'
+    guardar_estado(estado, ruta)
+    segundo = actualizar_indicadores(df.iloc[corte:], cargar_estado(ruta))
+
+    obtenido = pd.concat([primero, segundo])
+    for col in ['rsi_14', 'ema_12', 'ema_26', 'ema_cross_signal_12_26']:
+        np.testing.assert_array_equal(obtenido[col].to_numpy(), esperado[col].to_numpy(), err_msg=col)
@@ -0,0 +1,44 @@
+"""
+Comprueba que procesar_por_bloques escribe lo mismo que calcular indicadores y etiquetas sobre
+la serie entera en memoria.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from benchmark import generar_ohlcv
+from functions import add_ema, add_ema_cross, add_rsi, add_trade_outcome, read_data
+from por_bloques import procesar_por_bloques
+
+
+@pytest.fixture
+def carpeta_datos(tmp_path, monkeypatch):
+    """Carpeta de trabajo con 'data/SINTETICO.csv' en el formato de read_data."""
+    os.makedirs(tmp_path / 'data')
+    monkeypatch.chdir(tmp_path)
+    df = generar_ohlcv(3000, frecuencia='1h')
+    df['date'] = df['date'].dt.strftime('%Y-%m-%d %H:%M:%S+00:00')
+    df.to_csv('data/SINTETICO.csv', index=False)
+    return tmp_path
+
+
+def serie_entera(metodo, horizon):
+    df = read_data('SINTETICO')
+    df, _ = add_rsi(df, period=14, metodo=metodo, verbose=False)
+    df, _ = add_ema(df, period=12, verbose=False)
+    df, _ = add_ema_cross(df, fast=12, slow=26, verbose=False)
+    df, _, _ = add_trade_outcome(df, horizon=horizon, take_profit=3, stop_loss=3, verbose=False)
+    return df
+
+
+@pytest.mark.parametrize('metodo', ['sma', 'wilder'])
+@pytest.mark.parametrize('tam_bloque, horizon', [(24, 24), (500, 24), (1000, 1), (5000, 24)])
+def test_bloques_igual_que_entero(carpeta_datos, metodo, tam_bloque, horizon):
+    procesar_por_bloques('SINTETICO', tam_bloque=tam_bloque, rsi_metodo=metodo, horizon=horizon, verbose=False)
+
+    obtenido = read_data('SINTETICO_features')
+    esperado = serie_entera(metodo, horizon)
+    esperado['date'] = esperado['date'].astype('datetime64[ns]')  # el almacén guarda las fechas en ns
+    pd.testing.assert_frame_equal(obtenido, esperado, check_exact=True)
@@ -0,0 +1,79 @@
+"""
+Comprueba que el remuestreo por bloques de cleanscripts/cleanBTC.py da las mismas velas que
+remuestrear el CSV de 1 minuto entero, y que anexar los minutos nuevos a un destino ya escrito
+(CSV y almacén) deja lo mismo que rehacerlo desde cero.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from almacen import cargar_almacen
+from cleanscripts.cleanBTC import AGREGACION, leer_1m_por_bloques, remuestrear_1m, remuestrear_bloques
+
+FRECUENCIAS = ['10min', '1h']
+
+
+def escribir_csv_1m(ruta, n_minutos, semilla=0):
+    """CSV de 1 minuto como el de origen (Timestamp en segundos), con algunos minutos sin datos."""
+    rng = np.random.RandomState(semilla)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.001, n_minutos)))
+    df = pd.DataFrame({
+        'Timestamp': 1_600_000_020 + 60 * np.arange(n_minutos),
+        'Open': close * (1 + rng.normal(0, 0.0005, n_minutos)),
+        'High': close * (1 + rng.uniform(0, 0.001, n_minutos)),
+        'Low': close * (1 - rng.uniform(0, 0.001, n_minutos)),
+        'Close': close,
+        'Volume': rng.lognormal(0, 1, n_minutos),
+    })
+    df = df.drop(index=rng.choice(n_minutos, size=n_minutos // 50, replace=False))
+    df.to_csv(ruta, index=False)
+    return df
+
+
+def remuestreo_entero(ruta, frecuencia):
+    minutos = pd.concat(leer_1m_por_bloques(ruta, tam_bloque=10 ** 9), ignore_index=True)
+    velas = minutos.resample(frecuencia, on='date', origin='epoch').agg(AGREGACION).dropna()
+    velas.index = velas.index.tz_localize('UTC')
+    return velas.reset_index()
+
+
+@pytest.mark.parametrize('tam_bloque', [13, 97, 1000])
+def test_bloques_igual_que_entero(tam_bloque, tmp_path):
+    ruta = tmp_path / 'min.csv'
+    escribir_csv_1m(ruta, 3000)
+
+    partes = {frecuencia: [] for frecuencia in FRECUENCIAS}
+    for frecuencia, velas in remuestrear_bloques(leer_1m_por_bloques(ruta, tam_bloque=tam_bloque), FRECUENCIAS):
+        partes[frecuencia].append(velas)
+
+    for frecuencia in FRECUENCIAS:
+        pd.testing.assert_frame_equal(pd.concat(partes[frecuencia], ignore_index=True),
+                                      remuestreo_entero(ruta, frecuencia))
+
+
+@pytest.mark.parametrize('cortes', [[1234], [1234, 2001, 2002]])
+def test_anexar_igual_que_rehacer(cortes, tmp_path, monkeypatch):
+    destinos = {'10min': 'BTC_10min', '1h': 'BTC_1h'}
+    completo = escribir_csv_1m(tmp_path / 'completo.csv', 3000)
+
+    # Desde cero con todos los minutos
+    os.makedirs(tmp_path / 'entero' / 'data')
+    monkeypatch.chdir(tmp_path / 'entero')
+    remuestrear_1m(str(tmp_path / 'completo.csv'), destinos, anexar=False, tam_bloque=500)
+
+    # Por partes: cada corte deja la última vela incompleta y la siguiente ejecución la rehace
+    os.makedirs(tmp_path / 'anexado' / 'data')
+    monkeypatch.chdir(tmp_path / 'anexado')
+    for corte in cortes + [len(completo)]:
+        completo.iloc[:corte].to_csv(tmp_path / 'parcial.csv', index=False)
+        remuestrear_1m(str(tmp_path / 'parcial.csv'), destinos, anexar=True, tam_bloque=500)
+
+    for cambio in destinos.values():
+        with open(tmp_path / 'entero' / 'data' / f'{cambio}.csv') as esperado, \
+             open(tmp_path / 'anexado' / 'data' / f'{cambio}.csv') as obtenido:
+            assert obtenido.read() == esperado.read()
+        pd.testing.assert_frame_equal(cargar_almacen(cambio, carpeta=str(tmp_path / 'anexado' / 'data')),
+                                      cargar_almacen(cambio, carpeta=str(tmp_path / 'entero' / 'data')))
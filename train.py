@@ -1,23 +1,19 @@
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+import numpy as np
 import pandas as pd
 
-def clean_train(df, test_size=0.2, random_state=42):
-    """
-    Limpia y prepara los datos para entrenamiento y test.
+from instrumentacion import log
 
-    Args:
-        df (pd.DataFrame): DataFrame original con features y target.
-        test_size (float): Proporción para test.
-        random_state (int): Semilla reproducible.
+def columnas_modelo(df):
+    """
+    Detecta la columna target binaria y las features numéricas válidas (sin columnas futuras).
 
     Returns:
-        X_train, X_test, y_train, y_test: Arrays de entrenamiento y prueba.
         feature_cols (list): Lista de columnas usadas como features.
         target_col (str): Nombre de la columna target binaria.
     """
-    # Detectar columna target (igual que antes)
     target_cols = [col for col in df.columns if col.startswith('result_gain_') and col.endswith('_bool')]
     if not target_cols:
         raise ValueError("No se encontró columna target binaria con formato esperado.")
@@ -29,40 +25,121 @@ def clean_train(df, test_size=0.2, random_state=42):
         if not col.startswith('result_') and col != target_col
     ]
 
-    X = df[feature_cols].fillna(0)
-    y = df[target_col].astype(int)
+    return feature_cols, target_col
+
+def matriz_features(df, feature_cols, filas=None, dtype=np.float32, salida=None):
+    """
+    Construye la matriz de features columna a columna, sin copiar el DataFrame entero en float64.
+
+    Args:
+        df (pd.DataFrame): DataFrame con las features.
+        feature_cols (list): Columnas a incluir, en orden.
+        filas (np.ndarray): Posiciones de las filas a incluir y su orden (por defecto, todas).
+        dtype: Tipo de la matriz (float32, el que usan internamente los árboles de sklearn).
+        salida (np.ndarray): Matriz ya reservada donde escribir (ej. un memmap).
+
+    Returns:
+        np.ndarray: Matriz C-contigua de forma (filas, features) con los NaN a 0, como fillna(0).
+    """
+    n_filas = len(df) if filas is None else len(filas)
+    if salida is None:
+        salida = np.empty((n_filas, len(feature_cols)), dtype=dtype)
 
-    # Split train/test
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=random_state, stratify=y
+    for j, col in enumerate(feature_cols):
+        valores = df[col].to_numpy()
+        columna = salida[:, j]
+        columna[:] = valores if filas is None else valores[filas]
+        columna[np.isnan(columna)] = 0
+
+    return salida
+
+def clean_train(df, test_size=0.2, random_state=42, balanced=False):
+    """
+    Limpia y prepara los datos para entrenamiento y test.
+
+    El balanceo y el split se hacen sobre arrays de posiciones; la matriz de features se crea una
+    sola vez en float32 con las filas de train seguidas de las de test, y X_train y X_test son
+    vistas de esa matriz.
+
+    Args:
+        df (pd.DataFrame): DataFrame original con features y target.
+        test_size (float): Proporción para test.
+        random_state (int): Semilla reproducible.
+        balanced (bool): Si True, submuestrea la clase mayoritaria antes del split (ver
+                         indices_balanceados, sin copiar el DataFrame).
+
+    Returns:
+        X_train, X_test (pd.DataFrame), y_train, y_test (pd.Series): Datos de entrenamiento y
+            prueba, con el índice de df.
+        feature_cols (list): Lista de columnas usadas como features.
+        target_col (str): Nombre de la columna target binaria.
+    """
+    feature_cols, target_col = columnas_modelo(df)
+
+    y = df[target_col].to_numpy(dtype=np.int64)
+    filas = indices_balanceados(y, random_state=random_state) if balanced else np.arange(len(y))
+
+    # Split train/test de las posiciones (mismo reparto que si se pasaran X e y)
+    posiciones_train, posiciones_test = train_test_split(
+        np.arange(len(filas)), test_size=test_size, random_state=random_state, stratify=y[filas]
     )
+    orden = np.concatenate([filas[posiciones_train], filas[posiciones_test]])
+    n_train = len(posiciones_train)
+
+    matriz = matriz_features(df, feature_cols, filas=orden)
+    X = pd.DataFrame(matriz, columns=feature_cols, index=df.index[orden], copy=False)
+    y = pd.Series(y[orden], index=X.index, name=target_col)
+    X_train, X_test = X.iloc[:n_train], X.iloc[n_train:]
+    y_train, y_test = y.iloc[:n_train], y.iloc[n_train:]
 
     return X_train, X_test, y_train, y_test, feature_cols, target_col
 
 
 def balanced_methods(df, method='undersample', random_state=42):
-    import numpy as np
-    np.random.seed(random_state)
+    """
+    Devuelve una copia balanceada del DataFrame (se mantiene por compatibilidad).
 
-    target_cols = [col for col in df.columns if col.startswith('result_gain_') and col.endswith('_bool')]
-    if not target_cols:
-        raise ValueError("No se encontró columna target binaria con formato esperado.")
-    target_col = target_cols[0]
+    Para entrenar es preferible clean_train(df, balanced=True), que balancea por índices sin
+    copiar el DataFrame; aquí se copian las mismas filas de indices_balanceados.
+
+    Args:
+        df (pd.DataFrame): DataFrame con features y target.
+        method (str): Solo 'undersample'.
+        random_state (int): Semilla reproducible.
 
-    if method == 'undersample':
-        df_majority = df[df[target_col] == 0]
-        df_minority = df[df[target_col] == 1]
+    Returns:
+        tuple: (DataFrame balanceado y barajado, nombre de la columna target)
+    """
+    if method != 'undersample':
+        raise NotImplementedError(f"Método '{method}' no implementado todavía.")
 
-        n_minority = len(df_minority)
-        df_majority_downsampled = df_majority.sample(n=n_minority, random_state=random_state)
+    _, target_col = columnas_modelo(df)
+    filas = indices_balanceados(df[target_col].to_numpy(dtype=np.int64), random_state=random_state)
+    return df.iloc[filas].reset_index(drop=True), target_col
 
-        df_balanced = pd.concat([df_majority_downsampled, df_minority])
-        df_balanced = df_balanced.sample(frac=1, random_state=random_state).reset_index(drop=True)
 
-        return df_balanced, target_col
+def indices_balanceados(y, random_state=42):
+    """
+    Índices posicionales de un submuestreo balanceado, sin copiar el DataFrame.
 
-    else:
-        raise NotImplementedError(f"Método '{method}' no implementado todavía.")
+    Submuestrea la clase mayoritaria (0) hasta el tamaño de la minoritaria (1) y baraja las
+    filas elegidas, con las mismas llamadas que DataFrame.sample.
+
+    Args:
+        y (np.ndarray): Target binario (0/1 o bool).
+        random_state (int): Semilla reproducible.
+
+    Returns:
+        np.ndarray: Posiciones de las filas balanceadas, en el orden barajado.
+    """
+    y = np.asarray(y)
+    mayoritaria = np.flatnonzero(y == 0)
+    minoritaria = np.flatnonzero(y == 1)
+
+    # Mismas llamadas que DataFrame.sample con random_state
+    elegidas = mayoritaria[np.random.RandomState(random_state).choice(len(mayoritaria), size=len(minoritaria), replace=False)]
+    indices = np.concatenate([elegidas, minoritaria])
+    return indices[np.random.RandomState(random_state).choice(len(indices), size=len(indices), replace=False)]
 
 
 def execute_random_forest(df, n_estimators=100, random_state=42, balanced = False):
@@ -72,12 +149,15 @@ def execute_random_forest(df, n_estimators=100, random_state=42, balanced = Fals
     Args:
         df (pd.DataFrame): DataFrame con features y target.
         n_estimators (int): Número de árboles en el bosque.
-        random_state (int): Semilla para reproducibilidad.
+        random_state (int): Semilla del RandomForest (el split y el balanceo usan la de clean_train).
+        balanced (bool): Si True, balancea las clases por índices (ver clean_train).
 
     Returns:
         None
     """
-    X_train, X_test, y_train, y_test, feature_cols, target_col = clean_train(df)
+    # El split y el balanceo usan la semilla fija de clean_train, como siempre; random_state
+    # solo afecta al bosque
+    X_train, X_test, y_train, y_test, feature_cols, target_col = clean_train(df, balanced=balanced)
 
     clf = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state)
     clf.fit(X_train, y_train)
@@ -89,14 +169,14 @@ def execute_random_forest(df, n_estimators=100, random_state=42, balanced = Fals
     rec = recall_score(y_test, y_pred, zero_division=0)
     f1 = f1_score(y_test, y_pred, zero_division=0)
 
-    print(f"✅ RandomForest entrenado con {n_estimators} árboles.")
-    print(f"Features usadas: {feature_cols}")
-    print(f"Target: {target_col}")
-    print(f"Tamaño train: {len(X_train)}, test: {len(X_test)}")
-    print("Resultados en test:")
-    print(f"  Accuracy : {acc:.4f}")
-    print(f"  Precision: {prec:.4f}")
-    print(f"  Recall   : {rec:.4f}")
-    print(f"  F1-score : {f1:.4f}")
+    log(f"✅ RandomForest entrenado con {n_estimators} árboles.")
+    log(f"Features usadas: {feature_cols}")
+    log(f"Target: {target_col}")
+    log(f"Tamaño train: {len(X_train)}, test: {len(X_test)}")
+    log("Resultados en test:")
+    log(f"  Accuracy : {acc:.4f}")
+    log(f"  Precision: {prec:.4f}")
+    log(f"  Recall   : {rec:.4f}")
+    log(f"  F1-score : {f1:.4f}")
 
     return clf, feature_cols, target_col
\ No newline at end of file
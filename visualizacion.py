@@ -1,46 +1,153 @@
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
+import numpy as np
 import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
-def graficar(df, columnas, last_n=1000, juntas=True):
-    import matplotlib.pyplot as plt
-    import matplotlib.ticker as ticker
-    import pandas as pd
+# Colores de las salidas de las operaciones (exit_reason del ledger del backtesting)
+COLORES_SALIDA = {'TP': 'tab:green', 'SL': 'tab:red', 'End': 'tab:gray'}
 
-    plt.close('all')
-    plt.style.use('default')
+def preparar_datos(df, columnas, last_n=1000):
+    """
+    Últimas last_n filas de 'date' y columnas, ordenadas por fecha, sin copiar el DataFrame entero.
 
-    # Convertir 'date' a datetime, ignorar errores para no romper
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    Solo se convierte 'date' si no es ya datetime64, solo se eliminan NaT si los hay y solo se
+    ordena si no está ya ordenado.
+    """
+    fechas = df['date']
+    if not pd.api.types.is_datetime64_any_dtype(fechas):
+        # Convertir 'date' a datetime, ignorar errores para no romper
+        fechas = pd.to_datetime(fechas, errors='coerce')
+
+    datos = pd.DataFrame({'date': fechas, **{col: df[col] for col in columnas}}, copy=False)
 
     # Eliminar filas con fecha NaT
-    df = df.dropna(subset=['date'])
+    if datos['date'].isna().any():
+        datos = datos.dropna(subset=['date'])
 
-    # Ordenar por fecha y resetear índice
-    df = df.sort_values('date').reset_index(drop=True)
+    # Ordenar por fecha
+    if not datos['date'].is_monotonic_increasing:
+        datos = datos.sort_values('date', kind='stable')
 
     # Tomar últimas last_n filas
-    data = df[['date'] + columnas].tail(last_n).copy()
-    data.set_index('date', inplace=True)
+    return datos.iloc[-last_n:].set_index('date') if last_n else datos.set_index('date')
+
+def reducir_puntos(valores, n_cubos):
+    """
+    Posiciones de los puntos a dibujar para conservar la forma de la serie.
+
+    Divide la serie en n_cubos tramos consecutivos (uno por píxel de ancho) y en cada uno se
+    queda con el primer punto, el mínimo, el máximo y el último, así que los picos no se pierden
+    aunque se dibujen muchos menos puntos.
+
+    Args:
+        valores (np.ndarray): Serie a dibujar (puede tener NaN).
+        n_cubos (int): Número de tramos.
+
+    Returns:
+        np.ndarray: Posiciones ordenadas (todas si la serie tiene menos de 4 puntos por tramo).
+    """
+    valores = np.asarray(valores, dtype=float)
+    n = len(valores)
+    if n <= 4 * n_cubos:
+        return np.arange(n)
+
+    tam = -(-n // n_cubos)
+    n_cubos = -(-n // tam)
+    relleno = np.full(n_cubos * tam, np.nan)
+    relleno[:n] = valores
+    cubos = relleno.reshape(n_cubos, tam)
+
+    inicio = np.arange(n_cubos) * tam
+    minimos = inicio + np.argmin(np.where(np.isnan(cubos), np.inf, cubos), axis=1)
+    maximos = inicio + np.argmax(np.where(np.isnan(cubos), -np.inf, cubos), axis=1)
+    ultimos = np.minimum(inicio + tam - 1, n - 1)
+
+    return np.unique(np.concatenate([inicio, minimos, maximos, ultimos]))
+
+def crear_figura(n_ejes, figsize, ruta):
+    # Con ruta se dibuja sin pyplot (sin ventana ni backend gráfico), solo en el canvas Agg
+    if ruta is not None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        axs = fig.subplots(n_ejes, 1, sharex=True, squeeze=False)[:, 0]
+    else:
+        plt.close('all')
+        plt.style.use('default')
+        fig, axs = plt.subplots(n_ejes, 1, figsize=figsize, sharex=True, squeeze=False)
+        axs = axs[:, 0]
+    return fig, list(axs)
+
+def dibujar_serie(ax, serie, n_cubos, **kwargs):
+    if n_cubos:
+        posiciones = reducir_puntos(serie.to_numpy(dtype=float), n_cubos)
+        serie = serie.iloc[posiciones]
+    ax.plot(serie.index, serie.to_numpy(), **kwargs)
+
+def dibujar_operaciones(ax, operaciones, desde, hasta, escala=None):
+    """
+    Marca las entradas (triángulo hacia arriba) y salidas (hacia abajo, color según exit_reason)
+    del ledger de backtesting(return_ledger=True) dentro del rango de fechas dibujado.
+    """
+    if escala is None:
+        escala = lambda precios: precios
+
+    entradas = operaciones[(operaciones['entry_date'] >= desde) & (operaciones['entry_date'] <= hasta)]
+    ax.scatter(entradas['entry_date'], escala(entradas['entry_price']), marker='^', color='tab:blue',
+               s=30, zorder=3, label='entrada')
+
+    salidas = operaciones[(operaciones['exit_date'] >= desde) & (operaciones['exit_date'] <= hasta)]
+    for razon, grupo in salidas.groupby('exit_reason'):
+        ax.scatter(grupo['exit_date'], escala(grupo['exit_price']), marker='v', s=30, zorder=3,
+                   color=COLORES_SALIDA.get(razon, 'black'), label=f'salida {razon}')
+
+def graficar(df, columnas, last_n=1000, juntas=True, reducir=True, operaciones=None, columna_operaciones=None,
+             ruta=None, figsize=None, dpi=100):
+    """
+    Dibuja columnas frente a 'date'.
+
+    Args:
+        df (pd.DataFrame): Datos con columna 'date'.
+        columnas (list): Columnas a dibujar.
+        last_n (int): Últimas filas a dibujar (None para todas).
+        juntas (bool): Si True, todas en un eje escaladas a [0-1]; si False, un eje por columna.
+        reducir (bool): Si True, dibuja como mucho 4 puntos por píxel de ancho (ver reducir_puntos).
+        operaciones (pd.DataFrame): Ledger de backtesting(return_ledger=True) para marcar entradas y salidas.
+        columna_operaciones (str): Columna de precio sobre la que se marcan las operaciones
+                                   (por defecto 'open' si se dibuja, o la primera).
+        ruta (str): Si se indica, guarda la imagen en ese fichero sin abrir ventana; si no, plt.show().
+        figsize (tuple): Tamaño de la figura en pulgadas.
+        dpi (int): Puntos por pulgada (el ancho en píxeles fija el número de tramos al reducir).
+    """
+    data = preparar_datos(df, columnas, last_n)
 
     max_xticks = 20
     max_yticks = 20
 
+    n_ejes = 1 if juntas else len(columnas)
+    figsize = figsize or ((12, 6) if juntas else (12, 3.5 * n_ejes))
+    fig, axs = crear_figura(n_ejes, figsize, ruta)
+    n_cubos = int(figsize[0] * dpi) if reducir else None
+
+    if columna_operaciones is None:
+        columna_operaciones = 'open' if 'open' in columnas else columnas[0]
+    hay_operaciones = operaciones is not None and len(operaciones) and len(data)
+
     if juntas:
-        scaled = data.copy()
+        ax = axs[0]
         for col in columnas:
-            min_val = scaled[col].min()
-            max_val = scaled[col].max()
+            min_val = data[col].min()
+            max_val = data[col].max()
             if max_val != min_val:
-                scaled[col] = (scaled[col] - min_val) / (max_val - min_val)
+                escala = lambda valores, min_val=min_val, max_val=max_val: (valores - min_val) / (max_val - min_val)
             else:
-                scaled[col] = 0.5  # Si no varía, poner constante para que se vea
-
-        fig, ax = plt.subplots(figsize=(12, 6))
-        for col in columnas:
-            ax.plot(scaled.index, scaled[col], label=col)
+                escala = lambda valores: valores * 0 + 0.5  # Si no varía, poner constante para que se vea
+            dibujar_serie(ax, escala(data[col]), n_cubos, label=col)
+            if hay_operaciones and col == columna_operaciones:
+                dibujar_operaciones(ax, operaciones, data.index[0], data.index[-1], escala)
 
-        ax.set_title(f'Últimas {last_n} filas de {", ".join(columnas)} (escaladas)')
+        ax.set_title(f'Últimas {len(data)} filas de {", ".join(columnas)} (escaladas)')
         ax.set_xlabel('Fecha')
         ax.set_ylabel('Valor normalizado [0-1]')
         ax.legend()
@@ -49,27 +156,25 @@ def graficar(df, columnas, last_n=1000, juntas=True):
         ax.xaxis.set_major_locator(ticker.MaxNLocator(nbins=max_xticks))
         ax.yaxis.set_major_locator(ticker.MaxNLocator(nbins=max_yticks))
 
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
-
     else:
-        n = len(columnas)
-        fig, axs = plt.subplots(n, 1, figsize=(12, 3.5 * n), sharex=True)
-        if n == 1:
-            axs = [axs]
-
-        for i, col in enumerate(columnas):
-            axs[i].plot(data.index, data[col], label=col)
-            axs[i].set_title(f'{col} - Últimas {last_n} filas')
-            axs[i].set_ylabel('Valor')
-            axs[i].grid(True)
-            axs[i].legend()
-            axs[i].yaxis.set_major_locator(ticker.MaxNLocator(nbins=max_yticks))
+        for ax, col in zip(axs, columnas):
+            dibujar_serie(ax, data[col], n_cubos, label=col)
+            if hay_operaciones and col == columna_operaciones:
+                dibujar_operaciones(ax, operaciones, data.index[0], data.index[-1])
+            ax.set_title(f'{col} - Últimas {len(data)} filas')
+            ax.set_ylabel('Valor')
+            ax.grid(True)
+            ax.legend()
+            ax.yaxis.set_major_locator(ticker.MaxNLocator(nbins=max_yticks))
 
         axs[-1].set_xlabel('Fecha')
         axs[-1].xaxis.set_major_locator(ticker.MaxNLocator(nbins=max_xticks))
-        plt.xticks(rotation=45)
 
-        plt.tight_layout()
+    axs[-1].tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+    if ruta is not None:
+        fig.savefig(ruta, dpi=dpi)
+    else:
         plt.show()
+    return fig
@@ -0,0 +1,175 @@
+"""
+Validación walk-forward con purga: cada fold entrena solo con velas anteriores al bloque de test
+y elimina las 'embargo' velas previas al test, cuyas etiquetas miran dentro de él.
+
+Los folds se ejecutan en paralelo; la matriz de features y los precios se guardan una vez como
+.npy y cada proceso los abre con mmap en lugar de recibir DataFrames serializados.
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+
+from backtesting import backtesting
+from inferencia import predict_from_model
+from instrumentacion import log
+from train import columnas_modelo, indices_balanceados, matriz_features
+
+COLUMNAS_PRECIO = ['open', 'high', 'low', 'close']
+
+def generar_folds(n, n_folds=5, modo='expanding', tam_train=None, embargo=24):
+    """
+    Genera las ventanas de entrenamiento y test.
+
+    Las n velas se dividen en n_folds + 1 bloques; el fold k usa como test el bloque k + 1.
+
+    Args:
+        n (int): Número de velas.
+        n_folds (int): Número de folds.
+        modo (str): 'expanding' (train desde el inicio) o 'rolling' (train de tamaño fijo).
+        tam_train (int): Velas de train en modo 'rolling' (por defecto, un bloque).
+        embargo (int): Velas eliminadas al final del train (usar el horizon de las etiquetas).
+
+    Returns:
+        list[tuple]: (train_inicio, train_fin, test_inicio, test_fin) por fold, intervalos [inicio, fin).
+    """
+    if modo not in ('expanding', 'rolling'):
+        raise ValueError(f"Modo '{modo}' no válido. Usa 'expanding' o 'rolling'.")
+
+    bloque = n // (n_folds + 1)
+    if bloque <= embargo:
+        raise ValueError(f"Bloques de {bloque} velas demasiado pequeños para un embargo de {embargo}.")
+    tam_train = tam_train or bloque
+
+    folds = []
+    for k in range(n_folds):
+        test_inicio = (k + 1) * bloque
+        test_fin = n if k == n_folds - 1 else test_inicio + bloque
+        train_fin = test_inicio - embargo
+        train_inicio = 0 if modo == 'expanding' else max(0, train_fin - tam_train)
+        folds.append((train_inicio, train_fin, test_inicio, test_fin))
+
+    return folds
+
+def guardar_matrices(df, feature_cols, target_col, carpeta):
+    """Guarda features (float32), target, precios y fechas como .npy y devuelve sus rutas."""
+    rutas = {}
+
+    X = np.lib.format.open_memmap(os.path.join(carpeta, 'X.npy'), mode='w+', dtype=np.float32,
+                                  shape=(len(df), len(feature_cols)))
+    matriz_features(df, feature_cols, salida=X)
+    X.flush()
+    rutas['X'] = X.filename
+    del X
+
+    columnas = {
+        'y': df[target_col].to_numpy(dtype=np.int8),
+        'date': pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]'),
+    }
+    for col in COLUMNAS_PRECIO:
+        columnas[col] = df[col].to_numpy(dtype=float)
+
+    for nombre, valores in columnas.items():
+        rutas[nombre] = os.path.join(carpeta, f'{nombre}.npy')
+        np.save(rutas[nombre], valores)
+
+    return rutas
+
+def ejecutar_fold(rutas, fold, feature_cols, estimador, params):
+    """Entrena, predice y hace backtesting de un fold leyendo las matrices con mmap."""
+    datos = {nombre: np.load(ruta, mmap_mode='r') for nombre, ruta in rutas.items()}
+    train_inicio, train_fin, test_inicio, test_fin = fold
+
+    y_train = np.asarray(datos['y'][train_inicio:train_fin])
+    if params['balanced']:
+        indices = train_inicio + indices_balanceados(y_train, random_state=params['random_state'])
+    else:
+        indices = np.arange(train_inicio, train_fin)
+
+    modelo = clone(estimador)
+    modelo.fit(pd.DataFrame(datos['X'][indices], columns=feature_cols), datos['y'][indices])
+
+    df_test = pd.DataFrame(np.asarray(datos['X'][test_inicio:test_fin]), columns=feature_cols)
+    df_test['date'] = datos['date'][test_inicio:test_fin]
+    for col in COLUMNAS_PRECIO:
+        df_test[col] = datos[col][test_inicio:test_fin]  # precios en float64 para el backtesting
+
+    pred = predict_from_model(df_test, modelo, feature_cols, threshold=params['threshold'], return_probs=True)
+    y_test = np.asarray(datos['y'][test_inicio:test_fin])
+    y_pred = pred['model_pred'].to_numpy()
+
+    back = backtesting(pred, capital_inicial=params['capital_inicial'],
+                       take_profit=params['take_profit'], stop_loss=params['stop_loss'])
+    razones = back['exit_reason'].value_counts()
+
+    return {
+        'fold': fold,
+        'train_inicio': pd.Timestamp(datos['date'][train_inicio]),
+        'test_inicio': pd.Timestamp(datos['date'][test_inicio]),
+        'test_fin': pd.Timestamp(datos['date'][test_fin - 1]),
+        'filas_train': len(indices),
+        'filas_test': test_fin - test_inicio,
+        'accuracy': accuracy_score(y_test, y_pred),
+        'precision': precision_score(y_test, y_pred, zero_division=0),
+        'recall': recall_score(y_test, y_pred, zero_division=0),
+        'f1': f1_score(y_test, y_pred, zero_division=0),
+        'capital_final': float(back['disponible'].iloc[-1]),
+        'TP': int(razones.get('TP', 0)),
+        'SL': int(razones.get('SL', 0)),
+        'End': int(razones.get('End', 0)),
+    }
+
+def walk_forward(df, n_folds=5, modo='expanding', tam_train=None, embargo=24, estimador=None,
+                 balanced=True, threshold=0.5, capital_inicial=100, take_profit=3, stop_loss=1,
+                 random_state=42, n_jobs=None, verbose=True):
+    """
+    Evalúa un estimador con validación walk-forward y backtesting por fold.
+
+    Args:
+        df (pd.DataFrame): Velas ordenadas con features, precios y la columna target
+                           'result_gain_..._bool' (add_trade_outcome).
+        n_folds, modo, tam_train, embargo: Ver generar_folds. El embargo debe ser el horizon.
+        estimador: Estimador de sklearn sin entrenar (por defecto el RandomForest de
+                   execute_random_forest). Se clona en cada fold.
+        balanced (bool): Si True, submuestrea la clase mayoritaria del train de cada fold.
+        threshold (float): Umbral de probabilidad de predict_from_model.
+        capital_inicial, take_profit, stop_loss: Parámetros de backtesting.
+        random_state (int): Semilla del balanceo.
+        n_jobs (int): Procesos en paralelo (por defecto, uno por fold hasta el número de núcleos).
+        verbose (bool): Si True, imprime el resumen.
+
+    Returns:
+        pd.DataFrame: Una fila de métricas por fold.
+    """
+    df = df.sort_values('date').reset_index(drop=True)
+    feature_cols, target_col = columnas_modelo(df)
+    estimador = estimador if estimador is not None else RandomForestClassifier(n_estimators=100, random_state=42)
+
+    folds = generar_folds(len(df), n_folds=n_folds, modo=modo, tam_train=tam_train, embargo=embargo)
+    params = {'balanced': balanced, 'threshold': threshold, 'capital_inicial': capital_inicial,
+              'take_profit': take_profit, 'stop_loss': stop_loss, 'random_state': random_state}
+    n_jobs = n_jobs or min(len(folds), os.cpu_count() or 1)
+
+    with tempfile.TemporaryDirectory(prefix='walk_forward_') as carpeta:
+        rutas = guardar_matrices(df, feature_cols, target_col, carpeta)
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futuros = [pool.submit(ejecutar_fold, rutas, fold, feature_cols, estimador, params) for fold in folds]
+            resultados = [futuro.result() for futuro in futuros]
+
+    resultados = pd.DataFrame(resultados)
+
+    if verbose:
+        log(f"✅ Walk-forward ({modo}, {n_folds} folds, embargo {embargo} velas) sobre '{target_col}':")
+        for _, fila in resultados.iterrows():
+            log(f"   {fila['test_inicio'].date()} → {fila['test_fin'].date()}  "
+                f"F1 {fila['f1']:.4f}  Precision {fila['precision']:.4f}  Capital final {fila['capital_final']:.2f}")
+        log(f"   Media: F1 {resultados['f1'].mean():.4f}  Precision {resultados['precision'].mean():.4f}  "
+            f"Capital final {resultados['capital_final'].mean():.2f}")
+
+    return resultados